@@ -0,0 +1,525 @@
+"""
+Edge pipeline benchmark: runs the serial edge loop (same FrameProcessor / ZoneMap /
+render / AsyncPublisher code as main.py) on recorded clips or on synthetic frames, with
+each selected detector backend (hand: HandLandmarker, yolo: YOLO ONNX via cv2.dnn), real
+model or deterministic stub, and reports FPS plus per-stage latency (p50 / p95 / p99 + a
+fixed-bucket histogram) as JSON. With several detectors, every one runs on the same clips
+and the report also holds their per-frame agreement with the first one (zone states,
+subject count, point distance); there are no labels, so the first detector is the reference.
+
+No camera, display or AWS needed: overlays are rendered but not shown, and publishing
+goes to the in-process LocalBroker.
+
+Run:
+    python bench.py                                   # synthetic 1280x720, stub landmarker
+    python bench.py clips/*.mp4 --landmarker model    # recorded clips, real model
+    python bench.py --motion-gate --keyframe-every 5 --out bench_tracking.json
+    python bench.py --compare bench_results.json      # compare with an earlier run
+    python bench.py clips/*.mp4 --detector hand yolo  # both backends on the same clips
+    python bench.py --detector yolo --streams 4       # 4 cameras, one batched forward pass per round
+    python bench.py --detector yolo --tiles 2x2       # one 1080p frame as 4 tiles in one batch
+
+Stages:
+    capture      source.read (decode, or synthetic frame generation)
+    motion_gate  MotionGate.should_infer            (only with --motion-gate)
+    tracking     PalmTracker track / reset          (only with --keyframe-every)
+    preprocess   hand: resize + BGR->RGB + mp.Image; yolo: letterbox (per tile) into one NCHW blob
+    inference    hand: detect_for_video + palm points; yolo: one net.forward + decode + NMS
+    zones        ZoneMap.occupancy + ZoneDebouncer.update (unless --no-debounce) + ON zones
+    heatmap      HeatmapAccumulator.add (only with --heatmap; one export is timed at the end)
+    overlay      render_display (resize + mirror + draw), without imshow
+    publish      AsyncPublisher.submit (the actual send runs on the publisher thread)
+    total        one whole loop iteration (with --streams N: one frame of every stream)
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+import main as edge
+from detectors import HandDetector, YoloPersonDetector, YOLO_NUM_CLASSES, PERSON_CLASS, parse_tiles
+from framebuf import FrameBuffers
+from local_broker import LocalBroker
+from motion import MotionGate
+from pipeline import StageTimer
+from publisher import AsyncPublisher, WIRE_CODES, WIRE_FRAME
+from sources import expand_source_paths, open_replay_source
+from tracker import PalmTracker, TrackingEval
+from zones import load_zone_map
+
+BENCH_OUTPUT_PATH = "./bench_results.json"
+DEFAULT_FRAMES = 300
+DEFAULT_WARMUP = 20
+SYNTHETIC_SIZE = "1280x720"
+SYNTHETIC_FPS = 30.0
+STAGES = ["capture", "motion_gate", "tracking", "preprocess", "inference", "zones", "heatmap", "overlay", "publish"]
+# 固定的直方圖邊界（毫秒，對數間距），不同次的結果才能直接比較
+HIST_EDGES_MS = [0.0, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf")]
+
+
+class StubLandmarker:
+    """
+    Deterministic stand-in for HandLandmarker: `num_hands` hands moving on fixed Lissajous
+    paths as a function of the timestamp, so every run (and every commit) sees the same
+    detections. latency_ms optionally emulates model cost with a sleep.
+    """
+
+    def __init__(self, num_hands: int = 2, latency_ms: float = 0.0):
+        self.num_hands = num_hands
+        self.latency_ms = latency_ms
+
+    def detect_for_video(self, mp_image, ts_ms: int):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        t = ts_ms / 1000.0
+        hands = []
+        for k in range(self.num_hands):
+            # 第二隻手每隔幾秒離開畫面一次，讓 ON/OFF 轉換與「沒有手」的情況都出現
+            if k > 0 and int(t / 3.0) % 3 == 2:
+                continue
+            cx = 0.5 + 0.4 * np.sin(0.9 * t + k * 2.1)
+            cy = 0.5 + 0.4 * np.cos(0.6 * t + k * 1.3)
+            hands.append([SimpleNamespace(x=cx + 0.02 * np.cos(i), y=cy + 0.02 * np.sin(i)) for i in range(21)])
+        return SimpleNamespace(hand_landmarks=hands)
+
+    def close(self):
+        pass
+
+
+class StubYoloNet:
+    """
+    Deterministic stand-in for the cv2.dnn YOLOv8 net: every bright blob (all channels > 0.9,
+    e.g. SyntheticSource's moving block) in each blob image becomes a "person" box, plus a weaker
+    duplicate (for NMS) and a non-person box (for the class filter), in the raw (N, 84, A) output
+    layout, so letterbox / tiling / decode / NMS run exactly as with the real model.
+    latency_ms emulates the cost of one forward pass.
+    """
+
+    ANCHORS = 64
+    MIN_AREA = 64           # 輸入解析度下的最小面積（像素），濾掉雜訊背景裡零星的亮點
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.blob = None
+
+    def setInput(self, blob):
+        self.blob = blob
+
+    def forward(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        n = len(self.blob)
+        out = np.zeros((n, 4 + YOLO_NUM_CLASSES, self.ANCHORS), dtype=np.float32)
+        for k in range(n):
+            bright = (self.blob[k].min(axis=0) > 0.9).astype(np.uint8)
+            count, _, stats, _ = cv2.connectedComponentsWithStats(bright)
+            a = 0
+            for x, y, w, h, area in stats[1:count]:
+                if area < self.MIN_AREA or a + 3 > self.ANCHORS:
+                    continue
+                box = [x + w / 2, y + h / 2, w, h]
+                out[k, :4, a] = box
+                out[k, 4 + PERSON_CLASS, a] = 0.9
+                out[k, :4, a + 1] = [box[0] + 1, box[1] + 1, w, h]
+                out[k, 4 + PERSON_CLASS, a + 1] = 0.6
+                out[k, :4, a + 2] = box
+                out[k, 4 + 5, a + 2] = 0.9
+                a += 3
+        return out
+
+
+class SyntheticSource:
+    """Generated frames (noise background + a moving bright block), timestamps = index / fps."""
+
+    live = False
+
+    def __init__(self, width: int, height: int, frames: int, fps: float = SYNTHETIC_FPS):
+        self.name = f"synthetic:{width}x{height}"
+        self.fps = fps
+        self.frames = frames
+        self.index = 0
+        rng = np.random.default_rng(0)
+        self.background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+    def read(self, out=None):
+        if self.index >= self.frames:
+            return False, None, self.index / self.fps
+        h, w = self.background.shape[:2]
+        if out is None or out.shape != self.background.shape:
+            out = np.empty_like(self.background)
+        np.copyto(out, self.background)
+        x = int((self.index * 8) % max(1, w - 80))
+        out[h // 3:h // 3 + 80, x:x + 80] = 255
+        t = self.index / self.fps
+        self.index += 1
+        return True, out, t
+
+    def release(self):
+        pass
+
+
+def open_bench_sources(args):
+    if args.sources:
+        return [open_replay_source(p, args.replay_fps) for p in expand_source_paths(args.sources)]
+    w, h = (int(v) for v in args.synthetic.lower().split("x"))
+    return [SyntheticSource(w, h, args.warmup + args.frames)]
+
+
+def summarize(samples) -> dict:
+    """Latency summary (ms) and histogram of one stage."""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    counts, _ = np.histogram(ms, bins=HIST_EDGES_MS)
+    return {
+        "count": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "max_ms": round(float(ms.max()), 4),
+        "histogram": counts.tolist(),
+    }
+
+
+def bench_source(processors, sources, zone_map, publishers, args, record=None) -> dict:
+    """
+    Runs the serial edge loop on one source (or, with several, on all of them in lockstep,
+    one main.process_batch per round) and returns its report. record: list that receives
+    (centers, grid_state) of the first stream for every frame, warm-up included.
+    """
+    timer = processors[0].timer
+    timer.reset()
+    display_buffers = FrameBuffers(processors[0].buffers.enabled)
+    totals = []
+    frame_bufs = [None] * len(sources)
+    frames = 0
+    status_text = "[Grid]\n(bench)"
+    t_start = time.perf_counter() if args.warmup == 0 else None
+    calls_at_start = 0
+    detector = processors[0].detector
+    # hand：每個串流各自一個 detector（見 main()），不能合成 batch
+    batched = len(processors) > 1 and not args.no_batch and all(p.detector is detector for p in processors)
+    forwards_at_start = getattr(detector, "forward_calls", 0)
+    debouncers = [edge.create_debouncer(zone_map, debounce_options(args)) for _ in sources]
+    heatmaps = [edge.create_heatmap_exporter(to_epoch=None) if args.heatmap else None for _ in sources]
+
+    while frames < args.warmup + args.frames:
+        t0 = time.perf_counter()
+        batch = []
+        with timer.stage("capture"):
+            for i, source in enumerate(sources):
+                ret, frame, t = source.read(frame_bufs[i])
+                if not ret:
+                    break
+                batch.append((frame, t))
+        if len(batch) < len(sources):
+            break
+        if processors[0].buffers.enabled:
+            frame_bufs = [frame for frame, _ in batch]
+
+        if not batched:
+            centers_list = [p(frame, t)[1] for p, (frame, t) in zip(processors, batch)]
+        else:
+            centers_list = edge.process_batch(processors, [f for f, _ in batch], [t for _, t in batch])
+        for i, ((frame, t), centers) in enumerate(zip(batch, centers_list)):
+            with timer.stage("zones"):
+                h, w = frame.shape[:2]
+                grid_state, cells = zone_map.occupancy(centers, w, h)
+                published = grid_state
+                if debouncers[i] is not None:
+                    debouncers[i].update(grid_state, t)
+                    published = debouncers[i].state
+                on_zones = zone_map.on_zones(published)
+            if heatmaps[i] is not None:
+                with timer.stage("heatmap"):
+                    heatmaps[i].accumulator.add(centers, w, h, t)
+            if record is not None and i == 0:
+                record.append((centers, grid_state.copy()))
+            if not args.no_overlay:
+                with timer.stage("overlay"):
+                    edge.render_display(frame, zone_map, centers, cells, status_text, display_buffers,
+                                        args.display_width, processors[i].label)
+            with timer.stage("publish"):
+                publishers[i].submit(on_zones, t)
+        totals.append(time.perf_counter() - t0)
+        frames += 1
+
+        # 暖機影格（模型初始化、緩衝配置）不列入統計
+        if frames == args.warmup:
+            timer.reset()
+            totals = []
+            t_start = time.perf_counter()
+            calls_at_start = sum(p.model_calls for p in processors)
+            forwards_at_start = getattr(detector, "forward_calls", 0)
+
+    elapsed = time.perf_counter() - t_start if t_start is not None else 0.0
+    measured = len(totals)
+    stages = {name: summarize(timer.samples[name]) for name in STAGES if timer.samples.get(name)}
+    if totals:
+        stages["total"] = summarize(totals)
+    run = {
+        "source": sources[0].name,
+        "detector": detector.name,
+        "streams": len(sources),
+        "batched": batched,
+        "frames": measured,
+        "warmup_frames": min(frames, args.warmup),
+        "elapsed_sec": round(elapsed, 3),
+        # fps = 每個串流的影格率；frames_per_sec_all = 所有串流合計
+        "fps": round(measured / elapsed, 2) if elapsed > 0 else 0.0,
+        "frames_per_sec_all": round(measured * len(sources) / elapsed, 2) if elapsed > 0 else 0.0,
+        "model_calls": sum(p.model_calls for p in processors) - calls_at_start,
+        "stages": stages,
+    }
+    if isinstance(detector, YoloPersonDetector):
+        run["forward_calls"] = detector.forward_calls - forwards_at_start
+    if heatmaps[0] is not None and frames:
+        t0 = time.perf_counter()
+        acc = heatmaps[0].accumulator
+        payload = heatmaps[0].export(acc.t if acc.t is not None else 0.0)
+        run["heatmap"] = {"export_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+                          "bytes": heatmaps[0].stats["bytes"], "points": payload["points"]}
+    return run
+
+
+def agreement(reference: list, test: list) -> dict:
+    """Per-frame agreement of one detector's (centers, grid_state) records with the reference's."""
+    ev = TrackingEval()
+    for (base_centers, base_state), (centers, state) in zip(reference, test):
+        ev.update(base_centers, base_state, centers, state)
+    st = ev.summary(0, 0)
+    return {
+        "frames": st["frames"],
+        "zone_agreement": round(st["zone_agreement"], 4),
+        "count_agreement": round(st["hand_count_agreement"], 4),
+        "point_err_px_mean": round(st["center_err_px_mean"], 2),
+        "point_err_px_p95": round(st["center_err_px_p95"], 2),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5, check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def run_metadata(args, landmarker_kind: dict) -> dict:
+    import mediapipe as mp
+    return {
+        "label": args.label,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "mediapipe": mp.__version__,
+        "landmarker": landmarker_kind,
+        "detectors": args.detector,
+        "options": {
+            "motion_gate": args.motion_gate,
+            "keyframe_every": args.keyframe_every,
+            "infer_width": args.infer_width,
+            "display_width": args.display_width,
+            "overlay": not args.no_overlay,
+            "frame_buffers": not args.no_frame_buffers,
+            "wire_format": args.wire_format,
+            "stub_latency_ms": args.stub_latency_ms,
+            "streams": args.streams,
+            "batched": args.streams > 1 and not args.no_batch and "yolo" in args.detector,
+            "tiles": args.tiles,
+            "heatmap": args.heatmap,
+            "debounce": None if args.no_debounce else f"enter {edge.DEBOUNCE_ENTER}, exit {edge.DEBOUNCE_EXIT}",
+        },
+        "hist_edges_ms": [e if e != float("inf") else "inf" for e in HIST_EDGES_MS],
+    }
+
+
+def format_report(run: dict) -> str:
+    streams = f" x{run['streams']} streams ({run['frames_per_sec_all']:.1f} fps all)" if run["streams"] > 1 else ""
+    lines = [f"[BENCH] {run['source']} [{run['detector']}]: {run['frames']} frames, {run['fps']:.1f} fps"
+             f"{streams} (model calls={run['model_calls']})",
+             f"        {'stage':<12}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)"]
+    for name, st in run["stages"].items():
+        lines.append(f"        {name:<12}{st['mean_ms']:>9.3f}{st['p50_ms']:>9.3f}{st['p95_ms']:>9.3f}"
+                     f"{st['p99_ms']:>9.3f}{st['max_ms']:>9.3f}")
+    if "heatmap" in run:
+        hm = run["heatmap"]
+        lines.append(f"        heatmap export: {hm['export_ms']:.3f} ms, {hm['bytes']} bytes ({hm['points']} points)")
+    return "\n".join(lines)
+
+
+def format_comparison(old: dict, new: dict) -> str:
+    """p50 / p95 change per stage for (source, detector) runs present in both reports."""
+    old_runs = {(r["source"], r.get("detector", "hand")): r for r in old.get("runs", [])}
+    lines = [f"[COMPARE] {old['meta'].get('git')} ({old['meta'].get('label') or '-'}) -> "
+             f"{new['meta'].get('git')} ({new['meta'].get('label') or '-'})"]
+    for run in new["runs"]:
+        base = old_runs.get((run["source"], run["detector"]))
+        if base is None:
+            lines.append(f"  {run['source']} [{run['detector']}]: not in the old report")
+            continue
+        lines.append(f"  {run['source']} [{run['detector']}]: fps {base['fps']:.1f} -> {run['fps']:.1f}")
+        for name, st in run["stages"].items():
+            b = base["stages"].get(name)
+            if b is None:
+                continue
+            lines.append(f"    {name:<12} p50 {b['p50_ms']:8.3f} -> {st['p50_ms']:8.3f} ms   "
+                         f"p95 {b['p95_ms']:8.3f} -> {st['p95_ms']:8.3f} ms")
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Edge pipeline benchmark (CPU only, no camera / AWS)")
+    parser.add_argument("sources", nargs="*", metavar="PATH",
+                        help="video files, image directories or globs; synthetic frames when omitted")
+    parser.add_argument("--detector", nargs="+", choices=edge.DETECTORS, default=[edge.DETECTOR],
+                        help="backends to run on the same sources; the first is the agreement reference")
+    parser.add_argument("--landmarker", choices=["auto", "stub", "model"], default="auto",
+                        help="for every detector: auto = the real model if its file exists "
+                             "(hand_landmarker.task / YOLO_MODEL_PATH), otherwise the stub")
+    parser.add_argument("--stub-hands", type=int, default=2)
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0,
+                        help="sleep inside the stub to emulate model cost (yolo: per forward pass)")
+    parser.add_argument("--streams", type=int, default=1, metavar="N",
+                        help="run N copies of every source as N cameras through one batched detector "
+                             "(hand: one detector per stream, not batched)")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="with --streams: one detector call per stream instead of one batch (for comparison)")
+    parser.add_argument("--tiles", default=edge.YOLO_TILES, metavar="RxC", help="yolo: tiles per frame")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES,
+                        help="measured frames per source (clips stop earlier if shorter)")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser.add_argument("--synthetic", default=SYNTHETIC_SIZE, metavar="WxH")
+    parser.add_argument("--replay-fps", type=float, default=0.0)
+    parser.add_argument("--zones", default=edge.ZONES_PATH)
+    parser.add_argument("--motion-gate", action="store_true")
+    parser.add_argument("--keyframe-every", type=int, default=0, metavar="N")
+    parser.add_argument("--infer-width", type=int, default=edge.INFER_WIDTH)
+    parser.add_argument("--display-width", type=int, default=edge.DISPLAY_WIDTH)
+    parser.add_argument("--no-overlay", action="store_true", help="skip the overlay stage (headless)")
+    parser.add_argument("--no-frame-buffers", action="store_true")
+    parser.add_argument("--wire-format", choices=[WIRE_CODES, WIRE_FRAME], default=WIRE_CODES)
+    parser.add_argument("--no-debounce", action="store_true", help="publish the raw zone state (no ZoneDebouncer)")
+    parser.add_argument("--heatmap", action="store_true", help="also time the spatial heatmap accumulator")
+    parser.add_argument("--label", default="", help="free text stored in the report")
+    parser.add_argument("--out", default=BENCH_OUTPUT_PATH)
+    parser.add_argument("--compare", metavar="JSON", help="earlier report to compare against")
+    args = parser.parse_args()
+    if args.streams < 1:
+        parser.error("--streams must be >= 1")
+    try:
+        parse_tiles(args.tiles)
+    except ValueError:
+        parser.error(f"--tiles expects RxC, e.g. 2x2 (got {args.tiles})")
+    return args
+
+
+def debounce_options(args) -> dict:
+    """main.create_debouncer options: main.py's default enter / exit rules."""
+    return {"no_debounce": args.no_debounce, "enter": edge.DEBOUNCE_ENTER, "exit": edge.DEBOUNCE_EXIT,
+            "enter_hold": edge.DEBOUNCE_ENTER_HOLD_SEC, "exit_hold": edge.DEBOUNCE_EXIT_HOLD_SEC}
+
+
+def model_kind(args, detector: str) -> str:
+    if args.landmarker != "auto":
+        return args.landmarker
+    path = edge.YOLO_MODEL_PATH if detector == "yolo" else edge.MODEL_PATH
+    return "model" if os.path.exists(path) else "stub"
+
+
+def create_bench_detector(args, detector: str, kind: str):
+    if kind == "model":
+        return edge.create_detector(detector, args.infer_width, args.tiles)
+    if detector == "yolo":
+        return YoloPersonDetector(StubYoloNet(args.stub_latency_ms), parse_tiles(args.tiles))
+    return HandDetector(StubLandmarker(args.stub_hands, args.stub_latency_ms), args.infer_width)
+
+
+def open_streams(args):
+    """Per source: `streams` independently opened copies (lockstep cameras)."""
+    per_copy = [open_bench_sources(args) for _ in range(args.streams)]
+    return [list(copies) for copies in zip(*per_copy)]
+
+
+def main():
+    args = parse_args()
+    kinds = {d: model_kind(args, d) for d in args.detector}
+    print("[BENCH] detectors=" + ", ".join(f"{d} ({k})" for d, k in kinds.items()))
+
+    zone_map = load_zone_map(args.zones)
+    broker = LocalBroker()
+    publishers = [AsyncPublisher(broker, edge.TOPIC if i == 0 else f"{edge.TOPIC}/bench-{i}", zone_map.zone_ids,
+                                 args.wire_format, publish_fn=edge.mqtt_publish_payload, verbose=False).start()
+                  for i in range(args.streams)]
+    reuse = not args.no_frame_buffers
+
+    runs = []
+    records = {}            # (source, detector) -> per-frame (centers, grid_state)
+    try:
+        for detector_name in args.detector:
+            for sources in open_streams(args):
+                # 每個來源用新的 detector / processor，VIDEO mode 的 timestamp 才會從頭開始。
+                # yolo：所有串流共用一個 detector（一次 batch forward）；hand：VIDEO mode 的 landmarker
+                # 只接受一條嚴格遞增的 timestamp，每個串流各自一個（和 multicam 每支攝影機一個 worker 相同）
+                if detector_name == "yolo":
+                    detectors = [create_bench_detector(args, detector_name, kinds[detector_name])] * len(sources)
+                else:
+                    detectors = [create_bench_detector(args, detector_name, kinds[detector_name]) for _ in sources]
+                timer = StageTimer()
+                processors = [edge.FrameProcessor(
+                    detector,
+                    gate=MotionGate(reuse) if args.motion_gate else None,
+                    tracker=PalmTracker(args.keyframe_every, reuse) if args.keyframe_every > 1 else None,
+                    buffers=FrameBuffers(reuse),
+                    timer=timer,
+                ) for detector in detectors]
+                record = records.setdefault((sources[0].name, detector_name), [])
+                try:
+                    run = bench_source(processors, sources, zone_map, publishers, args, record)
+                finally:
+                    for source in sources:
+                        source.release()
+                    for detector in {id(d): d for d in detectors}.values():
+                        detector.close()
+                print(format_report(run))
+                runs.append(run)
+    finally:
+        for publisher in publishers:
+            publisher.close()
+    print(publishers[0].format_stats())
+
+    agreements = []
+    reference = args.detector[0]
+    for (source, detector_name), record in records.items():
+        if detector_name == reference:
+            continue
+        result = {"source": source, "reference": reference, "detector": detector_name,
+                  **agreement(records[(source, reference)], record)}
+        print("[AGREE]", json.dumps(result))
+        agreements.append(result)
+
+    report = {"meta": run_metadata(args, kinds), "runs": runs}
+    if agreements:
+        report["agreement"] = agreements
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCH] Saved -> {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(format_comparison(json.load(f), report))
+
+
+if __name__ == "__main__":
+    main()
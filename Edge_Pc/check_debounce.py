@@ -0,0 +1,154 @@
+"""
+Checks that the default ZoneDebouncer settings beat the old PRINT_INTERVAL_SEC sampling.
+
+A deterministic synthetic workload stands in for a recorded clip: hands move between points
+in the zones and dwell there for a few seconds, and the detector misses them for bursts of
+up to DROPOUT_MAX_FRAMES frames, jitters the palm position (flicker at zone borders) and
+reports the odd short-lived false hand. Each seed's raw occupancy runs through
+main.create_debouncer (main.py defaults unless overridden) and DebounceEval. The check passes
+when, summed over all seeds, the debounced policy sends fewer messages than the sampling with
+a lower mean publish latency. Prints "[CHECK] PASS" or exits 1.
+
+Run:
+    python check_debounce.py
+    python check_debounce.py --seeds 10 --seconds 300
+    python check_debounce.py --enter 3/5 --exit 8/10      (try other settings)
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import main as edge
+from zone_filter import DebounceEval
+from zones import load_zone_map
+
+FPS = 30.0
+WIDTH, HEIGHT = 1280, 720
+HAND_SPEED_PX = 900.0           # 手在兩個停留點之間移動的速度（像素 / 秒）
+DWELL_SEC = (1.5, 8.0)          # 每個停留點停留的時間範圍
+AWAY_PROB = 0.2                 # 停留結束後離開畫面一段時間的機率
+AWAY_SEC = (1.0, 5.0)
+DROPOUT_START_PROB = 0.04       # 每張影格開始一段漏偵測的機率（每隻手）
+DROPOUT_MAX_FRAMES = 6          # 漏偵測最長幾張（約 0.2 秒）
+JITTER_PX = 10.0                # 掌心位置的雜訊（標準差）
+FALSE_HAND_PROB = 0.004         # 每張影格出現一個誤報的機率
+FALSE_HAND_MAX_FRAMES = 2
+
+
+class SyntheticHands:
+    """Per-frame palm centers (pixels) of `hands` dwelling hands plus detector noise; seeded, deterministic."""
+
+    def __init__(self, hands: int, seed: int):
+        self.rng = np.random.default_rng(seed)
+        self.pos = [self._point() for _ in range(hands)]
+        self.target = [self._point() for _ in range(hands)]
+        self.dwell_left = [0.0] * hands
+        self.away_left = [0.0] * hands
+        self.dropout_left = [0] * hands
+        self.false_hand = None
+        self.false_left = 0
+
+    def _point(self) -> np.ndarray:
+        return self.rng.uniform((0, 0), (WIDTH, HEIGHT))
+
+    def _move(self, k: int, dt: float) -> bool:
+        """Advances hand k by dt; False while it is out of the frame."""
+        if self.away_left[k] > 0:
+            self.away_left[k] -= dt
+            return False
+        step = self.target[k] - self.pos[k]
+        dist = float(np.hypot(*step))
+        if dist > 1e-6:
+            self.pos[k] = self.pos[k] + step * min(1.0, HAND_SPEED_PX * dt / dist)
+            if dist <= HAND_SPEED_PX * dt:
+                self.dwell_left[k] = self.rng.uniform(*DWELL_SEC)
+            return True
+        self.dwell_left[k] -= dt
+        if self.dwell_left[k] <= 0:
+            self.target[k] = self._point()
+            if self.rng.random() < AWAY_PROB:
+                self.away_left[k] = self.rng.uniform(*AWAY_SEC)
+                self.pos[k] = self.target[k]
+        return True
+
+    def step(self, dt: float):
+        centers = []
+        for k in range(len(self.pos)):
+            if not self._move(k, dt):
+                continue
+            if self.dropout_left[k] == 0 and self.rng.random() < DROPOUT_START_PROB:
+                self.dropout_left[k] = int(self.rng.integers(1, DROPOUT_MAX_FRAMES + 1))
+            if self.dropout_left[k] > 0:
+                self.dropout_left[k] -= 1
+                continue
+            x, y = self.pos[k] + self.rng.normal(0.0, JITTER_PX, 2)
+            centers.append((int(x), int(y)))
+        if self.false_left == 0 and self.rng.random() < FALSE_HAND_PROB:
+            self.false_hand = self._point()
+            self.false_left = int(self.rng.integers(1, FALSE_HAND_MAX_FRAMES + 1))
+        if self.false_left > 0:
+            self.false_left -= 1
+            centers.append((int(self.false_hand[0]), int(self.false_hand[1])))
+        return centers
+
+
+def evaluate(zone_map, options: dict, seconds: float, seed: int, hands: int) -> dict:
+    debouncer = edge.create_debouncer(zone_map, options)
+    evaluation = DebounceEval(zone_map.zone_ids, edge.PRINT_INTERVAL_SEC)
+    source = SyntheticHands(hands, seed)
+    for i in range(int(seconds * FPS)):
+        t = i / FPS
+        grid_state, _ = zone_map.occupancy(source.step(1.0 / FPS), WIDTH, HEIGHT)
+        debouncer.update(grid_state, t)
+        evaluation.update(t, grid_state, debouncer.state)
+    return evaluation.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Debounced vs. sampled publishing on a synthetic dwell workload")
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=120.0, help="length of each synthetic clip")
+    parser.add_argument("--hands", type=int, default=2)
+    parser.add_argument("--zones", default="zones.json")
+    parser.add_argument("--enter", default=edge.DEBOUNCE_ENTER, metavar="N/M")
+    parser.add_argument("--exit", default=edge.DEBOUNCE_EXIT, metavar="N/M")
+    parser.add_argument("--enter-hold", type=float, default=edge.DEBOUNCE_ENTER_HOLD_SEC, metavar="SEC")
+    parser.add_argument("--exit-hold", type=float, default=edge.DEBOUNCE_EXIT_HOLD_SEC, metavar="SEC")
+    args = parser.parse_args()
+
+    zone_map = load_zone_map(args.zones)
+    options = {"no_debounce": False, "enter": args.enter, "exit": args.exit,
+               "enter_hold": args.enter_hold, "exit_hold": args.exit_hold}
+    totals = {policy: {"messages": 0, "blips": 0, "latency_ms_sum": 0.0, "matched": 0}
+              for policy in ("sampled", "debounced")}
+    for seed in range(1, args.seeds + 1):
+        summary = evaluate(zone_map, options, args.seconds, seed, args.hands)
+        print("[DEBOUNCE-EVAL]", json.dumps({"seed": seed, **summary}))
+        for policy, total in totals.items():
+            result = summary[policy]
+            total["messages"] += result["messages"]
+            total["blips"] += result["blips"]
+            total["latency_ms_sum"] += result["latency_ms_mean"] * result["matched"]
+            total["matched"] += result["matched"]
+
+    for policy, total in totals.items():
+        total["latency_ms_mean"] = round(total.pop("latency_ms_sum") / max(1, total["matched"]), 1)
+        print(f"[CHECK] {policy:9s} messages={total['messages']} blips={total['blips']} "
+              f"latency_ms_mean={total['latency_ms_mean']}")
+    sampled, debounced = totals["sampled"], totals["debounced"]
+    failures = []
+    if debounced["messages"] >= sampled["messages"]:
+        failures.append("debounced sends no fewer messages than sampling")
+    if debounced["latency_ms_mean"] >= sampled["latency_ms_mean"]:
+        failures.append("debounced mean latency is not lower than sampling")
+    print(f"[CHECK] enter {args.enter} hold {args.enter_hold}s, exit {args.exit} hold {args.exit_hold}s, "
+          f"{args.seeds} x {args.seconds:g}s")
+    print("[CHECK] PASS" if not failures else f"[CHECK] FAIL ({'; '.join(failures)})")
+    sys.exit(0 if not failures else 1)
+
+
+if __name__ == "__main__":
+    main()
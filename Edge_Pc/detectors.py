@@ -0,0 +1,286 @@
+"""
+Detector backends for the edge pipeline (main.py --detector):
+
+    hand   MediaPipe HandLandmarker (hand_landmarker.task). One subject = the PALM_IDXS points
+           of one hand. VIDEO mode keeps per-stream state, so a batch is a loop over frames.
+    yolo   YOLOv5 / YOLOv8 COCO person detector (ONNX) on CPU through cv2.dnn. One subject =
+           the foot point (bottom centre) of one person box, i.e. where the person stands.
+           Frames of several cameras and tiles of one large frame are letterboxed into a
+           single NCHW blob and run in one forward pass.
+
+Both return, per frame, a list of (K, 2) float32 pixel-point arrays in the original (unmirrored)
+frame, one per subject; FrameProcessor, PalmTracker and ZoneMap only use the mean point of a
+subject, so gating, tracking and zones work the same with either backend.
+
+The YOLO model is not shipped. Export one with a dynamic batch axis, e.g. with ultralytics:
+    yolo export model=yolov8n.pt format=onnx dynamic=True opset=12
+A model with a fixed batch of 1 also works; it is then run once per frame / tile.
+
+warm_up(w, h) runs one inference on a blank w x h frame, so graph / kernel initialization
+happens at startup (concurrently with the camera open and the MQTT connect), not on the first
+real frame. mediapipe is imported only by the hand backend.
+"""
+
+import cv2
+import numpy as np
+
+from framebuf import FrameBuffers, scaled_size
+from pipeline import NULL_TIMER
+
+# 掌心近似點：0(手腕)+5+17 平均
+PALM_IDXS = [0, 5, 17]
+
+# ===== YOLO (COCO) =====
+YOLO_INPUT_SIZE = 640         # 正方形輸入邊長；匯出時的 imgsz
+YOLO_CONF = 0.35              # person 分數門檻
+YOLO_NMS_IOU = 0.45
+YOLO_NUM_CLASSES = 80
+PERSON_CLASS = 0
+LETTERBOX_FILL = 114          # 與 ultralytics 的 letterbox 相同的灰底
+TILE_OVERLAP = 0.15           # 相鄰 tile 重疊比例，讓跨接縫的人至少完整出現在一塊裡
+TILE_EDGE_PX = 2.0            # 框離 tile 內側邊界這麼近 = 被接縫切到
+TILE_CONTAINED = 0.6          # 被切到的框有這麼多面積落在完整的框裡，就視為同一個人
+
+
+# ===== Hand landmarker =====
+def palm_points(result, w: int, h: int):
+    """每隻手的 PALM_IDXS 三點像素座標，list of (3, 2) float32 array。"""
+    hands = []
+    # result.hand_landmarks 是 list[hand]，每個 hand 是 21 個 landmark（normalized x,y）
+    if result.hand_landmarks:
+        for hand_lms in result.hand_landmarks:
+            hands.append(np.array(
+                [[hand_lms[i].x * w, hand_lms[i].y * h] for i in PALM_IDXS], dtype=np.float32))
+    return hands
+
+
+def prepare_image(frame, buffers: FrameBuffers, infer_width: int):
+    """縮到 infer_width + BGR->RGB，輸出都寫進 buffers 裡預先配置的陣列，回傳 mp.Image。"""
+    import mediapipe as mp  # 只有 hand 後端需要；第一次之後只是查 sys.modules
+    h, w = frame.shape[:2]
+    iw, ih = scaled_size(w, h, infer_width)
+    if (iw, ih) != (w, h):
+        frame = cv2.resize(frame, (iw, ih), dst=buffers.get("infer", (ih, iw, 3)), interpolation=cv2.INTER_AREA)
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffers.get("rgb", (ih, iw, 3)))
+    # mp.Image 仍會在內部複製一份（MediaPipe 的 ImageFrame），這一份無法省掉
+    return mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
+
+
+class HandDetector:
+    """HandLandmarker (or anything with detect_for_video, e.g. bench.StubLandmarker)."""
+
+    name = "hand"
+    label = "palm"
+    batched = False
+
+    def __init__(self, landmarker, infer_width: int):
+        self.landmarker = landmarker
+        self.infer_width = infer_width
+        self.ts_offset = 0      # warm_up 用掉 timestamp 0，之後的 timestamp 往後移，才會嚴格遞增
+
+    def warm_up(self, w: int, h: int) -> None:
+        self.landmarker.detect_for_video(prepare_image(np.zeros((h, w, 3), np.uint8), FrameBuffers(False),
+                                                       self.infer_width), 0)
+        self.ts_offset = 1
+
+    def detect(self, frame, ts_ms: int, buffers: FrameBuffers, timer=NULL_TIMER):
+        h, w = frame.shape[:2]
+        with timer.stage("preprocess"):
+            mp_image = prepare_image(frame, buffers, self.infer_width)
+        with timer.stage("inference"):
+            result = self.landmarker.detect_for_video(mp_image, ts_ms + self.ts_offset)
+            # landmark 是 normalized 座標，直接乘原始解析度即可
+            return palm_points(result, w, h)
+
+    def detect_batch(self, frames, ts_ms, buffers: FrameBuffers, timer=NULL_TIMER):
+        # VIDEO mode 的 graph 一次只吃一張，timestamp 必須嚴格遞增：只能是同一個串流的連續影格，
+        # 多個串流要各自一個 HandDetector（bench.py --streams、multicam 都是這樣）
+        return [self.detect(f, t, buffers, timer) for f, t in zip(frames, ts_ms)]
+
+    def close(self):
+        self.landmarker.close()
+
+
+# ===== YOLO person detector =====
+def load_yolo_net(model_path: str):
+    net = cv2.dnn.readNetFromONNX(model_path)
+    net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+    net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+    return net
+
+
+def parse_tiles(spec: str):
+    """'2x3' -> (rows, cols)."""
+    rows, cols = (int(v) for v in spec.lower().split("x"))
+    if rows < 1 or cols < 1:
+        raise ValueError(f"bad tile grid: {spec}")
+    return rows, cols
+
+
+def tile_rects(w: int, h: int, tiles):
+    """rows x cols overlapping (x0, y0, x1, y1) tiles covering a w x h frame."""
+    rows, cols = tiles
+    tw = w if cols == 1 else min(w, int(np.ceil(w / cols * (1 + TILE_OVERLAP))))
+    th = h if rows == 1 else min(h, int(np.ceil(h / rows * (1 + TILE_OVERLAP))))
+    xs = [0] if cols == 1 else [round(c * (w - tw) / (cols - 1)) for c in range(cols)]
+    ys = [0] if rows == 1 else [round(r * (h - th) / (rows - 1)) for r in range(rows)]
+    return [(x, y, x + tw, y + th) for y in ys for x in xs]
+
+
+def person_scores(out: np.ndarray):
+    """
+    Raw YOLO output -> ((N, A, 4) cx/cy/w/h boxes, (N, A) person scores).
+    YOLOv8 is (N, 4 + classes, A); YOLOv5 is (N, A, 5 + classes) with an objectness column.
+    Other class counts: the longer axis is taken as the anchors.
+    """
+    coco = (4 + YOLO_NUM_CLASSES, 5 + YOLO_NUM_CLASSES)
+    if out.shape[1] == coco[0] or (out.shape[2] not in coco and out.shape[1] < out.shape[2]):
+        out = out.transpose(0, 2, 1)
+    if out.shape[2] == 5 + YOLO_NUM_CLASSES:
+        scores = out[:, :, 4] * out[:, :, 5 + PERSON_CLASS]
+    else:
+        scores = out[:, :, 4 + PERSON_CLASS]
+    return out[:, :, :4], scores
+
+
+def overlaps(boxes: np.ndarray, others: np.ndarray):
+    """(IoU, fraction of each box inside each other box) for xywh arrays, shape (len(boxes), len(others))."""
+    b, o = boxes[:, None, :], others[None, :, :]
+    ix = np.minimum(b[..., 0] + b[..., 2], o[..., 0] + o[..., 2]) - np.maximum(b[..., 0], o[..., 0])
+    iy = np.minimum(b[..., 1] + b[..., 3], o[..., 1] + o[..., 3]) - np.maximum(b[..., 1], o[..., 1])
+    inter = np.clip(ix, 0, None) * np.clip(iy, 0, None)
+    area_b, area_o = b[..., 2] * b[..., 3], o[..., 2] * o[..., 3]
+    return inter / np.maximum(1e-6, area_b + area_o - inter), inter / np.maximum(1e-6, area_b)
+
+
+class YoloPersonDetector:
+    """
+    Letterboxes every frame (or every tile of it) into one (N, 3, S, S) blob, runs one
+    net.forward(), keeps the person class, maps boxes back to frame pixels and runs NMS per
+    frame across its tiles. Boxes cut by an inner tile edge go through NMS separately and are
+    dropped when they overlap or lie mostly inside a kept uncut box (the same person, seen whole
+    in the neighbouring tile), which plain IoU misses.
+    """
+
+    name = "yolo"
+    label = "person"
+    batched = True
+
+    def __init__(self, net, tiles=(1, 1), input_size: int = YOLO_INPUT_SIZE,
+                 conf: float = YOLO_CONF, nms_iou: float = YOLO_NMS_IOU):
+        self.net = net
+        self.tiles = tuple(tiles)
+        self.input_size = input_size
+        self.conf = conf
+        self.nms_iou = nms_iou
+        self.batch_ok = True        # False once a fixed-batch model refused N > 1
+        self.forward_calls = 0
+
+    def warm_up(self, w: int, h: int) -> None:
+        # 也會在這時就發現固定 batch 的模型（tiles > 1），不計入 forward_calls
+        calls = self.forward_calls
+        self.detect(np.zeros((h, w, 3), np.uint8), 0, FrameBuffers(False))
+        self.forward_calls = calls
+
+    def detect(self, frame, ts_ms: int, buffers: FrameBuffers, timer=NULL_TIMER):
+        return self.detect_batch([frame], [ts_ms], buffers, timer)[0]
+
+    def detect_batch(self, frames, ts_ms, buffers: FrameBuffers, timer=NULL_TIMER):
+        with timer.stage("preprocess"):
+            blob, views = self._blob(frames, buffers)
+        with timer.stage("inference"):
+            boxes, scores = person_scores(self._forward(blob))
+            return self._decode(frames, views, boxes, scores)
+
+    def _blob(self, frames, buffers: FrameBuffers):
+        s = self.input_size
+        rects = [tile_rects(f.shape[1], f.shape[0], self.tiles) for f in frames]
+        n = sum(len(r) for r in rects)
+        blob = buffers.get("yolo_blob", (n, 3, s, s), np.float32)
+        if blob is None:
+            blob = np.empty((n, 3, s, s), dtype=np.float32)
+        blob.fill(LETTERBOX_FILL / 255.0)
+        views = []                  # per blob image: (frame index, tile rect, scale, pad_x, pad_y)
+        for i, (frame, frame_rects) in enumerate(zip(frames, rects)):
+            for x0, y0, x1, y1 in frame_rects:
+                k = len(views)
+                tw, th = x1 - x0, y1 - y0
+                scale = min(s / tw, s / th)
+                nw, nh = min(s, round(tw * scale)), min(s, round(th * scale))
+                px, py = (s - nw) // 2, (s - nh) // 2
+                small = cv2.resize(frame[y0:y1, x0:x1], (nw, nh), dst=buffers.get("yolo_in", (nh, nw, 3)),
+                                   interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+                # HWC BGR uint8 -> CHW RGB 0..1，直接寫進 blob 的 letterbox 區域
+                np.multiply(small.transpose(2, 0, 1)[::-1], 1.0 / 255.0,
+                            out=blob[k, :, py:py + nh, px:px + nw], casting="unsafe")
+                views.append((i, (x0, y0, x1, y1), scale, px, py))
+        return blob, views
+
+    def _forward(self, blob):
+        if len(blob) > 1 and self.batch_ok:
+            try:
+                self.net.setInput(blob)
+                out = self.net.forward()
+                self.forward_calls += 1
+                if out.shape[0] == len(blob):
+                    return out
+            except cv2.error:
+                pass
+            self.batch_ok = False
+            print(f"[YOLO] Model does not take a batch of {len(blob)}; running one image per forward pass")
+        outs = []
+        for k in range(len(blob)):
+            self.net.setInput(blob[k:k + 1])
+            outs.append(self.net.forward())
+            self.forward_calls += 1
+        return np.concatenate(outs)
+
+    def _decode(self, frames, views, boxes, scores):
+        per_frame = [([], [], []) for _ in frames]      # (xywh boxes, scores, cut flags) in frame pixels
+        for k, (i, (x0, y0, x1, y1), scale, px, py) in enumerate(views):
+            keep = np.flatnonzero(scores[k] >= self.conf)
+            if keep.size == 0:
+                continue
+            b = boxes[k, keep].astype(np.float32)
+            xywh = np.empty_like(b)
+            xywh[:, 0] = (b[:, 0] - b[:, 2] / 2 - px) / scale + x0
+            xywh[:, 1] = (b[:, 1] - b[:, 3] / 2 - py) / scale + y0
+            xywh[:, 2:] = b[:, 2:] / scale
+            h, w = frames[i].shape[:2]
+            right, bottom = xywh[:, 0] + xywh[:, 2], xywh[:, 1] + xywh[:, 3]
+            # 只有 tile 在畫面內側的邊才算接縫；畫面邊緣本來就會切到人
+            cut = (((x0 > 0) & (xywh[:, 0] <= x0 + TILE_EDGE_PX)) | ((y0 > 0) & (xywh[:, 1] <= y0 + TILE_EDGE_PX))
+                   | ((x1 < w) & (right >= x1 - TILE_EDGE_PX)) | ((y1 < h) & (bottom >= y1 - TILE_EDGE_PX)))
+            per_frame[i][0].extend(xywh.tolist())
+            per_frame[i][1].extend(scores[k, keep].tolist())
+            per_frame[i][2].extend(cut.tolist())
+
+        results = []
+        for frame, (xywh, sc, cut) in zip(frames, per_frame):
+            people = []
+            if xywh:
+                h, w = frame.shape[:2]
+                boxes = np.asarray(xywh, dtype=np.float32)
+                cut = np.asarray(cut, dtype=bool)
+                whole = self._nms(boxes, sc, ~cut)
+                parts = self._nms(boxes, sc, cut)
+                if len(whole) and len(parts):
+                    iou, inside = overlaps(boxes[parts], boxes[whole])
+                    parts = parts[~((iou > self.nms_iou) | (inside >= TILE_CONTAINED)).any(axis=1)]
+                for x, y, bw, bh in boxes[np.concatenate([whole, parts])].tolist():
+                    # 腳底點 = 框底邊中點；貼邊的框裁到畫面內
+                    people.append(np.array([[min(max(x + bw / 2, 0.0), w - 1.0),
+                                             min(max(y + bh, 0.0), h - 1.0)]], dtype=np.float32))
+            results.append(people)
+        return results
+
+    def _nms(self, boxes: np.ndarray, scores, mask: np.ndarray) -> np.ndarray:
+        """Indexes (into boxes) kept by NMS among boxes[mask]."""
+        idx = np.flatnonzero(mask)
+        if idx.size == 0:
+            return idx
+        kept = cv2.dnn.NMSBoxes(boxes[idx].tolist(), [scores[j] for j in idx.tolist()], self.conf, self.nms_iou)
+        return idx[np.asarray(kept, dtype=np.intp).reshape(-1)]
+
+    def close(self):
+        pass
@@ -0,0 +1,129 @@
+import threading
+import tracemalloc
+
+import numpy as np
+
+
+def scaled_size(w: int, h: int, max_width: int):
+    """(w, h) shrunk to max_width keeping the aspect ratio; unchanged if max_width is 0 or larger."""
+    if not max_width or w <= max_width:
+        return w, h
+    return max_width, max(1, int(round(h * max_width / w)))
+
+
+class FrameBuffers:
+    """
+    Named, preallocated output arrays for cv2 dst= arguments; a buffer is only reallocated
+    when the requested shape changes (e.g. camera resolution switch).
+    enabled=False hands out None, so every cv2 call allocates its own output (old behaviour);
+    `allocations` then counts those calls, which makes both modes comparable.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.allocations = 0
+        self._bufs = {}
+
+    def get(self, name: str, shape, dtype=np.uint8):
+        if not self.enabled:
+            self.allocations += 1
+            return None
+        shape = tuple(shape)
+        buf = self._bufs.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._bufs[name] = buf
+            self.allocations += 1
+        return buf
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self._bufs.values())
+
+
+class FramePool:
+    """
+    Free list of capture frames for the threaded pipeline. A frame goes back to the pool once
+    the render stage is done with it, or when a LatestQueue drops it.
+    """
+
+    def __init__(self, max_free: int = 8):
+        self.max_free = max_free
+        self.allocations = 0
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """A recycled frame, or None (the reader then allocates and the pool grows)."""
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        self.allocations += 1
+        return None
+
+    def release(self, frame) -> None:
+        if frame is None:
+            return
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(frame)
+
+
+class AllocationProbe:
+    """
+    Steady-state per-frame allocation report, measured after `warmup` frames:
+    - frame_array_allocs: new image arrays per frame (FrameBuffers allocations + capture reads
+      that did not reuse an array), i.e. the count that buffer reuse is meant to bring to ~0
+    - transient: peak traced bytes during a frame above what was live at its start (tracemalloc;
+      numpy / cv2 outputs are traced, MediaPipe's internal C++ buffers are not)
+    - retained: traced bytes that survive the frame (should stay ~0, otherwise something leaks)
+    """
+
+    def __init__(self, warmup: int = 30):
+        self.warmup = warmup
+        self.frames = 0
+        self.transient = []
+        self.retained = 0
+        self.capture_allocs = 0
+        self._buffers = []
+        self._allocs_at_warmup = 0
+        self._base = 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def watch(self, *buffers) -> None:
+        self._buffers.extend(b for b in buffers if b is not None)
+
+    def _allocs(self) -> int:
+        return self.capture_allocs + sum(b.allocations for b in self._buffers)
+
+    def captured(self, reused: bool) -> None:
+        if not reused:
+            self.capture_allocs += 1
+
+    def begin(self) -> None:
+        self._base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def end(self) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        self.frames += 1
+        if self.frames == self.warmup:
+            self._allocs_at_warmup = self._allocs()
+        elif self.frames > self.warmup:
+            self.transient.append(max(0, peak - self._base))
+            self.retained += current - self._base
+
+    def summary(self, frame_bytes: int) -> dict:
+        t = np.asarray(self.transient or [0], dtype=np.float64)
+        measured = max(1, len(self.transient))
+        return {
+            "frames_measured": len(self.transient),
+            "frame_array_allocs_per_frame": (self._allocs() - self._allocs_at_warmup) / measured,
+            "transient_kb_per_frame_mean": float(t.mean() / 1024),
+            "transient_kb_per_frame_max": float(t.max() / 1024),
+            # 尖峰時多佔了幾張「原始影格大小」的記憶體
+            "transient_frames_per_frame": float(t.mean() / max(1, frame_bytes)),
+            "retained_kb_per_frame": float(self.retained / measured / 1024),
+            "buffers_kb": sum(b.nbytes for b in self._buffers) / 1024,
+        }
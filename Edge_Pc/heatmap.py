@@ -0,0 +1,191 @@
+"""
+Continuous spatial heatmap of detection points, exported as a small compressed snapshot.
+
+Besides the zone cells, every detection point (palm center / foot point) is added to a
+rows x cols density grid over the normalized frame (one np.add.at scatter-add per frame). The
+grid decays exponentially with a half-life, applied lazily when points are added or a snapshot
+is taken, so a frame without detections costs nothing.
+
+Every export_sec the exporter quantizes the grid to uint8 relative to its maximum (`scale` =
+decayed detections in the hottest cell), deflates and base64-encodes it, and hands one JSON
+message to its sinks (MQTT publish and / or a JSON Lines file, appended by a background
+HeatmapFileWriter so the frame loop never waits on the disk):
+    {"type": "heatmap", "w": 64, "h": 36, "t": 1767076299.3, "half_life_sec": 600.0,
+     "scale": 12.5, "frames": 4500, "points": 3812, "data": "<base64 zlib uint8[h * w]>"}
+cell value ~= data[y * w + x] / 255 * scale. The payload size depends on the grid, not on the
+frame rate: a 64x36 grid is at most ~3 KB per export, usually a few hundred bytes.
+"""
+
+import base64
+import json
+import threading
+import zlib
+
+import numpy as np
+
+HEATMAP_TYPE = "heatmap"
+ZLIB_LEVEL = 9
+
+
+class HeatmapAccumulator:
+    def __init__(self, cols: int = 64, rows: int = 36, half_life_sec: float = 600.0):
+        self.cols = cols
+        self.rows = rows
+        self.half_life_sec = half_life_sec
+        self.grid = np.zeros((rows, cols), dtype=np.float32)
+        self._flat = self.grid.reshape(-1)      # 同一塊記憶體，scatter-add 用
+        self.t = None                           # grid 已衰減到的時間
+        self.frames = 0
+        self.points = 0
+
+    def _decay_to(self, t: float) -> None:
+        if self.t is not None and t > self.t and self.half_life_sec > 0:
+            self.grid *= np.float32(0.5 ** ((t - self.t) / self.half_life_sec))
+        if self.t is None or t > self.t:
+            self.t = t
+
+    def add(self, centers, w: int, h: int, t: float) -> None:
+        """centers: (x, y) pixel points of one frame of size w x h, captured at t seconds."""
+        self.frames += 1
+        if len(centers) == 0:
+            return
+        self._decay_to(t)
+        pts = np.asarray(centers, dtype=np.float32).reshape(-1, 2)
+        ix = np.clip((pts[:, 0] * (self.cols / w)).astype(np.intp), 0, self.cols - 1)
+        iy = np.clip((pts[:, 1] * (self.rows / h)).astype(np.intp), 0, self.rows - 1)
+        np.add.at(self._flat, iy * self.cols + ix, 1.0)
+        self.points += len(pts)
+
+    def snapshot(self, t: float) -> np.ndarray:
+        """The grid decayed to t (a view; copy it to keep it)."""
+        self._decay_to(t)
+        return self.grid
+
+    def encode(self, t: float, wall_t: float = None) -> dict:
+        """Export message for the grid at t (wall_t: the epoch time put in the message, default t)."""
+        grid = self.snapshot(t)
+        scale = float(grid.max())
+        q = np.zeros(grid.shape, dtype=np.uint8)
+        if scale > 0:
+            np.rint(grid * (255.0 / scale), out=q, casting="unsafe")
+        return {
+            "type": HEATMAP_TYPE,
+            "w": self.cols,
+            "h": self.rows,
+            "t": round(wall_t if wall_t is not None else t, 3),
+            "half_life_sec": self.half_life_sec,
+            "scale": round(scale, 3),
+            "frames": self.frames,
+            "points": self.points,
+            "data": base64.b64encode(zlib.compress(q.tobytes(), ZLIB_LEVEL)).decode("ascii"),
+        }
+
+
+def decode_heatmap(payload: dict) -> np.ndarray:
+    """Inverse of HeatmapAccumulator.encode: the (h, w) float32 grid (quantized)."""
+    q = np.frombuffer(zlib.decompress(base64.b64decode(payload["data"])), dtype=np.uint8)
+    return q.reshape(payload["h"], payload["w"]).astype(np.float32) * (payload["scale"] / 255.0)
+
+
+class HeatmapFileWriter:
+    """
+    Appends export lines to `path` on its own thread. One pending slot: an export that is still
+    waiting when the next one arrives is replaced by it (each export is a full snapshot).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stats = {"written": 0, "replaced": 0, "errors": 0}
+        self._cond = threading.Condition()
+        self._pending = None
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="heatmap-file", daemon=True)
+        self._thread.start()
+
+    def submit(self, line: str) -> None:
+        with self._cond:
+            if self._pending is not None:
+                self.stats["replaced"] += 1
+            self._pending = line
+            self._cond.notify()
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Write what is pending, then stop the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping:
+                    self._cond.wait()
+                line, self._pending = self._pending, None
+            if line is None:
+                return
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                self.stats["written"] += 1
+            except OSError as e:
+                self.stats["errors"] += 1
+                print("[HEATMAP] Write error:", repr(e))
+
+
+class HeatmapExporter:
+    """
+    Feeds an accumulator every frame and exports it every export_sec of capture time:
+    publish(payload_dict) and / or one JSON line appended to `path` (by a HeatmapFileWriter;
+    close() writes the last one).
+    to_epoch converts the capture clock to the epoch time put in the message (replay: None = as is).
+    """
+
+    def __init__(self, accumulator: HeatmapAccumulator, export_sec: float, publish=None, path: str = None,
+                 to_epoch=None):
+        self.accumulator = accumulator
+        self.export_sec = export_sec
+        self.publish = publish
+        self.path = path
+        self.writer = HeatmapFileWriter(path) if path else None
+        self.to_epoch = to_epoch
+        self.last_export_t = None
+        self.stats = {"exports": 0, "bytes": 0, "errors": 0}
+
+    def update(self, centers, w: int, h: int, t: float) -> None:
+        self.accumulator.add(centers, w, h, t)
+        if self.last_export_t is None:
+            self.last_export_t = t
+        elif t - self.last_export_t >= self.export_sec:
+            self.last_export_t = t
+            self.export(t)
+
+    def export(self, t: float) -> dict:
+        payload = self.accumulator.encode(t, self.to_epoch(t) if self.to_epoch is not None else None)
+        line = json.dumps(payload)
+        self.stats["exports"] += 1
+        self.stats["bytes"] += len(line)
+        if self.writer is not None:
+            self.writer.submit(line)
+        if self.publish is not None:
+            try:
+                self.publish(payload)
+            except Exception as e:
+                # 熱度圖是定期快照，送不出去就等下一次，不重送
+                self.stats["errors"] += 1
+                print("[HEATMAP] Publish error:", repr(e))
+        return payload
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+    def format_stats(self) -> str:
+        st, acc = self.stats, self.accumulator
+        avg = st["bytes"] / st["exports"] if st["exports"] else 0
+        text = (f"[HEATMAP] {acc.cols}x{acc.rows} points={acc.points} frames={acc.frames} "
+                f"exports={st['exports']} avg_bytes={avg:.0f} errors={st['errors']}")
+        if self.writer is not None:
+            ws = self.writer.stats
+            text += f" | file written={ws['written']} replaced={ws['replaced']} errors={ws['errors']}"
+        return text
@@ -0,0 +1,102 @@
+"""
+Store-and-forward journal for zone transitions.
+
+A fixed-size, memory-mapped ring file: a 64-byte header followed by `capacity` fixed-size
+records (seq, capture ts, zone, state). Appends are a memory write plus a header update, so
+the render loop never waits on the disk or the broker. The publisher thread reads records
+from `acked_seq` to `head_seq`, publishes them, and advances `acked_seq` once the broker
+has acknowledged them. When the ring is full the oldest unacknowledged record is evicted.
+
+seq keeps increasing across restarts; together with the random journal id (`jid`) it lets
+the dashboard drop duplicates after a replay.
+"""
+
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+
+JOURNAL_MAGIC = b"EJN1"
+HEADER = struct.Struct("<4sIQQQ16s")   # magic, capacity, head_seq, acked_seq, evicted, jid
+HEADER_SIZE = 64
+RECORD = struct.Struct("<QdHBx")       # seq, ts (epoch sec), zone, state
+DEFAULT_CAPACITY = 65536               # 約 1.3 MB
+
+JournalRecord = namedtuple("JournalRecord", "seq ts zone state")
+
+
+class TransitionJournal:
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY):
+        self.path = path
+        self._lock = threading.Lock()
+        size = HEADER_SIZE + capacity * RECORD.size
+
+        existed = os.path.exists(path)
+        new = not existed or os.path.getsize(path) != size
+        self._file = open(path, "r+b" if existed else "w+b")
+        if new:
+            self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+
+        magic, cap, head, acked, evicted, jid = HEADER.unpack_from(self._mm, 0)
+        if new or magic != JOURNAL_MAGIC or cap != capacity:
+            if existed:
+                print(f"[JOURNAL] {path}: size / header mismatch, starting a new journal")
+            self._mm.close()
+            self._file.truncate(0)
+            self._file.truncate(size)
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+            head, acked, evicted, jid = 0, 0, 0, os.urandom(8).hex().encode("ascii")
+        self.capacity = capacity
+        self.head_seq, self.acked_seq, self.evicted = head, acked, evicted
+        self.jid = jid.decode("ascii")
+        self._write_header()
+        if self.backlog:
+            print(f"[JOURNAL] {path}: {self.backlog} unsent transitions from a previous run")
+
+    def _write_header(self):
+        HEADER.pack_into(self._mm, 0, JOURNAL_MAGIC, self.capacity, self.head_seq,
+                         self.acked_seq, self.evicted, self.jid.encode("ascii"))
+
+    def _offset(self, seq: int) -> int:
+        return HEADER_SIZE + (seq % self.capacity) * RECORD.size
+
+    @property
+    def backlog(self) -> int:
+        return self.head_seq - self.acked_seq
+
+    def append(self, ts: float, zone: int, state: int) -> int:
+        with self._lock:
+            if self.head_seq - self.acked_seq >= self.capacity:
+                # 滿了：丟掉最舊、尚未送出的一筆
+                self.acked_seq += 1
+                self.evicted += 1
+            seq = self.head_seq
+            RECORD.pack_into(self._mm, self._offset(seq), seq, ts, zone, state)
+            self.head_seq = seq + 1
+            self._write_header()
+            return seq
+
+    def pending(self, limit: int):
+        """Oldest unacknowledged records, at most `limit`."""
+        with self._lock:
+            end = min(self.head_seq, self.acked_seq + limit)
+            return [JournalRecord(*RECORD.unpack_from(self._mm, self._offset(seq)))
+                    for seq in range(self.acked_seq, end)]
+
+    def ack(self, upto_seq: int) -> None:
+        """Marks every record with seq < upto_seq as delivered."""
+        with self._lock:
+            if upto_seq > self.acked_seq:
+                self.acked_seq = min(upto_seq, self.head_seq)
+                self._write_header()
+
+    def flush(self) -> None:
+        self._mm.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._mm.flush()
+            self._mm.close()
+            self._file.close()
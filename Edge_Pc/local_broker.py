@@ -0,0 +1,70 @@
+"""
+In-process stand-in for an AWS IoT MQTT connection (awscrt.mqtt.Connection subset).
+
+It implements connect / disconnect / publish / subscribe with the same call shapes
+(futures, (future, packet_id) tuples, on_message(topic, payload, **kwargs) callbacks),
+so the edge publisher and the dashboard's on_message can be exercised without AWS:
+
+    broker = LocalBroker()
+    broker.subscribe("project/#", None, on_message)
+    mqtt_publish_code(broker, 11)
+
+set_online(False) simulates a broker outage: publishes then fail with ConnectionError.
+"""
+
+import threading
+from concurrent.futures import Future
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    p_parts, t_parts = pattern.split("/"), topic.split("/")
+    for i, p in enumerate(p_parts):
+        if p == "#":
+            return True
+        if i >= len(t_parts) or (p != "+" and p != t_parts[i]):
+            return False
+    return len(p_parts) == len(t_parts)
+
+
+def _done(value=None) -> Future:
+    f = Future()
+    f.set_result(value)
+    return f
+
+
+class LocalBroker:
+    def __init__(self, online: bool = True):
+        self._lock = threading.Lock()
+        self._subs = []          # (pattern, callback)
+        self._packet_id = 0
+        self.online = online
+        self.published = []      # (topic, payload bytes)，方便事後檢查
+
+    def set_online(self, online: bool) -> None:
+        self.online = online
+
+    # ===== awscrt.mqtt.Connection subset =====
+    def connect(self) -> Future:
+        return _done({"session_present": False})
+
+    def disconnect(self) -> Future:
+        return _done()
+
+    def subscribe(self, topic, qos, callback=None):
+        with self._lock:
+            self._subs.append((topic, callback))
+            self._packet_id += 1
+            return _done({"topic": topic, "qos": qos}), self._packet_id
+
+    def publish(self, topic, payload, qos=None, retain=False):
+        if not self.online:
+            raise ConnectionError("LocalBroker offline")
+        data = payload.encode("utf-8") if isinstance(payload, str) else bytes(payload)
+        with self._lock:
+            self._packet_id += 1
+            packet_id = self._packet_id
+            self.published.append((topic, data))
+            subs = [cb for pattern, cb in self._subs if cb is not None and topic_matches(pattern, topic)]
+        for cb in subs:
+            cb(topic=topic, payload=data, dup=False, qos=qos, retain=retain)
+        return _done({"packet_id": packet_id}), packet_id
@@ -1,15 +1,68 @@
-import cv2
 import time
-import json
-import mediapipe as mp
+STARTUP_T0 = time.monotonic()   # 啟動計時的起點（在 import 之前）
 
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
+import argparse
+import cv2
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+# mediapipe（hand 後端）與 awsiot（連 AWS）很慢，只在真的用到時才 import（create_landmarker / build_mqtt_connection）
 from awscrt import io, mqtt
-from awsiot import mqtt_connection_builder
+
+from pipeline import (
+    LatestQueue, new_pipeline_stats, capture_loop, inference_loop,
+    record_latency, format_pipeline_stats, NULL_TIMER,
+)
+from sources import CameraSource, expand_source_paths, open_replay_source
+from zones import load_zone_map
+from motion import MotionGate, format_gate_stats
+from tracker import PalmTracker, TrackingEval, format_tracker_stats
+from publisher import AsyncPublisher, WIRE_CODES, WIRE_FRAME, decode_occupancy_frame
+from local_broker import LocalBroker
+from journal import TransitionJournal, DEFAULT_CAPACITY as JOURNAL_CAPACITY
+from framebuf import FrameBuffers, FramePool, AllocationProbe, scaled_size
+from detectors import HandDetector, YoloPersonDetector, load_yolo_net, parse_tiles
+from zone_filter import ZoneDebouncer, DebounceEval, parse_n_of_m, format_debounce_stats
+from heatmap import HeatmapAccumulator, HeatmapExporter, HEATMAP_TYPE
+from startup import StartupTimer
 
 PRINT_INTERVAL_SEC = 0.5
+# 區域狀態去抖動（zone_filter.py）：確認的轉換立即發布，不再每 PRINT_INTERVAL_SEC 取樣一次
+DEBOUNCE_ENTER = "3/4"          # OFF -> ON：最近 4 張裡有 3 張偵測到（1~2 張的誤報不算進入）
+DEBOUNCE_EXIT = "7/8"           # ON -> OFF：最近 8 張裡有 7 張沒偵測到（約 0.2 秒內的漏偵測不算離開）
+DEBOUNCE_ENTER_HOLD_SEC = 0.0   # 另外要求條件持續的最短時間（0 = 只看張數）
+DEBOUNCE_EXIT_HOLD_SEC = 0.1    # 預設值以 check_debounce.py 驗證：訊息數與平均延遲都要低於舊的取樣
+STATS_INTERVAL_SEC = 5.0
+# 連續空間熱度圖（heatmap.py）：所有偵測點累加在 cols x rows 的格子上，定期壓縮送出 / 寫檔
+HEATMAP_COLS = 64
+HEATMAP_ROWS = 36
+HEATMAP_HALF_LIFE_SEC = 600.0   # 舊的點每 10 分鐘權重減半
+HEATMAP_EXPORT_SEC = 15.0
+HEATMAP_TOPIC_SUFFIX = "/heatmap"   # 送到 f"{TOPIC}/heatmap"（ESP8266 只訂閱 TOPIC 本身，收不到）
+REPLAY_PROGRESS_INTERVAL_SEC = 5.0
+REPLAY_OUTPUT_PATH = "./replay_results.jsonl"
+
+# 偵測後端：hand = MediaPipe HandLandmarker（掌心），yolo = YOLO 人物偵測（ONNX，cv2.dnn，腳底點）
+DETECTORS = ["hand", "yolo"]
+DETECTOR = "hand"
+# 需要先把 hand_landmarker.task 下載到專案目錄
+MODEL_PATH = "./hand_landmarker.task"
+# YOLOv5 / v8 COCO 模型，匯出方式見 detectors.py
+YOLO_MODEL_PATH = "./yolov8n.onnx"
+# 大畫面切成 rows x cols 塊（有重疊），和同一批的其他影格一起推論；"1x1" = 不切
+YOLO_TILES = "1x1"
+CAMERA_INDEX = 0
+# 啟動時用空白影格先推論一次（模型初始化不落在第一張真實影格）；常見 webcam 的預設解析度
+WARMUP_FRAME_SIZE = (640, 480)
+WINDOW_NAME = "Edge detector + Zone Codes"
+# 區域設定檔（格狀 N×M 或多邊形），找不到時使用預設 3x3 九宮格
+ZONES_PATH = "./zones.json"
+
+# 推論 / 顯示解析度（寬度，等比例縮放；0 = 原始解析度）
+# landmarker 內部本來就會縮到 ~200px，餵 1080p 進去只是多花轉換與複製的成本（yolo 固定縮到它的輸入大小）
+INFER_WIDTH = 640
+DISPLAY_WIDTH = 960
 
 SEND_TO_AWS = True
 IOT_ENDPOINT = "a10eer929bk2gd-ats.iot.us-east-1.amazonaws.com"
@@ -19,36 +72,24 @@ TOPIC = "project/esp8266_led"
 CERT_PATH = "./device.pem.crt"
 KEY_PATH = "./private.pem.key"
 CA_PATH = "./AmazonRootCA1.pem"
-
-def point_to_grid_id(cx: int, cy: int, w: int, h: int) -> int:
-    cell_w = w / 3.0
-    cell_h = h / 3.0
-    col = int(cx / cell_w)
-    row = int(cy / cell_h)
-    col = max(0, min(2, col))
-    row = max(0, min(2, row))
-    return row * 3 + col + 1
-
-def draw_grid(frame):
-    h, w = frame.shape[:2]
-    x1, x2 = int(w / 3), int(2 * w / 3)
-    y1, y2 = int(h / 3), int(2 * h / 3)
-    cv2.line(frame, (x1, 0), (x1, h), (255, 255, 255), 3)
-    cv2.line(frame, (x2, 0), (x2, h), (255, 255, 255), 3)
-    cv2.line(frame, (0, y1), (w, y1), (255, 255, 255), 3)
-    cv2.line(frame, (0, y2), (w, y2), (255, 255, 255), 3)
+MQTT_CONNECT_RETRY_SEC = 5.0    # 連線失敗時在背景重試，這段期間的結果先留在 publisher 裡
 
 def grid_id_to_code(grid_id: int, is_on: bool) -> int:
+    # 十位數以上 = zone id，個位數 = 狀態；zone 10..255 一樣適用（例如 121 = zone 12 ON）
     return grid_id * 10 + (1 if is_on else 0)
 
-def format_grid_codes(codes_1_to_9):
-    return (
-        f"{codes_1_to_9[0]} | {codes_1_to_9[1]} | {codes_1_to_9[2]}\n"
-        f"{codes_1_to_9[3]} | {codes_1_to_9[4]} | {codes_1_to_9[5]}\n"
-        f"{codes_1_to_9[6]} | {codes_1_to_9[7]} | {codes_1_to_9[8]}"
-    )
+def code_to_grid_id(code: int) -> int:
+    return code // 10
+
+def format_grid_codes(codes, per_line: int = 3):
+    width = max(len(str(c)) for c in codes) if codes else 0
+    lines = []
+    for i in range(0, len(codes), per_line):
+        lines.append(" | ".join(str(c).rjust(width) for c in codes[i:i + per_line]))
+    return "\n".join(lines)
 
 def build_mqtt_connection():
+    from awsiot import mqtt_connection_builder
     event_loop_group = io.EventLoopGroup(1)
     host_resolver = io.DefaultHostResolver(event_loop_group)
     client_bootstrap = io.ClientBootstrap(event_loop_group, host_resolver)
@@ -68,13 +109,96 @@ def mqtt_connect(mqtt_connection):
     mqtt_connection.connect().result()
     print("[MQTT] Connected.")
 
-def mqtt_publish_code(mqtt_connection, code: int):
+def mqtt_publish_code(mqtt_connection, code: int, topic: str = TOPIC):
     payload = code
-    mqtt_connection.publish(
-        topic=TOPIC,
+    future, _ = mqtt_connection.publish(
+        topic=topic,
         payload=json.dumps(payload, ensure_ascii=False),
         qos=mqtt.QoS.AT_LEAST_ONCE
     )
+    return future
+
+def mqtt_publish_payload(mqtt_connection, payload, topic: str = TOPIC):
+    """
+    int 代碼沿用 mqtt_publish_code（JSON 數字，例如 11）；字串（frame 格式）原樣送出；
+    dict（journal 事件）轉成 JSON。回傳 publish 的 future（QoS1 收到 PUBACK 時完成）。
+    """
+    if isinstance(payload, int):
+        return mqtt_publish_code(mqtt_connection, payload, topic)
+    if isinstance(payload, dict):
+        payload = json.dumps(payload, ensure_ascii=False)
+    future, _ = mqtt_connection.publish(topic=topic, payload=payload, qos=mqtt.QoS.AT_LEAST_ONCE)
+    return future
+
+def build_publisher(mqtt_connection, zone_map, wire_format: str = WIRE_CODES, topic: str = TOPIC,
+                    journal: TransitionJournal = None, ready: threading.Event = None, on_first_publish=None,
+                    resync: bool = False):
+    return AsyncPublisher(mqtt_connection, topic, zone_map.zone_ids, wire_format,
+                          publish_fn=mqtt_publish_payload, journal=journal, ready=ready,
+                          on_first_publish=on_first_publish, resync=resync).start()
+
+def connect_until_ready(mqtt_connection, ready: threading.Event, startup: StartupTimer = None):
+    """Connects (retrying every MQTT_CONNECT_RETRY_SEC), then sets ready."""
+    t0 = time.monotonic()
+    while True:
+        try:
+            mqtt_connect(mqtt_connection)
+            break
+        except Exception as e:
+            print(f"[MQTT] Connect failed: {e!r}, retrying in {MQTT_CONNECT_RETRY_SEC:.0f}s")
+            time.sleep(MQTT_CONNECT_RETRY_SEC)
+    ready.set()
+    if startup is not None:
+        startup.add_phase("mqtt_connect", t0)
+
+def open_mqtt(local_broker: bool, ready: threading.Event, startup: StartupTimer, wait: bool = False):
+    """
+    LocalBroker (ready at once), an AWS IoT connection that connects on a background thread
+    (wait=True: on this one), or None when SEND_TO_AWS is off. ready is set once connected.
+    """
+    if local_broker:
+        mqtt_connection = LocalBroker()
+        mqtt_connection.subscribe(TOPIC + "/#", mqtt.QoS.AT_LEAST_ONCE, print_local_message)
+        ready.set()
+        return mqtt_connection
+    if not SEND_TO_AWS:
+        return None
+    startup.wait_for.add("mqtt_connect")
+    mqtt_connection = startup.timed("mqtt_build", build_mqtt_connection)
+    if wait:
+        connect_until_ready(mqtt_connection, ready, startup)
+    else:
+        threading.Thread(target=connect_until_ready, args=(mqtt_connection, ready, startup),
+                         name="mqtt-connect", daemon=True).start()
+    return mqtt_connection
+
+def monotonic_to_epoch(t: float) -> float:
+    return time.time() - (time.monotonic() - t)
+
+def heatmap_topic(topic: str = TOPIC) -> str:
+    return topic + HEATMAP_TOPIC_SUFFIX
+
+def heatmap_publisher(mqtt_connection, ready: threading.Event = None, topic: str = TOPIC):
+    """publish(payload) for HeatmapExporter; skips the export while ready is not set (熱度圖只是定期快照)."""
+    def publish(payload):
+        if ready is None or ready.is_set():
+            mqtt_publish_payload(mqtt_connection, payload, heatmap_topic(topic))
+    return publish
+
+def create_heatmap_exporter(publish=None, path: str = None, to_epoch=monotonic_to_epoch) -> HeatmapExporter:
+    """publish(payload) and / or path: where the exports go (see heatmap.py)."""
+    return HeatmapExporter(HeatmapAccumulator(HEATMAP_COLS, HEATMAP_ROWS, HEATMAP_HALF_LIFE_SEC),
+                           HEATMAP_EXPORT_SEC, publish, path, to_epoch)
+
+def print_local_message(topic, payload, **kwargs):
+    raw = payload.decode("utf-8", errors="ignore")
+    if topic.endswith(HEATMAP_TOPIC_SUFFIX):
+        print(f"[LOCAL] {topic} {HEATMAP_TYPE} ({len(payload)} bytes)")
+        return
+    frame = decode_occupancy_frame(raw)
+    if frame is not None:
+        raw += " -> ON zones " + str([z for z, s in frame.items() if s])
+    print(f"[LOCAL] {topic} {raw}")
 
 def mqtt_disconnect(mqtt_connection):
     try:
@@ -83,115 +207,635 @@ def mqtt_disconnect(mqtt_connection):
     except Exception as e:
         print("[MQTT] Disconnect error:", repr(e))
 
-def main():
+def create_landmarker(model_path: str = MODEL_PATH):
     # ===== MediaPipe Tasks: HandLandmarker =====
-    # 需要先把 hand_landmarker.task 下載到專案目錄
-    model_path = "./hand_landmarker.task"
-
+    from mediapipe.tasks import python
+    from mediapipe.tasks.python import vision
     base_options = python.BaseOptions(model_asset_path=model_path)
     options = vision.HandLandmarkerOptions(
         base_options=base_options,
         running_mode=vision.RunningMode.VIDEO,
         num_hands=2
     )
-
-    landmarker = vision.HandLandmarker.create_from_options(options)
-
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        raise RuntimeError("無法開啟攝影機")
-
-    mqtt_connection = None
-    if SEND_TO_AWS:
-        mqtt_connection = build_mqtt_connection()
-        mqtt_connect(mqtt_connection)
-
-    last_print_t = 0.0
-    last_on_codes = set()
-    last_status_text = "[Grid]\n(尚未輸出)"
-
-    ts_ms = 0  # VIDEO mode 需要遞增 timestamp（毫秒）
-
+    return vision.HandLandmarker.create_from_options(options)
+
+def create_detector(kind: str = DETECTOR, infer_width: int = INFER_WIDTH, tiles: str = YOLO_TILES):
+    """detectors.HandDetector / YoloPersonDetector, by name (DETECTORS)."""
+    if kind == "yolo":
+        return YoloPersonDetector(load_yolo_net(YOLO_MODEL_PATH), parse_tiles(tiles))
+    if kind == "hand":
+        return HandDetector(create_landmarker(), infer_width)
+    raise ValueError(f"Unknown detector: {kind}")
+
+def open_source_with_detector(open_source, kind: str, infer_width: int, tiles: str, startup: StartupTimer):
+    """
+    open_source() runs on a worker thread (VideoCapture 開啟時不佔 GIL) while the detector loads and
+    warms up on a blank WARMUP_FRAME_SIZE frame on this one. Returns (source, detector).
+    """
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="open-source") as pool:
+        source_f = pool.submit(startup.timed, "camera_open", open_source)
+        detector = startup.timed("model_load", create_detector, kind, infer_width, tiles)
+        startup.timed("warmup", detector.warm_up, *WARMUP_FRAME_SIZE)
+        return source_f.result(), detector
+
+def start_edge(args, startup: StartupTimer, mqtt_ready: threading.Event):
+    """
+    Camera, detector and MQTT connection for the live loop; returns (source, detector, mqtt_connection).
+    預設三者同時進行（MQTT 在背景執行緒連線，連上前的結果留在 publisher 佇列）；
+    --sequential-startup 照舊依序：模型 → 攝影機 → 等連線完成，也不做 warm-up，用來比較啟動時間。
+    """
+    open_camera = lambda: CameraSource(CAMERA_INDEX, low_latency=args.pipeline)
+    if args.sequential_startup:
+        detector = startup.timed("model_load", create_detector, args.detector, args.infer_width, args.tiles)
+        source = startup.timed("camera_open", open_camera)
+        mqtt_connection = open_mqtt(args.local_broker, mqtt_ready, startup, wait=True)
+        return source, detector, mqtt_connection
+    mqtt_connection = open_mqtt(args.local_broker, mqtt_ready, startup)
+    source, detector = open_source_with_detector(open_camera, args.detector, args.infer_width, args.tiles, startup)
+    return source, detector, mqtt_connection
+
+class VideoClock:
+    """把擷取時間（秒）轉成 detect_for_video 需要的嚴格遞增毫秒 timestamp。"""
+
+    def __init__(self):
+        self.t0 = None
+        self.last_ms = -1
+
+    def to_ms(self, t: float) -> int:
+        if self.t0 is None:
+            self.t0 = t
+        ts_ms = int((t - self.t0) * 1000)
+        if ts_ms <= self.last_ms:
+            ts_ms = self.last_ms + 1
+        self.last_ms = ts_ms
+        return ts_ms
+
+def hands_to_centers(hands, w: int):
+    # 掌心近似點 = 三點平均（yolo：每人只有腳底一點）；偵測在未鏡像的原始影格上做，鏡像只作用在座標（x -> w - x）
+    return [(int(w - pts[:, 0].mean()), int(pts[:, 1].mean())) for pts in hands]
+
+class FrameProcessor:
+    """
+    人物 / 掌心偵測（回傳鏡像後的座標，影格本身不翻轉、不複製），detector 見 detectors.py，可選：
+    - MotionGate：被跳過的影格沿用上一次的結果，所以區域狀態與發布節奏不受影響
+    - PalmTracker：每 N 張（或追蹤失敗時）才跑模型，中間用光流推移偵測點
+    timer（pipeline.StageTimer）記錄各階段耗時，給 bench.py 用。
+    多個串流共用一個 batched detector 時用 process_batch（prepare / finish 兩段）。
+    """
+
+    def __init__(self, detector, gate: MotionGate = None, tracker: PalmTracker = None,
+                 buffers: FrameBuffers = None, timer=NULL_TIMER):
+        self.detector = detector
+        self.gate = gate
+        self.tracker = tracker
+        self.buffers = buffers if buffers is not None else FrameBuffers()
+        self.timer = timer
+        self.clock = VideoClock()  # VIDEO mode 需要遞增 timestamp（毫秒），用實際擷取時間
+        self.last_centers = []
+        self.model_calls = 0
+
+    @property
+    def label(self) -> str:
+        return self.detector.label
+
+    def prepare(self, frame, t_capture: float):
+        """
+        MotionGate + PalmTracker. Returns the centers when the frame was settled without the
+        model, None when the detector has to run on it (then call finish with its result).
+        """
+        if self.gate is not None:
+            with self.timer.stage("motion_gate"):
+                run = self.gate.should_infer(frame, t_capture)
+            if not run:
+                return self.last_centers
+
+        if self.tracker is not None and not self.tracker.need_keyframe():
+            with self.timer.stage("tracking"):
+                hands = self.tracker.track(frame)
+            if hands is not None:
+                return self.finish(frame, t_capture, hands, detected=False)
+        return None
+
+    def finish(self, frame, t_capture: float, hands, detected: bool = True):
+        if detected:
+            self.model_calls += 1
+            if self.tracker is not None:
+                with self.timer.stage("tracking"):
+                    self.tracker.reset(frame, hands)
+
+        centers = hands_to_centers(hands, frame.shape[1])
+        if self.gate is not None:
+            self.gate.observe(len(centers), t_capture)
+        self.last_centers = centers
+        return centers
+
+    def __call__(self, frame, t_capture: float):
+        centers = self.prepare(frame, t_capture)
+        if centers is None:
+            hands = self.detector.detect(frame, self.clock.to_ms(t_capture), self.buffers, self.timer)
+            centers = self.finish(frame, t_capture, hands)
+        return frame, centers
+
+    def print_stats(self):
+        if self.gate is not None:
+            print(format_gate_stats(self.gate))
+        if self.tracker is not None:
+            print(format_tracker_stats(self.tracker))
+
+def process_batch(processors, frames, t_captures):
+    """
+    One frame per processor (e.g. one per camera), all sharing one detector: the frames that
+    still need the model after gating / tracking go through a single detect_batch call
+    (one forward pass for the yolo backend). Returns the centers of every frame.
+    """
+    centers = [p.prepare(f, t) for p, f, t in zip(processors, frames, t_captures)]
+    todo = [i for i, c in enumerate(centers) if c is None]
+    if todo:
+        first = processors[todo[0]]
+        results = first.detector.detect_batch(
+            [frames[i] for i in todo], [processors[i].clock.to_ms(t_captures[i]) for i in todo],
+            first.buffers, first.timer)
+        for i, hands in zip(todo, results):
+            centers[i] = processors[i].finish(frames[i], t_captures[i], hands)
+    return centers
+
+def draw_overlays(frame, zone_map, centers, cells, status_text: str, label: str = "palm"):
+    zone_map.draw(frame)
+    for (cx, cy), grid_id in zip(centers, cells):
+        grid_id = int(grid_id)
+        cv2.circle(frame, (cx, cy), 8, (0, 255, 0), -1)
+        text = f"{label} cell={grid_id} code={grid_id_to_code(grid_id, True)}" if grid_id else f"{label} (no zone)"
+        cv2.putText(frame, text,
+                    (cx + 10, cy - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+    y0 = 30
+    for i, line in enumerate(status_text.splitlines()):
+        cv2.putText(frame, line, (10, y0 + i * 28),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+
+class GridReporter:
+    """
+    有 ZoneDebouncer 時每張影格都先過濾，確認的轉換立刻交給 AsyncPublisher（事件驅動）；
+    沒有時（--no-debounce）沿用舊做法：每 PRINT_INTERVAL_SEC 取樣一次原始狀態送出。
+    console 的各區狀態一律最多每 PRINT_INTERVAL_SEC 輸出一次。
+    實際的 MQTT 發送在 publisher 執行緒，這裡不會因為連線問題卡住（還沒連上時結果先留在 publisher）。
+    startup 不為 None 時記下第一張影格的擷取時間與第一個區域結果（first_frame / first_detection）。
+    """
+
+    def __init__(self, zone_map, publisher: AsyncPublisher = None, debouncer: ZoneDebouncer = None,
+                 startup: StartupTimer = None):
+        self.zone_map = zone_map
+        self.publisher = publisher
+        self.debouncer = debouncer
+        self.startup = startup
+        self.last_print_t = 0.0
+        self.status_text = "[Grid]\n(尚未輸出)"
+
+    def update(self, grid_state, t_capture: float = None) -> bool:
+        """Feeds one frame's raw occupancy; returns True when the grid was printed."""
+        now = time.time()
+        if self.startup is not None and not self.startup.reported:
+            if t_capture is not None:
+                self.startup.mark("first_frame", t_capture)
+            self.startup.mark("first_detection")
+        if self.debouncer is not None:
+            changed = self.debouncer.update(grid_state, t_capture if t_capture is not None else time.monotonic())
+            grid_state = self.debouncer.state
+            if changed:
+                print("[ZONE]", " ".join(str(grid_id_to_code(z, grid_state[z] == 1)) for z in changed))
+                self._submit(grid_state, t_capture, now)
+
+        if now - self.last_print_t < PRINT_INTERVAL_SEC:
+            return False
+        self.last_print_t = now
+
+        zone_ids = self.zone_map.zone_ids
+        codes = [grid_id_to_code(i, grid_state[i] == 1) for i in zone_ids]
+        grid_text = format_grid_codes(codes, self.zone_map.codes_per_line())
+        self.status_text = "[Grid]\n" + grid_text
+        print(self.status_text)
+
+        on_zones = self.zone_map.on_zones(grid_state)
+        print("[ON_CODES]", [grid_id_to_code(i, True) for i in on_zones] if on_zones else "none")
+
+        if self.debouncer is None:
+            self._submit(grid_state, t_capture, now)
+        return True
+
+    def _submit(self, grid_state, t_capture: float, now: float) -> None:
+        if self.publisher is not None:
+            ts = monotonic_to_epoch(t_capture) if t_capture is not None else now
+            self.publisher.submit(self.zone_map.on_zones(grid_state), ts)
+
+    def print_stats(self):
+        if self.debouncer is not None:
+            print(format_debounce_stats(self.debouncer))
+
+def create_debouncer(zone_map, options: dict):
+    """ZoneDebouncer from the --enter / --exit / --enter-hold / --exit-hold options; None with --no-debounce."""
+    if options["no_debounce"]:
+        return None
+    return ZoneDebouncer(zone_map.max_zone_id + 1, parse_n_of_m(options["enter"]), parse_n_of_m(options["exit"]),
+                         options["enter_hold"], options["exit_hold"])
+
+def render_display(frame, zone_map, centers, cells, status_text: str, buffers: FrameBuffers,
+                   display_width: int = DISPLAY_WIDTH, label: str = "palm"):
+    """
+    顯示用影格：先縮到 display_width 再鏡像（都寫進預先配置的緩衝），overlay 畫在縮小後的畫面上，
+    原始影格不會被修改。
+    """
+    h, w = frame.shape[:2]
+    dw, dh = scaled_size(w, h, display_width)
+    if (dw, dh) != (w, h):
+        frame = cv2.resize(frame, (dw, dh), dst=buffers.get("display_small", (dh, dw, 3)),
+                           interpolation=cv2.INTER_AREA)
+    view = cv2.flip(frame, 1, dst=buffers.get("display", (dh, dw, 3)))
+    sx, sy = dw / w, dh / h
+    draw_overlays(view, zone_map, [(int(cx * sx), int(cy * sy)) for cx, cy in centers], cells, status_text, label)
+    return view
+
+def show_frame(frame) -> bool:
+    """顯示畫面；按 ESC 回傳 False。"""
+    cv2.imshow(WINDOW_NAME, frame)
+    return (cv2.waitKey(1) & 0xFF) != 27
+
+def print_alloc_report(probe: AllocationProbe, frame):
+    if probe is None:
+        return
+    frame_bytes = frame.nbytes if frame is not None else 0
+    print("[ALLOC]", json.dumps(probe.summary(frame_bytes)))
+
+def run_serial(processor: FrameProcessor, source, zone_map, reporter: GridReporter,
+               headless: bool = False, display_width: int = DISPLAY_WIDTH, probe: AllocationProbe = None,
+               heatmap: HeatmapExporter = None):
+    display_buffers = FrameBuffers(processor.buffers.enabled)
+    if probe is not None and not headless:
+        probe.watch(display_buffers)
+    frame_buf = None  # 下一張影格直接解碼進上一張的陣列
+    last_frame = None
+    last_stats_t = time.monotonic()
     try:
         while True:
-            ret, frame = cap.read()
+            if probe is not None:
+                probe.begin()
+            ret, frame, t_capture = source.read(frame_buf)
             if not ret:
                 break
+            if probe is not None:
+                probe.captured(frame is frame_buf)
+            last_frame = frame
+            if processor.buffers.enabled:
+                frame_buf = frame
 
-            frame = cv2.flip(frame, 1)
+            frame, centers = processor(frame, t_capture)
             h, w = frame.shape[:2]
-            draw_grid(frame)
-
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
-
-            ts_ms += 33  # 粗略用 30fps; 也可改成用 time.time() 算
-            result = landmarker.detect_for_video(mp_image, ts_ms)
-
-            grid_state = {i: 0 for i in range(1, 10)}
-
-            # result.hand_landmarks 是 list[hand]，每個 hand 是 21 個 landmark（normalized x,y）
-            if result.hand_landmarks:
-                for hand_lms in result.hand_landmarks:
-                    # 掌心近似點：0(手腕)+5+17 平均
-                    idxs = [0, 5, 17]
-                    xs = [hand_lms[i].x for i in idxs]
-                    ys = [hand_lms[i].y for i in idxs]
-                    cx = int(sum(xs) / len(xs) * w)
-                    cy = int(sum(ys) / len(ys) * h)
-
-                    grid_id = point_to_grid_id(cx, cy, w, h)
-                    grid_state[grid_id] = 1
-
-                    cv2.circle(frame, (cx, cy), 8, (0, 255, 0), -1)
-                    code = grid_id_to_code(grid_id, True)
-                    cv2.putText(frame, f"palm cell={grid_id} code={code}",
-                                (cx + 10, cy - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-            now = time.time()
-            if now - last_print_t >= PRINT_INTERVAL_SEC:
-                last_print_t = now
-
-                codes = [grid_id_to_code(i, grid_state[i] == 1) for i in range(1, 10)]
-                grid_text = format_grid_codes(codes)
-                last_status_text = "[Grid]\n" + grid_text
-                print(last_status_text)
-
-                on_codes = {grid_id_to_code(i, True) for i in range(1, 10) if grid_state[i] == 1}
-                print("[ON_CODES]", sorted(on_codes) if on_codes else "none")
-
-                if SEND_TO_AWS and mqtt_connection is not None:
-                    new_codes = on_codes - last_on_codes
-                    gone_codes = last_on_codes - on_codes
-
-                    for code in sorted(new_codes):
-                        mqtt_publish_code(mqtt_connection, code)
-                        print("[MQTT] Published:", code)
-
-                    # 若你不想送 off，把這段註解掉
-                    for code in sorted(gone_codes):
-                        off_code = (code // 10) * 10
-                        mqtt_publish_code(mqtt_connection, off_code)
-                        print("[MQTT] Published:", off_code)
-
-                    last_on_codes = on_codes
-
-            y0 = 30
-            for i, line in enumerate(last_status_text.splitlines()):
-                cv2.putText(frame, line, (10, y0 + i * 28),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-
-            cv2.imshow("HandLandmarker (Tasks) + 3x3 Grid Codes", frame)
-            if (cv2.waitKey(1) & 0xFF) == 27:
-                break
+            grid_state, cells = zone_map.occupancy(centers, w, h)
+            reporter.update(grid_state, t_capture)
+            if heatmap is not None:
+                heatmap.update(centers, w, h, t_capture)
+
+            if time.monotonic() - last_stats_t >= STATS_INTERVAL_SEC:
+                last_stats_t = time.monotonic()
+                processor.print_stats()
+
+            if not headless:
+                view = render_display(frame, zone_map, centers, cells, reporter.status_text,
+                                      display_buffers, display_width, processor.label)
+                if not show_frame(view):
+                    break
+            if probe is not None:
+                probe.end()
+    finally:
+        processor.print_stats()
+        print_alloc_report(probe, last_frame)
+
+def run_pipelined(processor: FrameProcessor, source, zone_map, reporter: GridReporter,
+                  headless: bool = False, display_width: int = DISPLAY_WIDTH, heatmap: HeatmapExporter = None):
+    """
+    擷取 / 推論 / 顯示+發布 三段式管線：
+    各段之間用只保留最新一張的 LatestQueue 連接，推論忙碌時舊影格直接丟棄。
+    imshow 必須在主執行緒，所以顯示+發布留在這裡。
+    影格在 FramePool 中循環使用：顯示完、或在佇列中被丟棄時放回池中。
+    """
+    stop = threading.Event()
+    stats = new_pipeline_stats()
+    pool = FramePool() if processor.buffers.enabled else None
+    recycle = (lambda item: pool.release(item.frame)) if pool is not None else None
+    capture_q = LatestQueue(maxsize=1, on_drop=recycle)
+    result_q = LatestQueue(maxsize=1, on_drop=recycle)
+    display_buffers = FrameBuffers(processor.buffers.enabled)
+
+    threads = [
+        threading.Thread(target=capture_loop, args=(source, capture_q, stop, stats, pool),
+                         name="capture", daemon=True),
+        threading.Thread(target=inference_loop, args=(processor, capture_q, result_q, stop, stats),
+                         name="inference", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    last_stats_t = time.monotonic()
+    try:
+        while True:
+            item = result_q.get(timeout=0.5)
+            if item is None:
+                if result_q.closed:
+                    break
+                continue
+
+            frame = item.frame
+            h, w = frame.shape[:2]
+            grid_state, cells = zone_map.occupancy(item.centers, w, h)
+            reporter.update(grid_state, item.t_capture)
+            if heatmap is not None:
+                heatmap.update(item.centers, w, h, item.t_capture)
+            record_latency(stats, item.t_capture)
+
+            if not headless:
+                view = render_display(frame, zone_map, item.centers, cells, reporter.status_text,
+                                      display_buffers, display_width, processor.label)
+                if not show_frame(view):
+                    break
+            if recycle is not None:
+                recycle(item)
+
+            if time.monotonic() - last_stats_t >= STATS_INTERVAL_SEC:
+                last_stats_t = time.monotonic()
+                print(format_pipeline_stats(stats, capture_q, result_q))
+                processor.print_stats()
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(timeout=2.0)
+        print(format_pipeline_stats(stats, capture_q, result_q))
+        if pool is not None:
+            print(f"[POOL] frames allocated={pool.allocations}")
+        processor.print_stats()
+
+def run_replay(processor: FrameProcessor, paths, zone_map, out_path: str, fps: float = 0.0,
+               baseline: FrameProcessor = None, probe: AllocationProbe = None,
+               new_debouncer=None, debounce_eval: bool = False, heatmap_path: str = None):
+    """
+    離線重跑錄影檔 / 圖片資料夾：不丟影格、不等即時、不開視窗，
+    每張影格的各區結果寫成一行 JSON（JSON Lines）。
+    timestamp 依影格序號 / fps 計算，與處理速度無關。
+    baseline 不為 None 時，同一張影格也用逐格推論跑一次，比較追蹤模式損失的準確度。
+    probe 不為 None 時，結束時輸出每張影格的記憶體配置量（[ALLOC]）。
+    new_debouncer 不為 None 時，每個來源用一個新的 ZoneDebouncer，輸出的是過濾後（會被發布）的狀態，
+    原始狀態另存在 raw_on_cells；debounce_eval 時每個來源輸出與舊的 PRINT_INTERVAL_SEC 取樣的比較。
+    heatmap_path 不為 None 時，每個來源各自累積熱度圖，依影片時間每 HEATMAP_EXPORT_SEC 與結尾各寫一行
+    （多一個 "source" 欄位，"t" 為影片內的秒數）。
+    """
+    evaluation = TrackingEval() if baseline is not None else None
+    base_t = 0.0  # 多個來源串接時，讓 detect_for_video 的 timestamp 持續遞增
+    total_frames = 0
+    total_media_sec = 0.0
+    last_frame = None
+    t_start = time.monotonic()
+    last_progress_t = t_start
+
+    heat_out = open(heatmap_path, "w", encoding="utf-8") if heatmap_path else None
+    with open(out_path, "w", encoding="utf-8") as out:
+        for path in paths:
+            source = open_replay_source(path, fps)
+            print(f"[REPLAY] {source.name} ({source.fps:.1f} fps)")
+            last_t = 0.0
+            frame_idx = 0
+            frame_buf = None
+            debouncer = new_debouncer() if new_debouncer is not None else None
+            debounce_evaluation = DebounceEval(zone_map.zone_ids, PRINT_INTERVAL_SEC) if debounce_eval else None
+            heatmap = None
+            if heat_out is not None:
+                heatmap = create_heatmap_exporter(
+                    lambda payload, name=source.name: heat_out.write(json.dumps({"source": name, **payload}) + "\n"),
+                    to_epoch=None)
+            try:
+                while True:
+                    if probe is not None:
+                        probe.begin()
+                    ret, frame, t = source.read(frame_buf)
+                    if not ret:
+                        break
+                    if probe is not None:
+                        probe.captured(frame is frame_buf)
+                    last_t = t
+                    last_frame = frame
+                    if processor.buffers.enabled:
+                        frame_buf = frame
+
+                    frame, centers = processor(frame, base_t + t)
+                    h, w = frame.shape[:2]
+                    grid_state, _ = zone_map.occupancy(centers, w, h)
+                    if evaluation is not None:
+                        _, base_centers = baseline(frame, base_t + t)
+                        base_state, _ = zone_map.occupancy(base_centers, w, h)
+                        evaluation.update(base_centers, base_state, centers, grid_state)
+                    if heatmap is not None:
+                        heatmap.update(centers, w, h, t)
+                    row = {"source": source.name, "frame": frame_idx, "ts_ms": int(round(t * 1000))}
+                    if debouncer is not None:
+                        debouncer.update(grid_state, t)
+                        row["raw_on_cells"] = zone_map.on_zones(grid_state)
+                        if debounce_evaluation is not None:
+                            debounce_evaluation.update(t, grid_state, debouncer.state)
+                        grid_state = debouncer.state
+                    row["on_cells"] = zone_map.on_zones(grid_state)
+                    row["codes"] = [grid_id_to_code(i, grid_state[i] == 1) for i in zone_map.zone_ids]
+                    out.write(json.dumps(row) + "\n")
+                    frame_idx += 1
+                    if probe is not None:
+                        probe.end()
+
+                    now = time.monotonic()
+                    if now - last_progress_t >= REPLAY_PROGRESS_INTERVAL_SEC:
+                        last_progress_t = now
+                        print(f"[REPLAY] {source.name}: {frame_idx} frames")
+            finally:
+                source.release()
+
+            if debouncer is not None:
+                print(format_debounce_stats(debouncer))
+            if debounce_evaluation is not None:
+                print("[DEBOUNCE-EVAL]", json.dumps({"source": source.name, **debounce_evaluation.summary()}))
+            if heatmap is not None and frame_idx:
+                heatmap.export(last_t)
+                print(heatmap.format_stats())
+            total_frames += frame_idx
+            media_sec = frame_idx / source.fps
+            total_media_sec += media_sec
+            base_t += last_t + 1.0
+    if heat_out is not None:
+        heat_out.close()
+
+    elapsed = max(1e-6, time.monotonic() - t_start)
+    print(f"[REPLAY] Done: {total_frames} frames from {len(paths)} source(s) in {elapsed:.1f}s "
+          f"({total_frames / elapsed:.1f} fps, {total_media_sec / elapsed:.1f}x real time) -> {out_path}")
+    processor.print_stats()
+    print_alloc_report(probe, last_frame)
+    if evaluation is not None:
+        print("[EVAL]", json.dumps(evaluation.summary(baseline.model_calls, processor.model_calls)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Hand / person zone detector -> AWS IoT MQTT")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="capture / inference / render+publish on separate threads, latest-frame hand-off")
+    parser.add_argument("--zones", default=ZONES_PATH,
+                        help="zone layout JSON (grid rows/cols or polygons), default 3x3 grid")
+    parser.add_argument("--detector", choices=DETECTORS, default=DETECTOR,
+                        help="hand: MediaPipe HandLandmarker palm points; yolo: YOLO ONNX person foot points (cv2.dnn, CPU)")
+    parser.add_argument("--tiles", default=YOLO_TILES, metavar="RxC",
+                        help="yolo: split each frame into RxC overlapping tiles, inferred in one batch")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="skip / throttle inference while the scene is static and no hands are tracked")
+    parser.add_argument("--keyframe-every", type=int, default=0, metavar="N",
+                        help="run the detector every N frames and track its points with optical flow in between")
+    parser.add_argument("--track-eval", action="store_true",
+                        help="with --replay: also run an every-frame baseline and report the accuracy lost")
+    parser.add_argument("--enter", default=DEBOUNCE_ENTER, metavar="N/M",
+                        help="zone turns ON when N of the last M frames detect something in it")
+    parser.add_argument("--exit", default=DEBOUNCE_EXIT, metavar="N/M",
+                        help="zone turns OFF when N of the last M frames are empty")
+    parser.add_argument("--enter-hold", type=float, default=DEBOUNCE_ENTER_HOLD_SEC, metavar="SEC",
+                        help="and the ON condition has held for at least SEC seconds")
+    parser.add_argument("--exit-hold", type=float, default=DEBOUNCE_EXIT_HOLD_SEC, metavar="SEC",
+                        help="and the OFF condition has held for at least SEC seconds")
+    parser.add_argument("--no-debounce", action="store_true",
+                        help="old behaviour: publish the raw zone state sampled every PRINT_INTERVAL_SEC")
+    parser.add_argument("--debounce-eval", action="store_true",
+                        help="with --replay: compare messages / latency of debounced publishing with the old sampling")
+    parser.add_argument("--wire-format", choices=[WIRE_CODES, WIRE_FRAME], default=WIRE_CODES,
+                        help="codes: one zone*10+state message per change; frame: one occupancy bitmask per change")
+    parser.add_argument("--local-broker", action="store_true",
+                        help="publish to an in-process MQTT stand-in instead of AWS IoT and print what arrives")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="store-and-forward journal file: every transition is kept on disk until the broker acks it")
+    parser.add_argument("--journal-capacity", type=int, default=JOURNAL_CAPACITY,
+                        help="max transitions kept in the journal (oldest evicted first)")
+    parser.add_argument("--infer-width", type=int, default=INFER_WIDTH,
+                        help="hand: frame width fed to the landmarker (aspect kept, 0 = capture resolution)")
+    parser.add_argument("--display-width", type=int, default=DISPLAY_WIDTH,
+                        help="preview window width (aspect kept, 0 = capture resolution)")
+    parser.add_argument("--no-frame-buffers", action="store_true",
+                        help="let every cv2 call allocate its output (old behaviour, for comparison)")
+    parser.add_argument("--alloc-report", action="store_true",
+                        help="serial / replay: print steady-state per-frame allocation stats at exit")
+    parser.add_argument("--headless", action="store_true",
+                        help="no window, no overlays (production / servers without display)")
+    parser.add_argument("--replay", nargs="+", metavar="PATH",
+                        help="offline: video files, image directories or globs; implies headless, no MQTT")
+    parser.add_argument("--replay-fps", type=float, default=0.0,
+                        help="nominal fps for image directories / videos without fps metadata")
+    parser.add_argument("--out", default=REPLAY_OUTPUT_PATH,
+                        help="per-frame grid results (JSON Lines) for --replay")
+    parser.add_argument("--heatmap", action="store_true",
+                        help=f"publish a decayed, compressed density heatmap of all detection points to "
+                             f"{TOPIC}{HEATMAP_TOPIC_SUFFIX} every HEATMAP_EXPORT_SEC")
+    parser.add_argument("--heatmap-file", metavar="PATH",
+                        help="append the heatmap exports to PATH (JSON Lines); with --replay: per-source exports")
+    parser.add_argument("--sequential-startup", action="store_true",
+                        help="old startup order for comparison: model, then camera, then wait for MQTT; no warm-up "
+                             "(default: all three at once, results buffered until connected)")
+    args = parser.parse_args()
+    if args.journal and args.wire_format != WIRE_CODES:
+        parser.error("--journal forwards individual transitions; use it with --wire-format codes")
+    try:
+        parse_tiles(args.tiles)
+    except ValueError:
+        parser.error(f"--tiles expects RxC, e.g. 2x2 (got {args.tiles})")
+    for name in ("enter", "exit"):
+        try:
+            parse_n_of_m(getattr(args, name))
+        except ValueError:
+            parser.error(f"--{name} expects N/M with 1 <= N <= M (got {getattr(args, name)})")
+    if args.debounce_eval and args.no_debounce:
+        parser.error("--debounce-eval compares the debouncer with the old sampling; drop --no-debounce")
+    return args
+
+def main():
+    t_main = time.monotonic()
+    args = parse_args()
+
+    zone_map = load_zone_map(args.zones)
+    startup = None
+    mqtt_ready = threading.Event()
+    if args.replay:
+        detector = create_detector(args.detector, args.infer_width, args.tiles)
+    else:
+        startup = StartupTimer(STARTUP_T0)
+        startup.add_phase("imports", STARTUP_T0, t_main)
+        source, detector, mqtt_connection = start_edge(args, startup, mqtt_ready)
+    reuse = not args.no_frame_buffers
+    processor = FrameProcessor(
+        detector,
+        gate=MotionGate(reuse) if args.motion_gate else None,
+        tracker=PalmTracker(args.keyframe_every, reuse) if args.keyframe_every > 1 else None,
+        buffers=FrameBuffers(reuse),
+    )
+    probe = None
+    if args.alloc_report:
+        probe = AllocationProbe()
+        probe.watch(processor.buffers, *(m.buffers for m in (processor.gate, processor.tracker) if m is not None))
+
+    if args.replay:
+        baseline_detector = create_detector(args.detector, args.infer_width, args.tiles) if args.track_eval else None
+        baseline = None
+        if baseline_detector is not None:
+            baseline = FrameProcessor(baseline_detector, buffers=FrameBuffers(reuse))
+        try:
+            run_replay(processor, expand_source_paths(args.replay), zone_map, args.out, args.replay_fps,
+                       baseline=baseline, probe=probe, debounce_eval=args.debounce_eval,
+                       new_debouncer=None if args.no_debounce else lambda: create_debouncer(zone_map, vars(args)),
+                       heatmap_path=args.heatmap_file)
+        finally:
+            detector.close()
+            if baseline_detector is not None:
+                baseline_detector.close()
+        return
+
+    publisher = None
+    journal = None
+    if mqtt_connection is not None:
+        if args.journal:
+            journal = TransitionJournal(args.journal, args.journal_capacity)
+        publisher = build_publisher(mqtt_connection, zone_map, args.wire_format, journal=journal,
+                                    ready=mqtt_ready, on_first_publish=lambda: startup.mark("first_publish"))
+        # 報告等到第一則真的送出去（第一個確認的區域變化）；一直沒有就在結束時印
+        startup.wait_for.add("first_publish")
+    reporter = GridReporter(zone_map, publisher, create_debouncer(zone_map, vars(args)), startup)
+    heatmap = None
+    if args.heatmap or args.heatmap_file:
+        publish = heatmap_publisher(mqtt_connection, mqtt_ready) if args.heatmap and mqtt_connection is not None else None
+        heatmap = create_heatmap_exporter(publish, args.heatmap_file)
+
+    try:
+        if args.pipeline:
+            run_pipelined(processor, source, zone_map, reporter, headless=args.headless,
+                          display_width=args.display_width, heatmap=heatmap)
+        else:
+            run_serial(processor, source, zone_map, reporter, headless=args.headless,
+                       display_width=args.display_width, probe=probe, heatmap=heatmap)
+    except KeyboardInterrupt:
+        print("[MAIN] Interrupted.")
 
     finally:
-        cap.release()
-        cv2.destroyAllWindows()
-        landmarker.close()
-        if SEND_TO_AWS and mqtt_connection is not None:
+        source.release()
+        if not args.headless:
+            cv2.destroyAllWindows()
+        detector.close()
+        reporter.print_stats()
+        if heatmap is not None:
+            heatmap.export(time.monotonic())
+            heatmap.close()
+            print(heatmap.format_stats())
+        if publisher is not None:
+            publisher.close()
+            print(publisher.format_stats())
+        if journal is not None:
+            journal.close()
+        if mqtt_connection is not None and mqtt_ready.is_set():
             mqtt_disconnect(mqtt_connection)
+        startup.report_at_exit()
 
 if __name__ == "__main__":
     main()
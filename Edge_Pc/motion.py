@@ -0,0 +1,81 @@
+import cv2
+
+from framebuf import FrameBuffers
+
+# ===== Motion gate =====
+MOTION_WIDTH = 160              # 差分用的縮小寬度（像素）
+MOTION_PIXEL_DIFF = 25          # 灰階差超過此值算「有變化」的像素
+MOTION_AREA_RATIO = 0.003       # 變化像素比例超過此值算「有動作」
+ACTIVE_HOLD_SEC = 1.5           # 有動作 / 有偵測到手之後，維持全速推論的時間
+IDLE_MIN_INTERVAL_SEC = 0.25    # 靜止後第一次降速的推論間隔
+IDLE_MAX_INTERVAL_SEC = 2.0     # 長時間靜止時的最慢推論間隔（仍會定期確認畫面）
+
+
+class MotionGate:
+    """
+    Cheap pre-stage in front of the landmarker.
+    Frame differencing on a downscaled grayscale copy decides whether a frame needs inference:
+    - motion or hands seen within ACTIVE_HOLD_SEC -> infer every frame
+    - static and empty scene -> infer at an interval that doubles up to IDLE_MAX_INTERVAL_SEC
+    """
+
+    def __init__(self, reuse_buffers: bool = True):
+        self.buffers = FrameBuffers(reuse_buffers)
+        self.prev_small = None
+        self.last_active_t = None
+        self.last_infer_t = None
+        self.idle_interval = IDLE_MIN_INTERVAL_SEC
+        self.stats = {"frames": 0, "motion": 0, "inferred": 0, "skipped": 0}
+
+    def motion_ratio(self, frame) -> float:
+        h, w = frame.shape[:2]
+        small_h = max(1, int(h * MOTION_WIDTH / w))
+        buf = self.buffers
+        small = cv2.resize(frame, (MOTION_WIDTH, small_h), dst=buf.get("small", (small_h, MOTION_WIDTH, 3)),
+                           interpolation=cv2.INTER_AREA)
+        # 灰階兩塊緩衝輪流使用：這次寫入的不能是上一張
+        name = "gray1" if self.prev_small is buf.get("gray0", (small_h, MOTION_WIDTH)) else "gray0"
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=buf.get(name, (small_h, MOTION_WIDTH)))
+        prev, self.prev_small = self.prev_small, gray
+        if prev is None or prev.shape != gray.shape:
+            return 1.0
+        diff = cv2.absdiff(gray, prev, dst=buf.get("diff", gray.shape))
+        _, mask = cv2.threshold(diff, MOTION_PIXEL_DIFF, 255, cv2.THRESH_BINARY, dst=diff)
+        return cv2.countNonZero(mask) / mask.size
+
+    def should_infer(self, frame, t: float) -> bool:
+        self.stats["frames"] += 1
+        if self.motion_ratio(frame) >= MOTION_AREA_RATIO:
+            self.stats["motion"] += 1
+            self.last_active_t = t
+
+        active = self.last_active_t is not None and (t - self.last_active_t) < ACTIVE_HOLD_SEC
+        if active:
+            self.idle_interval = IDLE_MIN_INTERVAL_SEC
+            run = True
+        elif self.last_infer_t is None or (t - self.last_infer_t) >= self.idle_interval:
+            self.idle_interval = min(IDLE_MAX_INTERVAL_SEC, self.idle_interval * 2)
+            run = True
+        else:
+            run = False
+
+        if run:
+            self.stats["inferred"] += 1
+            self.last_infer_t = t
+        else:
+            self.stats["skipped"] += 1
+        return run
+
+    def observe(self, num_hands: int, t: float) -> None:
+        """Tracked hands keep the gate at full rate even if they hold still."""
+        if num_hands > 0:
+            self.last_active_t = t
+
+
+def format_gate_stats(gate: MotionGate) -> str:
+    st = gate.stats
+    frames = max(1, st["frames"])
+    return (
+        f"[GATE] frames={st['frames']} motion={st['motion']} inferred={st['inferred']} "
+        f"skipped={st['skipped']} ({st['skipped'] / frames * 100.0:.1f}% skipped)"
+    )
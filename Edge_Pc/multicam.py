@@ -0,0 +1,457 @@
+"""
+Multi-camera runner: one worker process per camera (each with its own detector),
+one publisher process that owns the single AWS IoT MQTT connection.
+With --batch-cameras (yolo detector) all cameras run in one worker instead: a capture thread
+per camera, and every round the newest frame of each camera goes through one batched
+forward pass (main.process_batch), which uses the CPU better than N separate small passes.
+
+Each worker debounces its zones (zone_filter.ZoneDebouncer, --enter / --exit) and sends a
+compact (camera_id, on_zone_ids) tuple over a multiprocessing queue as soon as a transition is
+confirmed, plus a resend every PRINT_INTERVAL_SEC (with --no-debounce: only the periodic
+sample of the raw state, as before); the publisher feeds it to one AsyncPublisher per camera, which
+publishes the usual zone*10+state codes (or occupancy frames) to f"{TOPIC}/{camera_id}".
+With --heatmap each worker also keeps a density heatmap of its detection points (heatmap.py)
+and sends its periodic export the same way; the publisher puts it on f"{TOPIC}/{camera_id}/heatmap".
+A worker (or the publisher) that dies is restarted on its own; the others keep running.
+Each worker opens its camera(s) while its detector loads and warms up, and the publisher connects
+in the background, buffering results until it is connected; every process prints its own
+[STARTUP] timing report.
+
+Run:
+    python multicam.py 0 1 2 3
+    python multicam.py 0 rtsp://192.168.1.20/stream --motion-gate
+    python multicam.py 0 1 2 3 --detector yolo --batch-cameras
+"""
+
+import argparse
+import multiprocessing
+import queue
+import threading
+import time
+
+import main as edge
+from journal import TransitionJournal
+from local_broker import LocalBroker
+from motion import MotionGate
+from pipeline import LatestQueue, capture_loop, new_pipeline_stats
+from publisher import WIRE_CODES, WIRE_FRAME
+from sources import CameraSource
+from startup import StartupTimer
+from tracker import PalmTracker
+from zone_filter import parse_n_of_m
+from zones import load_zone_map
+
+SUPERVISE_INTERVAL_SEC = 0.5
+RESTART_DELAY_SEC = 2.0
+RESULT_QUEUE_SIZE = 1024
+BATCH_WAIT_SEC = 0.05       # --batch-cameras：每輪等各攝影機新影格的上限，沒到的這輪就不放進 batch
+BATCH_WORKER = "cameras"
+
+
+def camera_topic(camera_id: str) -> str:
+    return f"{edge.TOPIC}/{camera_id}"
+
+
+def create_processor(detector, options: dict):
+    return edge.FrameProcessor(
+        detector,
+        gate=MotionGate() if options["motion_gate"] else None,
+        tracker=PalmTracker(options["keyframe_every"]) if options["keyframe_every"] > 1 else None,
+    )
+
+
+def open_camera(source_spec: str) -> CameraSource:
+    index = int(source_spec) if source_spec.isdigit() else source_spec
+    return CameraSource(index, low_latency=True)
+
+
+def open_cameras(source_specs) -> list:
+    """open_camera for each spec; on failure the ones already opened are released."""
+    sources = []
+    try:
+        for spec in source_specs:
+            sources.append(open_camera(spec))
+    except Exception:
+        for source in sources:
+            source.release()
+        raise
+    return sources
+
+
+class StateSender:
+    """
+    Sends ("state", camera_id, on_zones, t) without blocking: right away when the debouncer
+    confirms a transition, and at most every PRINT_INTERVAL_SEC otherwise.
+    t = the frame's capture time as epoch seconds (like GridReporter), so journal timestamps do
+    not include the queueing delay to the publisher process.
+    reported (multiprocessing Event) is set once the first state is in the queue (see Supervisor).
+    """
+
+    def __init__(self, camera_id: str, out_q, zone_map, debouncer=None, reported=None):
+        self.camera_id = camera_id
+        self.out_q = out_q
+        self.zone_map = zone_map
+        self.debouncer = debouncer
+        self.reported = reported
+        self.last_send_t = 0.0
+        self.dropped = 0
+
+    def update(self, grid_state, t_capture: float) -> None:
+        now = time.time()
+        changed = False
+        if self.debouncer is not None:
+            changed = bool(self.debouncer.update(grid_state, t_capture))
+            grid_state = self.debouncer.state
+        if not changed and now - self.last_send_t < edge.PRINT_INTERVAL_SEC:
+            return
+        self.last_send_t = now
+        try:
+            self.out_q.put_nowait(("state", self.camera_id, tuple(self.zone_map.on_zones(grid_state)),
+                                   edge.monotonic_to_epoch(t_capture)))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                print(f"[WORKER {self.camera_id}] Result queue full, dropped={self.dropped}")
+            return
+        if self.reported is not None and not self.reported.is_set():
+            self.reported.set()
+
+
+def create_heatmap(camera_id: str, out_q, options: dict):
+    """HeatmapExporter whose exports go to the publisher process (--heatmap) and / or PATH.<camera_id>."""
+    if not (options["heatmap"] or options["heatmap_file"]):
+        return None
+    publish = None
+    if options["heatmap"]:
+        # 佇列滿時 put_nowait 丟出 queue.Full，由 exporter 記為 error，等下一次匯出
+        publish = lambda payload: out_q.put_nowait(("heat", camera_id, payload))
+    path = f"{options['heatmap_file']}.{camera_id}" if options["heatmap_file"] else None
+    return edge.create_heatmap_exporter(publish, path)
+
+
+def camera_worker(camera_id: str, source_spec: str, options: dict, out_q, stop, reported=None):
+    """Worker process: capture -> detect -> zones, sends ("state", camera_id, on_zones, t)."""
+    zone_map = load_zone_map(options["zones"])
+    startup = StartupTimer(edge.STARTUP_T0, tag=f"STARTUP {camera_id}")
+    source, detector = edge.open_source_with_detector(lambda: open_camera(source_spec), options["detector"],
+                                                      options["infer_width"], options["tiles"], startup)
+    processor = create_processor(detector, options)
+    sender = StateSender(camera_id, out_q, zone_map, edge.create_debouncer(zone_map, options), reported)
+    heatmap = create_heatmap(camera_id, out_q, options)
+    print(f"[WORKER {camera_id}] Started on {source.name} ({detector.name})")
+
+    frame = None
+    try:
+        while not stop.is_set():
+            # 影格不離開這個行程，直接解碼進上一張的陣列
+            ret, frame, t_capture = source.read(frame)
+            if not ret:
+                raise RuntimeError(f"{camera_id}: camera read failed")
+
+            frame, centers = processor(frame, t_capture)
+            h, w = frame.shape[:2]
+            grid_state, _ = zone_map.occupancy(centers, w, h)
+            sender.update(grid_state, t_capture)
+            if not startup.reported:
+                startup.mark("first_frame", t_capture)
+                startup.mark("first_detection")
+            if heatmap is not None:
+                heatmap.update(centers, w, h, t_capture)
+    finally:
+        source.release()
+        detector.close()
+        if heatmap is not None:
+            heatmap.close()
+        startup.report_at_exit()
+
+
+def batch_worker(cameras, options: dict, out_q, stop, reported=None):
+    """
+    --batch-cameras: every camera in this one process, one detector. Each round takes the
+    newest frame of every camera (waiting at most BATCH_WAIT_SEC each) and runs them as one
+    batch; each camera keeps its own gate / tracker / zone state.
+    """
+    zone_map = load_zone_map(options["zones"])
+    startup = StartupTimer(edge.STARTUP_T0, tag=f"STARTUP {BATCH_WORKER}")
+    sources, detector = edge.open_source_with_detector(lambda: open_cameras([spec for _, spec in cameras]),
+                                                       options["detector"], options["infer_width"],
+                                                       options["tiles"], startup)
+    capture_stop = threading.Event()
+    streams = []    # (camera_id, source, LatestQueue, FrameProcessor, StateSender, HeatmapExporter or None)
+    threads = []
+    try:
+        for (camera_id, _), source in zip(cameras, sources):
+            q = LatestQueue(maxsize=1)
+            sender = StateSender(camera_id, out_q, zone_map, edge.create_debouncer(zone_map, options),
+                                 reported[camera_id] if reported is not None else None)
+            streams.append((camera_id, source, q, create_processor(detector, options), sender,
+                            create_heatmap(camera_id, out_q, options)))
+            t = threading.Thread(target=capture_loop, args=(source, q, capture_stop, new_pipeline_stats()),
+                                 name=f"capture-{camera_id}", daemon=True)
+            t.start()
+            threads.append(t)
+            print(f"[WORKER {camera_id}] Started on {source.name} (batched {detector.name})")
+
+        while not stop.is_set():
+            batch = []
+            for camera_id, _, q, processor, sender, heatmap in streams:
+                item = q.get(timeout=BATCH_WAIT_SEC)
+                if item is None:
+                    if q.closed:
+                        raise RuntimeError(f"{camera_id}: camera read failed")
+                    continue
+                batch.append((item, processor, sender, heatmap))
+            if not batch:
+                continue
+
+            centers = edge.process_batch([b[1] for b in batch], [b[0].frame for b in batch],
+                                         [b[0].t_capture for b in batch])
+            for (item, _, sender, heatmap), c in zip(batch, centers):
+                h, w = item.frame.shape[:2]
+                grid_state, _ = zone_map.occupancy(c, w, h)
+                sender.update(grid_state, item.t_capture)
+                if heatmap is not None:
+                    heatmap.update(c, w, h, item.t_capture)
+            if not startup.reported:
+                startup.mark("first_frame", batch[0][0].t_capture)
+                startup.mark("first_detection")
+    finally:
+        capture_stop.set()
+        for t in threads:
+            t.join(timeout=2.0)
+        for source in sources:
+            source.release()
+        for stream in streams:
+            if stream[5] is not None:
+                stream[5].close()
+        detector.close()
+        startup.report_at_exit()
+
+
+def publisher_worker(in_q, options: dict, stop):
+    """Publisher process: the only MQTT connection, one AsyncPublisher (per-camera topic) per camera."""
+    zone_map = load_zone_map(options["zones"])
+    startup = StartupTimer(edge.STARTUP_T0, wait_for=("mqtt_connect", "first_publish"),
+                           tag="STARTUP publisher")
+    ready = threading.Event()
+    if options["local_broker"]:
+        mqtt_connection = LocalBroker()
+        mqtt_connection.subscribe(edge.TOPIC + "/#", None, edge.print_local_message)
+        edge.connect_until_ready(mqtt_connection, ready, startup)
+    else:
+        # 背景連線：worker 的結果先進各 AsyncPublisher 的佇列，連上後才送
+        mqtt_connection = startup.timed("mqtt_build", edge.build_mqtt_connection)
+        threading.Thread(target=edge.connect_until_ready, args=(mqtt_connection, ready, startup),
+                         name="mqtt-connect", daemon=True).start()
+
+    publishers = {}  # camera_id -> AsyncPublisher
+    journals = []
+    try:
+        while not stop.is_set():
+            try:
+                msg = in_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            kind, camera_id = msg[0], msg[1]
+            if kind == "heat":
+                if not ready.is_set():
+                    continue
+                try:
+                    edge.mqtt_publish_payload(mqtt_connection, msg[2], edge.heatmap_topic(camera_topic(camera_id)))
+                except Exception as e:
+                    print(f"[PUB] {camera_id} heatmap publish error:", repr(e))
+                continue
+            pub = publishers.get(camera_id)
+            if pub is None:
+                journal = None
+                if options["journal"]:
+                    journal = TransitionJournal(f"{options['journal']}.{camera_id}")
+                    journals.append(journal)
+                # resync：先送一則完整狀態的 frame。這個行程可能是重啟的 publisher，不知道之前送過什麼，
+                # 它掛掉期間轉成 OFF 的區域只靠差異永遠送不出去
+                pub = edge.build_publisher(mqtt_connection, zone_map, options["wire_format"],
+                                           topic=camera_topic(camera_id), journal=journal, ready=ready,
+                                           on_first_publish=lambda: startup.mark("first_publish"), resync=True)
+                publishers[camera_id] = pub
+            # worker 重啟（reset）：把它原本亮著的區域送 OFF
+            if kind == "reset":
+                pub.submit(())
+            else:
+                pub.submit(msg[2], msg[3])
+    finally:
+        for pub in publishers.values():
+            pub.close()
+        for journal in journals:
+            journal.close()
+        if ready.is_set():
+            edge.mqtt_disconnect(mqtt_connection)
+        startup.report_at_exit()
+
+
+class Supervisor:
+    """Starts the workers and the publisher, restarts whichever one exits."""
+
+    def __init__(self, cameras, options: dict):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.results = self.ctx.Queue(maxsize=RESULT_QUEUE_SIZE)
+        self.stop = self.ctx.Event()
+        self.cameras = cameras          # list of (camera_id, source_spec)
+        self.options = options
+        self.procs = {}                 # name -> Process
+        self.restart_at = {}            # name -> monotonic time
+        self.restarts = {}
+        self.pending_resets = []        # camera_ids whose reset did not fit in the results queue yet
+        # camera_id -> Event set by its worker once it has queued its first state
+        self.reported = {camera_id: self.ctx.Event() for camera_id, _ in cameras}
+
+    def _spawn(self, name: str):
+        if name == "publisher":
+            target, args = publisher_worker, (self.results, self.options, self.stop)
+        elif name == BATCH_WORKER:
+            target, args = batch_worker, (self.cameras, self.options, self.results, self.stop, self.reported)
+        else:
+            spec = dict(self.cameras)[name]
+            target, args = camera_worker, (name, spec, self.options, self.results, self.stop, self.reported[name])
+        proc = self.ctx.Process(target=target, args=args, name=name, daemon=True)
+        proc.start()
+        self.procs[name] = proc
+
+    def run(self):
+        self._spawn("publisher")
+        if self.options["batch_cameras"]:
+            self._spawn(BATCH_WORKER)
+        else:
+            for camera_id, _ in self.cameras:
+                self._spawn(camera_id)
+
+        while True:
+            time.sleep(SUPERVISE_INTERVAL_SEC)
+            now = time.monotonic()
+            for name, proc in list(self.procs.items()):
+                if proc.is_alive():
+                    continue
+                if name not in self.restart_at:
+                    print(f"[SUP] {name} exited (code={proc.exitcode}), restarting in {RESTART_DELAY_SEC}s")
+                    self.restart_at[name] = now + RESTART_DELAY_SEC
+                    if name == "publisher":
+                        self._release_results_lock()
+                    elif name == BATCH_WORKER:
+                        self._queue_resets([camera_id for camera_id, _ in self.cameras])
+                    else:
+                        self._queue_resets([name])
+                elif now >= self.restart_at[name]:
+                    del self.restart_at[name]
+                    self.restarts[name] = self.restarts.get(name, 0) + 1
+                    self._spawn(name)
+            self._flush_resets()
+
+    def _release_results_lock(self) -> None:
+        # publisher 在 get() 裡被強制結束（SIGKILL、原生程式碼 segfault）時，佇列的讀取鎖不會被釋放，
+        # 重啟的 publisher 就永遠卡在 get()。publisher 是唯一的讀取端，它死掉之後鎖若仍被佔用，一定是它留下的
+        lock = self.results._rlock
+        lock.acquire(block=False)
+        lock.release()
+
+    def _queue_resets(self, camera_ids) -> None:
+        for camera_id in camera_ids:
+            self.reported[camera_id].clear()
+            if camera_id not in self.pending_resets:
+                self.pending_resets.append(camera_id)
+        self._flush_resets()
+
+    def _flush_resets(self) -> None:
+        # 新的 worker 已經送出完整狀態的攝影機，reset 留到現在只會蓋掉它，不送了；
+        # 還沒送出（例如開不了攝影機）的就一直保留，直到送進佇列
+        self.pending_resets = [c for c in self.pending_resets if not self.reported[c].is_set()]
+        # 不能阻塞：publisher 死掉 / 重啟中時佇列可能是滿的，卡住就沒有人重啟它了；下一輪再試
+        while self.pending_resets:
+            try:
+                self.results.put_nowait(("reset", self.pending_resets[0]))
+            except queue.Full:
+                return
+            self.pending_resets.pop(0)
+
+    def shutdown(self):
+        self.stop.set()
+        for proc in self.procs.values():
+            proc.join(timeout=3.0)
+            if proc.is_alive():
+                proc.terminate()
+        if self.restarts:
+            print("[SUP] Restarts:", self.restarts)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Multi-camera zone detector with one MQTT publisher")
+    parser.add_argument("sources", nargs="+", help="camera indexes or stream URLs, one worker each")
+    parser.add_argument("--zones", default=edge.ZONES_PATH)
+    parser.add_argument("--detector", choices=edge.DETECTORS, default=edge.DETECTOR)
+    parser.add_argument("--tiles", default=edge.YOLO_TILES, metavar="RxC")
+    parser.add_argument("--batch-cameras", action="store_true",
+                        help="one worker for all cameras, their frames batched into one forward pass (yolo)")
+    parser.add_argument("--motion-gate", action="store_true")
+    parser.add_argument("--keyframe-every", type=int, default=0, metavar="N")
+    parser.add_argument("--infer-width", type=int, default=edge.INFER_WIDTH)
+    parser.add_argument("--wire-format", choices=[WIRE_CODES, WIRE_FRAME], default=WIRE_CODES)
+    parser.add_argument("--local-broker", action="store_true")
+    parser.add_argument("--journal", metavar="PATH", help="per-camera journal files PATH.<camera_id>")
+    parser.add_argument("--enter", default=edge.DEBOUNCE_ENTER, metavar="N/M")
+    parser.add_argument("--exit", default=edge.DEBOUNCE_EXIT, metavar="N/M")
+    parser.add_argument("--enter-hold", type=float, default=edge.DEBOUNCE_ENTER_HOLD_SEC, metavar="SEC")
+    parser.add_argument("--exit-hold", type=float, default=edge.DEBOUNCE_EXIT_HOLD_SEC, metavar="SEC")
+    parser.add_argument("--no-debounce", action="store_true",
+                        help="send the raw zone state every PRINT_INTERVAL_SEC instead of debounced transitions")
+    parser.add_argument("--heatmap", action="store_true",
+                        help="publish each camera's detection heatmap to <camera topic>/heatmap")
+    parser.add_argument("--heatmap-file", metavar="PATH", help="per-camera heatmap exports PATH.<camera_id>")
+    args = parser.parse_args()
+    if args.journal and args.wire_format != WIRE_CODES:
+        parser.error("--journal forwards individual transitions; use it with --wire-format codes")
+    if args.batch_cameras and args.detector != "yolo":
+        # landmarker 的 VIDEO mode 一次一張、每支攝影機要自己的 timestamp，批次沒有好處
+        parser.error("--batch-cameras needs --detector yolo")
+    for name in ("enter", "exit"):
+        try:
+            parse_n_of_m(getattr(args, name))
+        except ValueError:
+            parser.error(f"--{name} expects N/M with 1 <= N <= M (got {getattr(args, name)})")
+    return args
+
+
+def main():
+    args = parse_args()
+    cameras = [(f"cam-{i + 1:03d}", spec) for i, spec in enumerate(args.sources)]
+    options = {
+        "zones": args.zones,
+        "detector": args.detector,
+        "tiles": args.tiles,
+        "batch_cameras": args.batch_cameras,
+        "motion_gate": args.motion_gate,
+        "keyframe_every": args.keyframe_every,
+        "infer_width": args.infer_width,
+        "wire_format": args.wire_format,
+        "local_broker": args.local_broker,
+        "journal": args.journal,
+        "no_debounce": args.no_debounce,
+        "enter": args.enter,
+        "exit": args.exit,
+        "enter_hold": args.enter_hold,
+        "exit_hold": args.exit_hold,
+        "heatmap": args.heatmap,
+        "heatmap_file": args.heatmap_file,
+    }
+    for camera_id, spec in cameras:
+        print(f"[SUP] {camera_id} <- {spec} -> {camera_topic(camera_id)}")
+
+    supervisor = Supervisor(cameras, options)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        print("[SUP] Interrupted.")
+    finally:
+        supervisor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
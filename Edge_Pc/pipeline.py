@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+# 擷取執行緒送出的影格：seq 遞增編號、t_capture 為 time.monotonic() 擷取時間
+CapturedFrame = namedtuple("CapturedFrame", "seq t_capture frame")
+# 推論執行緒送出的結果：frame 為原始（未鏡像）影格，centers 為鏡像後的掌心像素座標 list[(cx, cy)]
+DetectionResult = namedtuple("DetectionResult", "seq t_capture frame centers")
+
+
+class LatestQueue:
+    """
+    Bounded hand-off queue that keeps only the newest items.
+    put() never blocks: when full, the oldest item is discarded and counted in `dropped`
+    (and handed to on_drop, e.g. to return its frame to a FramePool).
+    """
+
+    def __init__(self, maxsize: int = 1, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item) -> None:
+        old = None
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                old = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        if old is not None and self.on_drop is not None:
+            self.on_drop(old)
+
+    def get(self, timeout=None):
+        """Returns the oldest pending item, or None on timeout / when closed and empty."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._items and not self._closed:
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        with self._cond:
+            return self._closed and not self._items
+
+
+class _Stage:
+    __slots__ = ("samples", "t0")
+
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.t0)
+
+
+class _NullStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+class StageTimer:
+    """
+    Per-stage durations (seconds) for benchmarking: `with timer.stage("inference"): ...`.
+    NULL_TIMER is the default everywhere and records nothing.
+    """
+
+    def __init__(self):
+        self.samples = {}   # stage name -> list of durations, in first-seen order
+
+    def stage(self, name: str):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = []
+        return _Stage(samples)
+
+    def reset(self) -> None:
+        self.samples = {}
+
+
+class _NullTimer:
+    _stage = _NullStage()
+
+    def stage(self, name: str):
+        return self._stage
+
+
+NULL_TIMER = _NullTimer()
+
+
+def new_pipeline_stats():
+    return {
+        "captured": 0,
+        "inferred": 0,
+        "rendered": 0,
+        "latency_sum": 0.0,
+        "latency_max": 0.0,
+        "started_at": time.monotonic(),
+    }
+
+
+def capture_loop(source, out_q: LatestQueue, stop: threading.Event, stats, pool=None):
+    """
+    Stage 1: read frames as fast as the source delivers them, stamped with the capture time.
+    With a FramePool the source decodes into a recycled frame instead of a new array.
+    """
+    seq = 0
+    try:
+        while not stop.is_set():
+            ret, frame, t_capture = source.read(pool.acquire() if pool is not None else None)
+            if not ret:
+                break
+            seq += 1
+            stats["captured"] += 1
+            out_q.put(CapturedFrame(seq, t_capture, frame))
+    finally:
+        out_q.close()
+
+
+def inference_loop(process, in_q: LatestQueue, out_q: LatestQueue, stop: threading.Event, stats):
+    """
+    Stage 2: run `process(frame, t_capture) -> (frame, centers)` on the newest captured frame.
+    Frames that arrived while the model was busy are dropped by in_q.
+    """
+    try:
+        while not stop.is_set():
+            item = in_q.get(timeout=0.5)
+            if item is None:
+                if in_q.closed:
+                    break
+                continue
+            frame, centers = process(item.frame, item.t_capture)
+            stats["inferred"] += 1
+            out_q.put(DetectionResult(item.seq, item.t_capture, frame, centers))
+    finally:
+        out_q.close()
+
+
+def record_latency(stats, t_capture: float) -> None:
+    """Glass-to-output latency of one rendered/published result."""
+    lat = time.monotonic() - t_capture
+    stats["rendered"] += 1
+    stats["latency_sum"] += lat
+    stats["latency_max"] = max(stats["latency_max"], lat)
+
+
+def format_pipeline_stats(stats, capture_q: LatestQueue, result_q: LatestQueue) -> str:
+    elapsed = max(1e-6, time.monotonic() - stats["started_at"])
+    rendered = stats["rendered"]
+    avg_ms = (stats["latency_sum"] / rendered * 1000.0) if rendered else 0.0
+    return (
+        f"[PIPE] captured={stats['captured']} ({stats['captured'] / elapsed:.1f} fps) "
+        f"inferred={stats['inferred']} ({stats['inferred'] / elapsed:.1f} fps) "
+        f"rendered={rendered} | dropped: capture->infer={capture_q.dropped} "
+        f"infer->render={result_q.dropped} | latency avg={avg_ms:.1f}ms "
+        f"max={stats['latency_max'] * 1000.0:.1f}ms"
+    )
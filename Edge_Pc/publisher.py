@@ -0,0 +1,223 @@
+import threading
+import time
+
+WIRE_CODES = "codes"    # 原本格式：每個變化的區域一則 zone*10+state
+WIRE_FRAME = "frame"    # 精簡格式：每次變化一則整體佔用 bitmask，例如 "b9:101" = 9 區中第 1、9 區 ON
+FRAME_RESYNC_SEC = 10.0  # frame 模式下即使沒變化也定期重送，讓訂閱端自我校正
+RETRY_INTERVAL_SEC = 1.0
+
+# ===== Journal (store-and-forward) =====
+JOURNAL_LIVE_MAX = 8                # backlog 不超過這個數量時逐則送出（正常運作）
+JOURNAL_BATCH_SIZE = 500            # 斷線後補送：每則訊息最多帶幾筆 transition
+JOURNAL_REPLAY_MSGS_PER_SEC = 20.0  # 補送時的速率上限
+ACK_TIMEOUT_SEC = 5.0               # 等 broker PUBACK 的時間，逾時視為失敗、稍後重送
+JOURNAL_FLUSH_SEC = 1.0
+
+
+def encode_occupancy_frame(on_zones, zone_count: int) -> str:
+    """ "b<zone_count>:<hex mask>", bit (z - 1) set for every ON zone z."""
+    mask = 0
+    for z in on_zones:
+        mask |= 1 << (z - 1)
+    return f"b{zone_count}:{mask:x}"
+
+
+def decode_occupancy_frame(payload: str):
+    """Inverse of encode_occupancy_frame: {zone: 0/1} for zones 1..zone_count, or None."""
+    if not payload.startswith("b") or ":" not in payload:
+        return None
+    count, _, mask = payload[1:].partition(":")
+    try:
+        count, mask = int(count), int(mask, 16)
+    except ValueError:
+        return None
+    return {z: (mask >> (z - 1)) & 1 for z in range(1, count + 1)}
+
+
+class AsyncPublisher:
+    """
+    Publishes zone occupancy from a background thread so the render loop never waits on MQTT.
+
+    The caller hands over the full set of ON zones each tick (submit). Only the newest desired
+    state per zone is kept, so the "queue" is bounded by the number of zones: a zone that flips
+    ON->OFF->ON between two sends costs nothing. Sends that raise are retried every RETRY_INTERVAL_SEC.
+
+    With a TransitionJournal every transition is instead appended to the journal at submit time
+    (with its capture timestamp) and the thread forwards the journal: one JSON message per
+    transition while live, large rate-limited batches after an outage, then a resync frame.
+
+    With a `ready` event (set once the connection is up) nothing is sent before it is set: results
+    submitted during startup only update the desired state (or the journal), and the newest state
+    goes out as soon as the broker is reachable.
+
+    With resync=True the first send is one occupancy frame of the whole state, diffs only after it:
+    a publisher that replaces another one (multicam's respawned publisher process) does not know
+    what was published before, and a zone that went OFF in between would otherwise stay ON.
+    """
+
+    def __init__(self, mqtt_connection, topic: str, zone_ids, wire_format: str = WIRE_CODES,
+                 publish_fn=None, journal=None, verbose: bool = True, ready: threading.Event = None,
+                 on_first_publish=None, resync: bool = False):
+        self.mqtt_connection = mqtt_connection
+        self.topic = topic
+        self.zone_ids = list(zone_ids)
+        self.zone_count = max(self.zone_ids)
+        self.wire_format = wire_format
+        # publish_fn(connection, payload, topic)，由呼叫端傳入（main.mqtt_publish_payload）
+        self.publish_fn = publish_fn
+        self.journal = journal
+        self.verbose = verbose  # False：不逐則印出 "[MQTT] Published"（benchmark 用）
+        self.ready = ready
+        self.on_first_publish = on_first_publish  # 第一則成功送出時呼叫一次（啟動計時用）
+        self.stats = {"ticks": 0, "coalesced": 0, "published": 0, "errors": 0, "replayed": 0, "buffered": 0}
+
+        self._cond = threading.Condition()
+        self._desired = frozenset()
+        self._published = frozenset()
+        self._dirty = False
+        self._last_frame_t = 0.0
+        self._last_flush_t = 0.0
+        self._submitted = frozenset()
+        self._resync = resync
+        self._baseline = resync     # journal：第一次 submit 只當基準（狀態由 resync frame 送出）
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="mqtt-publisher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, on_zones, ts: float = None) -> None:
+        """on_zones: all zones ON at this tick; ts: capture time (epoch sec), used by the journal."""
+        on_zones = frozenset(on_zones)
+        with self._cond:
+            self.stats["ticks"] += 1
+            if self.ready is not None and not self.ready.is_set():
+                self.stats["buffered"] += 1
+            if self._dirty:
+                self.stats["coalesced"] += 1
+            if self.journal is not None and self._baseline:
+                self._submitted = on_zones
+                self._baseline = False
+            elif self.journal is not None:
+                ts = time.time() if ts is None else ts
+                for z in sorted(on_zones - self._submitted):
+                    self.journal.append(ts, z, 1)
+                for z in sorted(self._submitted - on_zones):
+                    self.journal.append(ts, z, 0)
+                self._submitted = on_zones
+            self._desired = on_zones
+            self._dirty = True
+            self._cond.notify()
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Flush what is pending, then stop the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def format_stats(self) -> str:
+        st = self.stats
+        text = (f"[PUB] ticks={st['ticks']} coalesced={st['coalesced']} "
+                f"published={st['published']} errors={st['errors']}")
+        if st["buffered"]:
+            text += f" buffered_before_connect={st['buffered']}"
+        if self.journal is not None:
+            text += (f" | journal backlog={self.journal.backlog} replayed={st['replayed']} "
+                     f"evicted={self.journal.evicted}")
+        return text
+
+    # ===== Worker thread =====
+    def _run(self):
+        while True:
+            if self.ready is not None and not self.ready.wait(RETRY_INTERVAL_SEC):
+                # 還沒連上：submit 照常更新 desired / journal，連上後再送
+                if self._stopping:
+                    break
+                continue
+            with self._cond:
+                if not self._dirty and not self._stopping:
+                    self._cond.wait(RETRY_INTERVAL_SEC)
+                desired, stopping = self._desired, self._stopping
+                self._dirty = False
+
+            try:
+                self._send(desired)
+            except Exception as e:
+                # _published 只記錄成功送出的部分，RETRY_INTERVAL_SEC 後會再比對重送
+                self.stats["errors"] += 1
+                print("[MQTT] Publish error:", repr(e))
+
+            if self.journal is not None and time.monotonic() - self._last_flush_t >= JOURNAL_FLUSH_SEC:
+                self._last_flush_t = time.monotonic()
+                self.journal.flush()
+
+            if stopping:
+                break
+
+    def _publish(self, payload, wait: bool = False):
+        future = self.publish_fn(self.mqtt_connection, payload, self.topic)
+        if wait and future is not None:
+            future.result(timeout=ACK_TIMEOUT_SEC)
+        self.stats["published"] += 1
+        if self.stats["published"] == 1 and self.on_first_publish is not None:
+            self.on_first_publish()
+        if not self.verbose:
+            return
+        if isinstance(payload, dict) and "batch" in payload:
+            payload = f"batch of {len(payload['batch'])} transitions"
+        print(f"[MQTT] Published: {payload}")
+
+    def _send(self, desired: frozenset):
+        if self.journal is not None:
+            self._forward_journal(desired)
+            return
+
+        if self._resync:
+            self._publish(encode_occupancy_frame(sorted(desired), self.zone_count))
+            self._published = desired
+            self._last_frame_t = time.monotonic()
+            self._resync = False
+            return
+
+        if self.wire_format == WIRE_FRAME:
+            now = time.monotonic()
+            if desired != self._published or now - self._last_frame_t >= FRAME_RESYNC_SEC:
+                self._publish(encode_occupancy_frame(sorted(desired), self.zone_count))
+                self._published = desired
+                self._last_frame_t = now
+            return
+
+        # 先送新 ON、再送 OFF（與原本順序相同）；每送成功一則就記下，失敗時只重送剩下的
+        for z in sorted(desired - self._published):
+            self._publish(z * 10 + 1)
+            self._published = self._published | {z}
+        for z in sorted(self._published - desired):
+            self._publish(z * 10)
+            self._published = self._published - {z}
+
+    def _forward_journal(self, desired: frozenset):
+        """Publishes journal records oldest-first; a record is acked only after the broker's PUBACK."""
+        journal, jid = self.journal, self.journal.jid
+        replaying = False
+        while journal.backlog:
+            if journal.backlog <= JOURNAL_LIVE_MAX and not replaying:
+                rec = journal.pending(1)[0]
+                self._publish({"zone": rec.zone, "state": rec.state, "ts": round(rec.ts, 3),
+                               "seq": rec.seq, "jid": jid}, wait=True)
+                journal.ack(rec.seq + 1)
+                continue
+
+            replaying = True
+            recs = journal.pending(JOURNAL_BATCH_SIZE)
+            self._publish({"jid": jid, "batch": [[r.seq, round(r.ts, 3), r.zone, r.state] for r in recs]},
+                          wait=True)
+            journal.ack(recs[-1].seq + 1)
+            self.stats["replayed"] += len(recs)
+            time.sleep(1.0 / JOURNAL_REPLAY_MSGS_PER_SEC)
+
+        if replaying or self._resync:
+            # 補送完畢（或 resync）後送一則目前狀態的 frame：ESP8266 只看得懂這個，Dashboard 端是 no-op
+            self._publish(encode_occupancy_frame(sorted(desired), self.zone_count))
+            self._resync = False
@@ -0,0 +1,102 @@
+import glob
+import os
+import time
+
+import cv2
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp"}
+DEFAULT_REPLAY_FPS = 30.0
+
+
+class CameraSource:
+    """Live camera. Timestamps are the wall-clock capture time (time.monotonic())."""
+
+    live = True
+
+    def __init__(self, index=0, low_latency: bool = False):
+        # index: 裝置編號 (int) 或串流網址 (rtsp://...)
+        self.name = f"camera:{index}"
+        self.cap = cv2.VideoCapture(index)
+        if not self.cap.isOpened():
+            raise RuntimeError("無法開啟攝影機")
+        if low_latency:
+            # 盡量不要讓驅動累積舊影格
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def read(self, out=None):
+        # out: 上一張影格的陣列，尺寸相同時 VideoCapture 直接寫入，不另外配置
+        ret, frame = self.cap.read(out)
+        return ret, frame, time.monotonic()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource:
+    """Recorded video. Timestamps are frame_index / fps, so replay speed does not affect them."""
+
+    live = False
+
+    def __init__(self, path: str, fps: float = 0.0):
+        self.name = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"無法開啟影片: {path}")
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_REPLAY_FPS
+        self.index = 0
+
+    def read(self, out=None):
+        ret, frame = self.cap.read(out)
+        t = self.index / self.fps
+        if ret:
+            self.index += 1
+        return ret, frame, t
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource:
+    """Directory of still images, read in file-name order at a fixed nominal fps."""
+
+    live = False
+
+    def __init__(self, path: str, fps: float = 0.0):
+        self.name = path
+        self.fps = fps or DEFAULT_REPLAY_FPS
+        self.files = sorted(
+            os.path.join(path, f) for f in os.listdir(path)
+            if os.path.splitext(f)[1].lower() in IMAGE_EXTS
+        )
+        if not self.files:
+            raise RuntimeError(f"資料夾內沒有圖片: {path}")
+        self.index = 0
+
+    def read(self, out=None):
+        # imread 無法寫入既有陣列，out 忽略
+        while self.index < len(self.files):
+            frame = cv2.imread(self.files[self.index])
+            t = self.index / self.fps
+            self.index += 1
+            if frame is not None:
+                return True, frame, t
+            print("[SRC] Skip unreadable image:", self.files[self.index - 1])
+        return False, None, self.index / self.fps
+
+    def release(self):
+        pass
+
+
+def expand_source_paths(patterns):
+    """Expands globs; keeps directories and files as individual replay sources."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        paths.extend(matches)
+    return paths
+
+
+def open_replay_source(path: str, fps: float = 0.0):
+    if os.path.isdir(path):
+        return ImageDirSource(path, fps)
+    return VideoFileSource(path, fps)
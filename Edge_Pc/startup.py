@@ -0,0 +1,107 @@
+"""
+Startup phase timing for the edge processes.
+
+Every time is in seconds since t0 (main.STARTUP_T0, taken before the heavy imports). Phases are
+(start, end) spans (imports, camera_open, model_load, warmup, mqtt_connect), which may overlap
+when they run concurrently; marks are single moments, recorded the first time only
+(first_frame = capture time of the first processed frame, first_detection = its zone result,
+first_publish = first successful MQTT publish).
+
+Each phase / mark is printed when it completes, and the whole report once every name in
+`wait_for` is in (e.g. first_detection + first_publish when there is a publisher), or at exit.
+Lines are written whole under one lock, so reports from several threads never share a line.
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_print_lock = threading.Lock()
+
+
+def _print_line(text: str) -> None:
+    # 一次寫入整行：print() 會把文字和換行分開寫，同時輸出時會黏在一起
+    with _print_lock:
+        sys.stdout.write(text + "\n")
+        sys.stdout.flush()
+
+
+class StartupTimer:
+    def __init__(self, t0: float = None, wait_for=("first_detection",), tag: str = "STARTUP"):
+        self.t0 = time.monotonic() if t0 is None else t0
+        self.wait_for = set(wait_for)
+        self.tag = tag
+        self.phases = {}        # name -> (start, end)
+        self.marks = {}         # name -> t
+        self.reported = False
+        self._lock = threading.Lock()
+
+    def _rel(self, t: float = None) -> float:
+        return round((time.monotonic() if t is None else t) - self.t0, 3)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = self._rel()
+        try:
+            yield
+        finally:
+            end = self._rel()
+            with self._lock:
+                self.phases[name] = (start, end)
+            _print_line(f"[{self.tag}] {name} {end - start:.3f}s (+{start:.3f}s -> +{end:.3f}s)")
+            self._check()
+
+    def timed(self, name: str, fn, *args, **kwargs):
+        with self.phase(name):
+            return fn(*args, **kwargs)
+
+    def add_phase(self, name: str, start: float, end: float = None) -> None:
+        """A phase measured by the caller (monotonic start / end)."""
+        with self._lock:
+            self.phases[name] = (self._rel(start), self._rel(end))
+        start, end = self.phases[name]
+        _print_line(f"[{self.tag}] {name} {end - start:.3f}s (+{start:.3f}s -> +{end:.3f}s)")
+        self._check()
+
+    def mark(self, name: str, t: float = None) -> None:
+        """Records `name` at t (monotonic, default now) the first time only."""
+        if name in self.marks:
+            return
+        with self._lock:
+            if name in self.marks:
+                return
+            self.marks[name] = self._rel(t)
+        _print_line(f"[{self.tag}] {name} at +{self.marks[name]:.3f}s")
+        self._check()
+
+    def _done(self, name: str) -> bool:
+        return name in self.marks or name in self.phases
+
+    def _check(self) -> None:
+        with self._lock:
+            if self.reported or not all(self._done(n) for n in self.wait_for):
+                return
+            self.reported = True
+        _print_line(self.format_report())
+
+    def report_at_exit(self) -> None:
+        """Prints the report now if it has not been printed (some wait_for name never happened)."""
+        with self._lock:
+            if self.reported:
+                return
+            self.reported = True
+        _print_line(self.format_report())
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "phases": {k: {"start": s, "end": e, "sec": round(e - s, 3)} for k, (s, e) in self.phases.items()},
+                "marks": dict(self.marks),
+                "time_to_first_detection": self.marks.get("first_detection"),
+                "time_to_first_publish": self.marks.get("first_publish"),
+            }
+
+    def format_report(self) -> str:
+        return f"[{self.tag}] report " + json.dumps(self.summary())
@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+
+from framebuf import FrameBuffers
+
+# ===== Keyframe + optical-flow tracking =====
+TRACK_WIDTH = 320               # LK 追蹤用的縮小寬度（像素）
+FB_MAX_ERR_PX = 1.5             # forward-backward 誤差上限（追蹤解析度下），超過視為追蹤失敗
+LK_PARAMS = dict(
+    winSize=(21, 21),
+    maxLevel=3,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03),
+)
+
+
+class PalmTracker:
+    """
+    Propagates the palm landmark points (PALM_IDXS of every hand) between landmarker keyframes
+    with sparse pyramidal Lucas-Kanade flow. A point that fails the forward-backward check drops
+    tracking confidence and forces the next frame to be a keyframe.
+    """
+
+    def __init__(self, keyframe_interval: int, reuse_buffers: bool = True):
+        self.keyframe_interval = keyframe_interval
+        self.buffers = FrameBuffers(reuse_buffers)
+        self.prev_gray = None
+        self.points = None          # (N, 1, 2) float32, tracking resolution
+        self.points_per_hand = 0
+        self.since_keyframe = 0
+        self.stats = {"keyframes": 0, "tracked": 0, "lost": 0}
+
+    def _gray(self, frame):
+        h, w = frame.shape[:2]
+        scale = TRACK_WIDTH / w if w > TRACK_WIDTH else 1.0
+        gh, gw = (max(1, int(h * scale)), TRACK_WIDTH) if scale != 1.0 else (h, w)
+        if scale != 1.0:
+            frame = cv2.resize(frame, (gw, gh), dst=self.buffers.get("small", (gh, gw, 3)),
+                               interpolation=cv2.INTER_AREA)
+        # prev_gray 還要拿來算光流，這次寫進另一塊緩衝
+        name = "gray1" if self.prev_gray is self.buffers.get("gray0", (gh, gw)) else "gray0"
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.buffers.get(name, (gh, gw))), scale
+
+    def need_keyframe(self) -> bool:
+        return self.points is None or self.since_keyframe >= self.keyframe_interval - 1
+
+    def reset(self, frame, hands) -> None:
+        """Called after every landmarker keyframe with its per-hand (K, 2) pixel points."""
+        gray, scale = self._gray(frame)
+        self.prev_gray = gray
+        self.since_keyframe = 0
+        self.stats["keyframes"] += 1
+        if hands:
+            self.points_per_hand = len(hands[0])
+            self.points = (np.concatenate(hands, axis=0) * scale).astype(np.float32).reshape(-1, 1, 2)
+        else:
+            self.points = np.empty((0, 1, 2), dtype=np.float32)
+
+    def track(self, frame):
+        """Returns the propagated per-hand points, or None when tracking confidence is lost."""
+        gray, scale = self._gray(frame)
+        if len(self.points) == 0:
+            self.prev_gray = gray
+            self.since_keyframe += 1
+            self.stats["tracked"] += 1
+            return []
+
+        p1, st1, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None, **LK_PARAMS)
+        p0, st0, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, p1, None, **LK_PARAMS)
+        fb_err = np.linalg.norm((self.points - p0).reshape(-1, 2), axis=1)
+        ok = (st1.ravel() == 1) & (st0.ravel() == 1) & (fb_err < FB_MAX_ERR_PX)
+        if not ok.all():
+            self.points = None
+            self.stats["lost"] += 1
+            return None
+
+        self.prev_gray = gray
+        self.points = p1
+        self.since_keyframe += 1
+        self.stats["tracked"] += 1
+        pts = p1.reshape(-1, self.points_per_hand, 2) / scale
+        return list(pts)
+
+
+def format_tracker_stats(tracker: PalmTracker) -> str:
+    st = tracker.stats
+    total = max(1, st["keyframes"] + st["tracked"])
+    return (
+        f"[TRACK] keyframes={st['keyframes']} tracked={st['tracked']} lost={st['lost']} "
+        f"(model on {st['keyframes'] / total * 100.0:.1f}% of processed frames)"
+    )
+
+
+class TrackingEval:
+    """Per-frame comparison of a keyframe/tracking run against an every-frame baseline."""
+
+    def __init__(self):
+        self.frames = 0
+        self.zone_match = 0
+        self.count_match = 0
+        self.center_errors = []
+
+    def update(self, base_centers, base_state, test_centers, test_state) -> None:
+        self.frames += 1
+        if np.array_equal(base_state, test_state):
+            self.zone_match += 1
+        if len(base_centers) == len(test_centers):
+            self.count_match += 1
+        if base_centers and test_centers:
+            # 每個 baseline 掌心配對最近的追蹤點
+            b = np.asarray(base_centers, dtype=np.float32)
+            t = np.asarray(test_centers, dtype=np.float32)
+            d = np.linalg.norm(b[:, None, :] - t[None, :, :], axis=2)
+            self.center_errors.extend(d.min(axis=1).tolist())
+
+    def summary(self, base_calls: int, test_calls: int) -> dict:
+        frames = max(1, self.frames)
+        errs = np.asarray(self.center_errors) if self.center_errors else np.zeros(1)
+        return {
+            "frames": self.frames,
+            "baseline_model_calls": base_calls,
+            "tracked_model_calls": test_calls,
+            "zone_agreement": self.zone_match / frames,
+            "hand_count_agreement": self.count_match / frames,
+            "center_err_px_mean": float(errs.mean()),
+            "center_err_px_p95": float(np.percentile(errs, 95)),
+        }
@@ -0,0 +1,185 @@
+"""
+Per-zone temporal filter between ZoneMap.occupancy and the publisher.
+
+A zone's raw per-frame state becomes a confirmed transition only when
+    frames  at least N of the last M frames show the new state (enter N/M for OFF -> ON,
+            exit N/M for ON -> OFF), and
+    hold    that has stayed true for enter_hold / exit_hold seconds (0 = no minimum).
+Exit is normally stricter than enter, so a detection dropout of a few frames never turns into
+an OFF/ON pair on MQTT (and never restarts the dashboard's hot-zone timer). update() returns the
+zones confirmed on this frame, so the caller publishes them right away instead of sampling
+the state on a timer. All zones are updated at once with NumPy; state arrays are indexed by
+zone id like ZoneMap.occupancy (index 0 = outside, never ON).
+
+DebounceEval replays one clip's raw states through both policies (the old PRINT_INTERVAL_SEC
+sampling and the filter) and compares message count, short ON blips and publish latency;
+check_debounce.py runs it on a synthetic dwell workload with detector dropouts.
+"""
+
+import numpy as np
+
+EVAL_MIN_RUN_SEC = 0.5      # DebounceEval 的參考答案：短於這時間的漏偵測 / 誤報視為雜訊
+EVAL_BLIP_SEC = 1.0         # 發布出去、又在這時間內收回的 ON 視為誤報
+
+
+def parse_n_of_m(spec: str):
+    """'2/3' -> (2, 3), with 1 <= N <= M."""
+    n, m = (int(v) for v in spec.split("/"))
+    if not 1 <= n <= m:
+        raise ValueError(f"bad N/M frame rule: {spec}")
+    return n, m
+
+
+class ZoneDebouncer:
+    def __init__(self, size: int, enter=(3, 4), exit=(7, 8), enter_hold: float = 0.0, exit_hold: float = 0.1):
+        # size = len(ZoneMap.occupancy 的 state) = max_zone_id + 1
+        self.enter_n, self.enter_m = enter
+        self.exit_n, self.exit_m = exit
+        self.enter_hold = enter_hold
+        self.exit_hold = exit_hold
+        self.window = max(self.enter_m, self.exit_m)
+        self.history = np.zeros((self.window, size), dtype=bool)     # 最近 window 張的原始狀態（環狀）
+        self.pos = 0
+        self.filled = 0
+        self.state = np.zeros(size, dtype=np.uint8)                   # 確認後的狀態
+        self.pending_since = np.full(size, np.nan)                    # 條件開始成立的時間
+        self.stats = {"frames": 0, "transitions": 0}
+
+    def _count_on(self, m: int) -> np.ndarray:
+        """ON count per zone over the newest min(m, filled) frames."""
+        k = min(m, self.filled)
+        rows = (self.pos - 1 - np.arange(k)) % self.window
+        return self.history[rows].sum(axis=0)
+
+    def update(self, raw_state: np.ndarray, t: float):
+        """Feeds one frame's raw occupancy (captured at t seconds); returns the zone ids confirmed now."""
+        self.history[self.pos] = raw_state != 0
+        self.pos = (self.pos + 1) % self.window
+        self.filled = min(self.filled + 1, self.window)
+        self.stats["frames"] += 1
+
+        on = self.state == 1
+        enter = ~on & (self._count_on(self.enter_m) >= self.enter_n)
+        leave = on & (min(self.exit_m, self.filled) - self._count_on(self.exit_m) >= self.exit_n)
+        want = enter | leave
+        self.pending_since[want & np.isnan(self.pending_since)] = t
+        self.pending_since[~want] = np.nan
+        # NaN 比較一律為 False，沒有 pending 的區域不會被確認
+        confirm = want & (t - self.pending_since >= np.where(on, self.exit_hold, self.enter_hold))
+        if not confirm.any():
+            return []
+        self.state[confirm] ^= 1
+        self.pending_since[confirm] = np.nan
+        zones = [int(z) for z in np.flatnonzero(confirm)]
+        self.stats["transitions"] += len(zones)
+        return zones
+
+
+def format_debounce_stats(debouncer: ZoneDebouncer) -> str:
+    st = debouncer.stats
+    return (f"[DEBOUNCE] frames={st['frames']} transitions={st['transitions']} "
+            f"(enter {debouncer.enter_n}/{debouncer.enter_m} hold {debouncer.enter_hold}s, "
+            f"exit {debouncer.exit_n}/{debouncer.exit_m} hold {debouncer.exit_hold}s)")
+
+
+def _flip_short_runs(col: np.ndarray, times: np.ndarray, end_t: float, value: int) -> None:
+    """In place: runs of `value` shorter than EVAL_MIN_RUN_SEC take the other value (leading / trailing OFF kept)."""
+    starts = np.flatnonzero(np.diff(col, prepend=-1))
+    ends = np.append(starts[1:], len(col))
+    for s, e in zip(starts, ends):
+        if col[s] != value or (value == 0 and (s == 0 or e == len(col))):
+            continue
+        if (times[e] if e < len(col) else end_t) - times[s] < EVAL_MIN_RUN_SEC:
+            col[s:e] = 1 - value
+
+
+class DebounceEval:
+    """
+    Per-frame (t, raw state, filtered state) of one source; summary() compares
+    - sampled:   the old GridReporter, which publishes the raw state every sample_sec
+    - debounced: ZoneDebouncer, which publishes every confirmed transition at once
+    against a reference built offline from the raw states (OFF gaps, then ON runs, shorter than
+    EVAL_MIN_RUN_SEC are noise). Latency = publish time - reference onset; detection
+    and MQTT transport costs are the same for both and are not included.
+    """
+
+    def __init__(self, zone_ids, sample_sec: float):
+        self.zone_ids = list(zone_ids)
+        self.sample_sec = sample_sec
+        self.times = []
+        self.raw = []
+        self.sampled = []       # (t, zone, state) published by the sampling policy
+        self.debounced = []     # (t, zone, state) published by the filter
+        self._last_sample_t = None
+        self._sampled_state = np.zeros(len(self.zone_ids), dtype=np.uint8)
+        self._filtered_state = np.zeros(len(self.zone_ids), dtype=np.uint8)
+
+    def update(self, t: float, raw_state: np.ndarray, filtered_state: np.ndarray) -> None:
+        raw = raw_state[self.zone_ids]
+        self.times.append(t)
+        self.raw.append(raw)
+        if self._last_sample_t is None or t - self._last_sample_t >= self.sample_sec:
+            self._last_sample_t = t
+            self._record(self.sampled, t, self._sampled_state, raw)
+        self._record(self.debounced, t, self._filtered_state, filtered_state[self.zone_ids])
+
+    def _record(self, out, t, published, new) -> None:
+        for i in np.flatnonzero(published != new):
+            out.append((t, self.zone_ids[i], int(new[i])))
+        published[:] = new
+
+    def _reference(self):
+        """(t, zone, state) transitions of the raw states, gaps and then ON runs < EVAL_MIN_RUN_SEC removed."""
+        times = np.asarray(self.times)
+        raw = np.asarray(self.raw)
+        end_t = 2 * times[-1] - times[-2]       # 最後一張影格多算一張的時間
+        ref = []
+        for i, zone in enumerate(self.zone_ids):
+            col = (raw[:, i] != 0).astype(np.int8)
+            # 先補 ON 之間的短暫漏偵測，再去掉短暫的誤報
+            _flip_short_runs(col, times, end_t, 0)
+            _flip_short_runs(col, times, end_t, 1)
+            for s in np.flatnonzero(np.diff(col, prepend=0)):
+                ref.append((float(times[s]), zone, int(col[s])))
+        ref.sort()
+        return ref
+
+    def _score(self, published, ref) -> dict:
+        by_zone = {}
+        for t, zone, state in published:
+            by_zone.setdefault(zone, []).append((t, state))
+        latencies, matched = [], set()
+        for k, (t0, zone, state) in enumerate(ref):
+            nxt = next((t for t, z, _ in ref[k + 1:] if z == zone), float("inf"))
+            for j, (t, s) in enumerate(by_zone.get(zone, [])):
+                if s == state and t0 - EVAL_MIN_RUN_SEC <= t < nxt and (zone, j) not in matched:
+                    matched.add((zone, j))
+                    latencies.append(max(0.0, t - t0))
+                    break
+        blips = 0
+        for events in by_zone.values():
+            for (t_on, s_on), (t_off, s_off) in zip(events, events[1:]):
+                if s_on == 1 and s_off == 0 and t_off - t_on < EVAL_BLIP_SEC:
+                    blips += 1
+        lat = np.asarray(latencies) * 1000.0 if latencies else np.zeros(1)
+        return {
+            "messages": len(published),
+            "matched": len(latencies),
+            "missed": len(ref) - len(latencies),
+            "spurious": len(published) - len(latencies),
+            "blips": blips,
+            "latency_ms_mean": round(float(lat.mean()), 1),
+            "latency_ms_p95": round(float(np.percentile(lat, 95)), 1),
+            "latency_ms_max": round(float(lat.max()), 1),
+        }
+
+    def summary(self) -> dict:
+        if len(self.times) < 2:
+            return {"frames": len(self.times)}
+        ref = self._reference()
+        return {
+            "frames": len(self.times),
+            "reference_transitions": len(ref),
+            "sampled": self._score(self.sampled, ref),
+            "debounced": self._score(self.debounced, ref),
+        }
@@ -0,0 +1,127 @@
+"""
+Zone layouts for the edge detector.
+
+A layout is loaded from a JSON file and compiled once per frame resolution into an
+integer label mask (mask[y, x] = zone id, 0 = outside every zone), so mapping all
+palm centers of a frame to zones is a single NumPy fancy-index, whatever the layout.
+
+Grid layout (the original 3x3 is rows=3, cols=3; ids run row-major from 1):
+    {"type": "grid", "rows": 8, "cols": 8}
+
+Polygon layout (points are normalized 0..1 image coordinates; earlier zones win on overlap):
+    {"type": "polygons", "zones": [
+        {"id": 1, "points": [[0.0, 0.0], [0.4, 0.0], [0.4, 0.6], [0.0, 0.6]]},
+        {"id": 12, "points": [[0.5, 0.2], [1.0, 0.2], [0.8, 1.0]]}
+    ]}
+"""
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+MAX_ZONE_ID = 255  # label mask is uint8
+POLYGON_CODES_PER_LINE = 8
+
+DEFAULT_LAYOUT = {"type": "grid", "rows": 3, "cols": 3}
+
+
+class ZoneMap:
+    def __init__(self, layout: dict):
+        self.layout = layout
+        self.kind = layout.get("type", "grid")
+        if self.kind == "grid":
+            self.rows = int(layout["rows"])
+            self.cols = int(layout["cols"])
+            self.zone_ids = list(range(1, self.rows * self.cols + 1))
+        elif self.kind == "polygons":
+            self.polygons = [
+                (int(z["id"]), np.asarray(z["points"], dtype=np.float32))
+                for z in layout["zones"]
+            ]
+            self.zone_ids = sorted({zid for zid, _ in self.polygons})
+        else:
+            raise ValueError(f"Unknown zone layout type: {self.kind}")
+
+        if not self.zone_ids or self.zone_ids[0] < 1 or self.zone_ids[-1] > MAX_ZONE_ID:
+            raise ValueError(f"Zone ids must be in 1..{MAX_ZONE_ID}")
+        self.max_zone_id = self.zone_ids[-1]
+        self._masks = {}
+
+    # ===== Compile =====
+    def label_mask(self, w: int, h: int) -> np.ndarray:
+        """(h, w) uint8 zone-id mask for this resolution; compiled on first use, then cached."""
+        mask = self._masks.get((w, h))
+        if mask is None:
+            mask = self._compile(w, h)
+            self._masks[(w, h)] = mask
+        return mask
+
+    def _compile(self, w: int, h: int) -> np.ndarray:
+        if self.kind == "grid":
+            # 與原本 point_to_grid_id 相同：col = floor(cx / (w / cols))
+            col = (np.arange(w) * self.cols) // w
+            row = (np.arange(h) * self.rows) // h
+            return (row[:, None] * self.cols + col[None, :] + 1).astype(np.uint8)
+
+        mask = np.zeros((h, w), dtype=np.uint8)
+        scale = np.array([w, h], dtype=np.float32)
+        # 反向填，讓清單中較前面的區域在重疊處覆蓋後面的
+        for zid, pts in reversed(self.polygons):
+            cv2.fillPoly(mask, [np.round(pts * scale).astype(np.int32)], int(zid))
+        return mask
+
+    # ===== Per-frame lookup =====
+    def lookup(self, centers, w: int, h: int) -> np.ndarray:
+        """Zone id for every (cx, cy) center, 0 where the point is outside all zones."""
+        if len(centers) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        pts = np.asarray(centers, dtype=np.int32).reshape(-1, 2)
+        xs = np.clip(pts[:, 0], 0, w - 1)
+        ys = np.clip(pts[:, 1], 0, h - 1)
+        return self.label_mask(w, h)[ys, xs]
+
+    def occupancy(self, centers, w: int, h: int):
+        """
+        Returns (state, ids): state[zone_id] = 1 if any center falls in that zone
+        (index 0 is the "outside" bucket and is always cleared), ids = per-center zone ids.
+        """
+        ids = self.lookup(centers, w, h)
+        state = np.zeros(self.max_zone_id + 1, dtype=np.uint8)
+        state[ids] = 1
+        state[0] = 0
+        return state, ids
+
+    def on_zones(self, state: np.ndarray):
+        return [int(z) for z in np.flatnonzero(state)]
+
+    # ===== Display =====
+    def codes_per_line(self) -> int:
+        return self.cols if self.kind == "grid" else POLYGON_CODES_PER_LINE
+
+    def draw(self, frame):
+        h, w = frame.shape[:2]
+        if self.kind == "grid":
+            for c in range(1, self.cols):
+                x = int(c * w / self.cols)
+                cv2.line(frame, (x, 0), (x, h), (255, 255, 255), 3)
+            for r in range(1, self.rows):
+                y = int(r * h / self.rows)
+                cv2.line(frame, (0, y), (w, y), (255, 255, 255), 3)
+            return
+        scale = np.array([w, h], dtype=np.float32)
+        polys = [np.round(pts * scale).astype(np.int32) for _, pts in self.polygons]
+        cv2.polylines(frame, polys, True, (255, 255, 255), 3)
+
+
+def load_zone_map(path: str) -> ZoneMap:
+    p = Path(path)
+    if not p.exists():
+        print(f"[ZONES] {path} not found, using default 3x3 grid")
+        return ZoneMap(DEFAULT_LAYOUT)
+    with p.open("r", encoding="utf-8") as f:
+        layout = json.load(f)
+    zone_map = ZoneMap(layout)
+    print(f"[ZONES] Loaded {zone_map.kind} layout with {len(zone_map.zone_ids)} zones from {path}")
+    return zone_map
@@ -149,6 +149,16 @@ void switchLED(int targetZone) {
   }
 }
 
+// 從簡單 JSON 取出整數欄位，例如 jsonIntField("{\"zone\":3}", "zone") = 3；找不到回傳 -1
+int jsonIntField(const String& json, const char* key) {
+  String pattern = String("\"") + key + "\":";
+  int idx = json.indexOf(pattern);
+  if (idx < 0) {
+    return -1;
+  }
+  return json.substring(idx + pattern.length()).toInt();
+}
+
 void messageHandler(char* topic, byte* payload, unsigned int length) {
   String message = "";
   for (int i = 0; i < length; i++) {
@@ -158,10 +168,37 @@ void messageHandler(char* topic, byte* payload, unsigned int length) {
   Serial.print("Received: ");
   Serial.println(message); 
 
+  // 精簡格式 "b<區數>:<hex bitmask>"，bit (z-1) = 第 z 區 ON，一次更新全部 LED
+  if (message.startsWith("b") && message.indexOf(':') > 0) {
+    String hex = message.substring(message.indexOf(':') + 1);
+    // 只需要最低 LED_COUNT 個 bit，取最後 8 個 hex 字元即可
+    if (hex.length() > 8) {
+      hex = hex.substring(hex.length() - 8);
+    }
+    unsigned long mask = strtoul(hex.c_str(), NULL, 16);
+    for (int i = 0; i < LED_COUNT; i++) {
+      digitalWrite(LED_PINS[i], (mask >> i) & 1 ? HIGH : LOW);
+    }
+    Serial.print("Action: Frame mask 0x");
+    Serial.println(mask, HEX);
+    return;
+  }
+
   int val = message.toInt();   
   int targetZone = val / 10;   
   int state = val % 10;        
 
+  // Edge_Pc --journal 的即時事件：{"zone":1,"state":1,"ts":...,"seq":...,"jid":"..."}
+  // 斷線補送的 {"batch":[...]} 不處理，補送完後會再收到一則 frame 同步目前狀態
+  if (message.startsWith("{")) {
+    if (message.indexOf("\"batch\"") >= 0) {
+      Serial.println("Ignore: journal batch (waiting for frame resync)");
+      return;
+    }
+    targetZone = jsonIntField(message, "zone");
+    state = jsonIntField(message, "state");
+  }
+
   if (targetZone >= 1 && targetZone <= 9) {
     int pinIndex = targetZone - 1;
 
@@ -2,48 +2,85 @@
 # Requirement: "10 秒一到就記錄一次"（不需等下一筆 MQTT）
 # Hot event rule (per zone):
 # - When zone turns ON, start timer
-# - As soon as continuous ON reaches HOT_SECONDS, record hot_count += 1 immediately
+# - As soon as continuous ON reaches HOT_SECONDS (or the zone's HOT_SECONDS_BY_ZONE entry),
+#   record hot_count += 1 immediately (deadline scheduler, see hot_scheduler.py)
 # - Same ON period counts only once; must go OFF then ON again to count again
 #
 # Features:
 # - Subscribe AWS IoT MQTT topics
-# - Log all incoming messages to peopleflow.csv
-# - 9-grid LED status (last_state) + cumulative ON/OFF counts
+# - Log all incoming messages to peopleflow.csv (batched on a writer thread, see csv_writer.py)
+# - Payloads: legacy zone*10+state codes, JSON, or compact occupancy frames ("b9:101")
+# - Journal events (Edge_Pc --journal) keep their capture timestamp and are de-duplicated by seq
+# - Per-zone LED status (last_state) + cumulative ON/OFF counts (running counters)
+# - Many devices (Edge_Pc multicam: one topic per camera), state keyed by (device, zone),
+#   see zone_registry.py; the API filters by ?device= or aggregates all devices per zone id
 # - Bar chart: cumulative ON/OFF counts per zone
 # - Bar chart: hot event counts per zone (10s reached => +1)
+# - Analytics: occupancy over the last 1/15/60 min, dwell-time histograms, hour-of-day profiles,
+#   kept incrementally in bucketed circular counters per zone (zone_analytics.py)
+# - History: SQLite store with minute/hour/day rollups (history.py), /api/history time-range queries
+# - Restart: state snapshot every minute + replay of the CSV rows written after it (state_snapshot.py)
+# - Live page: one SSE stream (/api/live) = snapshot + deltas pushed as they happen (live_push.py)
+# - Spatial heatmap: the edge's decayed density grid of all detection points (Edge_Pc --heatmap,
+#   topic <zone topic>/heatmap), latest one per device at /api/heatmap (heatmap_store.py)
+# - Scale-out reads: this is the only ingest process (lock file); it publishes stats / heat / events
+#   state to a memory-mapped file that read_api.py workers serve from (shared_state.py)
+# - Fast start: the AWS IoT connect runs while the state is restored; messages that arrive before
+#   the restore is done are held and applied right after it, in order. [STARTUP] lines report
+#   imports / restore / connect / subscribe / first message times (awsiot is only imported here,
+#   so read_api.py workers never load it)
 #
 # Requirements:
-#   pip install fastapi uvicorn awsiotsdk
+#   pip install fastapi uvicorn awsiotsdk numpy
 #
 # Run:
-#   uvicorn app:app --host 0.0.0.0 --port 8000
+#   uvicorn app:app --host 0.0.0.0 --port 8000 --timeout-graceful-shutdown 3
+#   (live pages keep an SSE stream open; without the timeout Ctrl+C waits for every browser tab)
+#   Run exactly one app:app process (no --workers); scale reads with read_api.py:
+#   uvicorn read_api:app --host 0.0.0.0 --port 8001 --workers 4
 #
 # Put these files next to app.py:
 #   AmazonRootCA1.pem
 #   device-certificate.pem.crt
 #   private.pem.key
 
-import csv
+import time
+STARTUP_T0 = time.monotonic()   # 啟動計時的起點（在 import 之前）
+
+import asyncio
 import json
 import threading
-import time
-from collections import deque, defaultdict
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional, Tuple, Dict, Any
 
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 
 from awscrt import io, mqtt
-from awsiot import mqtt_connection_builder
+
+from csv_writer import CsvWriter, csv_rows_after
+from history import BUCKETS, HistoryStore, parse_time
+from event_ring import EventRing
+from heatmap_store import HeatmapStore, parse_heatmap_message
+from hot_scheduler import DeadlineScheduler
+from live_push import LiveBroadcaster, sse_message
+from response_cache import ResponseCache, etag_matches
+from shared_state import IngestLock, SharedStateFull, SharedStateWriter
+from state_snapshot import load_snapshot, save_snapshot
+from zone_analytics import DWELL_EDGES_SEC, HOURS, WINDOWS
+from zone_registry import NO_STATE, ZoneRegistry, ZoneShard, opt_float, opt_state
 
 # ========= AWS IoT =========
 ENDPOINT = "a10eer929bk2gd-ats.iot.us-east-1.amazonaws.com"
 TOPICS = [
     "project/led_control",
     "project/esp8266_led",
+    "project/esp8266_led/+",     # Edge_Pc multicam: project/esp8266_led/cam-001 ...
+    "project/esp8266_led/+/heatmap",
 ]
 CLIENT_ID = "local_peopleflow_logger"
 
@@ -51,43 +88,131 @@ ROOT_CA = "AmazonRootCA1.pem"
 CERT = "device-certificate.pem.crt"
 PRIVATE_KEY = "private.pem.key"
 
+# ========= Zones =========
+# Must match the edge layout (Edge_Pc/zones.json). Codes are zone*10+state, so
+# multi-digit zone ids work as-is: "121" = zone 12 ON, "640" = zone 64 OFF.
+# ZONE_COUNT / GRID_COLS are the default layout shown on the page; devices may report more.
+ZONE_COUNT = 9
+GRID_COLS = 3
+ZONE_IDS = range(1, ZONE_COUNT + 1)
+MAX_ZONE_ID = 255             # same limit as Edge_Pc zones.MAX_ZONE_ID
+
+# ========= Devices =========
+# A topic under DEVICE_TOPIC_PREFIX is device "<suffix>" (e.g. "cam-002"); any other topic
+# (the single-camera topic itself, project/led_control) is a device named after the topic.
+DEVICE_TOPIC_PREFIX = "project/esp8266_led/"
+REGISTRY_SHARDS = 16
+
+# Edge_Pc --heatmap publishes to "<zone topic>/heatmap" (project/esp8266_led/heatmap, .../cam-001/heatmap)
+HEATMAP_TOPIC_SUFFIX = "/heatmap"
+
+def device_of(topic: str) -> str:
+    if topic.endswith(HEATMAP_TOPIC_SUFFIX):
+        topic = topic[:-len(HEATMAP_TOPIC_SUFFIX)]
+    return topic[len(DEVICE_TOPIC_PREFIX):] if topic.startswith(DEVICE_TOPIC_PREFIX) else topic
+
 # ========= Hot-zone rule =========
 HOT_SECONDS = 10
+# Per-zone override, e.g. {1: 5, 9: 30, ("cam-002", 4): 20}; a (device, zone) key wins over
+# a plain zone id, anything not listed uses HOT_SECONDS
+HOT_SECONDS_BY_ZONE: Dict[Any, float] = {}
+
+def hot_seconds(zone: int, device: Optional[str] = None) -> float:
+    return HOT_SECONDS_BY_ZONE.get((device, zone), HOT_SECONDS_BY_ZONE.get(zone, HOT_SECONDS))
 
 # ========= CSV =========
 CSV_PATH = Path("peopleflow.csv")
-CSV_HEADER = ["ts_utc", "topic", "raw", "zone", "state"]
+CSV_HEADER = ["ts_utc", "topic", "raw", "zone", "state", "device"]
+CSV_FLUSH_SEC = 1.0           # rows are written in batches at most this far apart
+CSV_BATCH_MAX = 5000
+CSV_FSYNC_SEC = None          # None = never fsync, 0 = every batch, N = at most every N seconds
+CSV_ROTATE_BYTES = 50 * 1024 * 1024   # 0 = no size rotation
+CSV_ROTATE_DAILY = True       # start a new file when the UTC day changes
+CSV_COMPRESS_ROTATED = True   # gzip rotated files
+
+csv_log = CsvWriter(
+    CSV_PATH, CSV_HEADER,
+    flush_sec=CSV_FLUSH_SEC,
+    batch_max=CSV_BATCH_MAX,
+    fsync_sec=CSV_FSYNC_SEC,
+    rotate_bytes=CSV_ROTATE_BYTES,
+    rotate_daily=CSV_ROTATE_DAILY,
+    compress=CSV_COMPRESS_ROTATED,
+)
+
+# ========= History (SQLite) =========
+# Import existing CSV logs once with: python import_history.py
+HISTORY_DB = Path("peopleflow.db")
+HISTORY_DEFAULT_RANGE_SEC = 24 * 3600
+
+history = HistoryStore(HISTORY_DB, flush_sec=CSV_FLUSH_SEC, batch_max=CSV_BATCH_MAX)
+
+# ========= State snapshot (fast restart) =========
+# Startup loads the snapshot and replays only the CSV rows written after it, so restart time is
+# bounded by STATE_SNAPSHOT_SEC worth of events, not by the log size.
+# Without a snapshot (first start) the whole CSV log is replayed once.
+STATE_SNAPSHOT = Path("dashboard_state.npz")
+STATE_SNAPSHOT_SEC = 60.0
+STATE_MARK_TIMEOUT = 10.0     # max wait for the CSV writer to reach the snapshot position
 
 # ========= In-memory =========
-events = deque(maxlen=5000)
-lock = threading.Lock()
+EVENTS_MAX = 5000
+EVENTS_PAGE_MAX = 1000        # max rows per /api/events page (page further with before= / since=)
+events = EventRing(EVENTS_MAX)
+events_lock = threading.Lock()
+
+# Bumped after every zone state change (ON/OFF event, hot event): version of /api/stats, /api/heat,
+# /api/devices for ETags and the response cache. /api/events is versioned by events.seq.
+state_version = 0
+state_version_lock = threading.Lock()
+
+def bump_state_version() -> None:
+    global state_version
+    with state_version_lock:
+        state_version += 1
 
-# Per-zone runtime state
-# last_state: 0/1/None
-# on_since: epoch seconds when ON started
+responses = ResponseCache()
+
+# Per-(device, zone) runtime state, one row per zone in each shard's columns:
+# last_state: 0/1/NO_STATE
+# on / off: ON / OFF events received since the process started (running counters)
+# on_since: epoch seconds when ON started (NaN when not ON)
 # hot_counted: whether this ON period already counted a hot event
 # hot_count: total hot events recorded
-zone_state: Dict[int, Dict[str, Any]] = {
-    z: {"last_state": None, "on_since": None, "hot_counted": False, "hot_count": 0}
-    for z in range(1, 10)
-}
-
-# ========= CSV helpers =========
-def ensure_csv() -> None:
-    if not CSV_PATH.exists():
-        with CSV_PATH.open("w", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow(CSV_HEADER)
-
-def append_csv(row: dict) -> None:
-    with CSV_PATH.open("a", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow([row.get(h, "") for h in CSV_HEADER])
+# last_hot_at: epoch seconds at which the latest hot event's ON period reached the threshold
+registry = ZoneRegistry(REGISTRY_SHARDS)
+
+# ========= Live updates =========
+LIVE_EVENTS = 50              # events in a client snapshot (= rows of the events table)
+LIVE_KEEPALIVE_SEC = 15.0     # comment line on idle streams so proxies keep them open
+LIVE_RETRY_MS = 2000          # EventSource reconnect delay
+ANALYTICS_REFRESH_SEC = 10    # page refresh of the occupancy / dwell / peak-hour charts (windows slide without events)
+
+live = LiveBroadcaster()
+
+# Latest edge heatmap per device (replaced by every export, not persisted)
+heatmaps = HeatmapStore()
+
+# ========= Shared state (read-only API workers) =========
+# MQTT, hot-zone timers and the CSV must have exactly one owner: startup takes INGEST_LOCK and fails
+# if another process in this directory holds it (e.g. uvicorn app:app --workers N).
+# The owner publishes stats / heat / events state to SHARED_STATE_PATH at most every
+# SHARED_PUBLISH_SEC; read_api.py workers serve those endpoints from it (same JSON, same ETags).
+# On Linux, SHARED_STATE_PATH can point to /dev/shm to keep the file off the disk.
+INGEST_LOCK = Path("dashboard_ingest.lock")
+SHARED_STATE_PATH: Optional[Path] = Path("dashboard_shared.state")   # None = do not publish
+SHARED_STATE_BYTES = 64 * 1024 * 1024   # sparse file; only the published bytes use memory
+SHARED_PUBLISH_SEC = 0.2
+SHARED_COLUMNS = ["device", "zone", "last_state", "on", "off", "on_since", "hot_count", "last_hot_at"]
+
+ingest_lock = IngestLock(INGEST_LOCK)
+shared = SharedStateWriter(SHARED_STATE_PATH, SHARED_STATE_BYTES, boot=responses.boot) if SHARED_STATE_PATH else None
 
 # ========= Payload parsing =========
 def parse_payload(raw: str) -> Tuple[Optional[int], Optional[int]]:
     """
     Supports:
-      - Plain digits: "11","10","21","20"... (tens=zone, ones=state)
+      - Plain digits: "11","10","21","20","121"... (v // 10 = zone, v % 10 = state)
       - JSON: {"message":"11"} or {"zone":1,"present":1} / {"zone":1,"state":1}
     Returns (zone, state) where state is 1=ON, 0=OFF
     """
@@ -100,7 +225,7 @@ def parse_payload(raw: str) -> Tuple[Optional[int], Optional[int]]:
             if "zone" in obj and ("present" in obj or "state" in obj):
                 z = int(obj["zone"])
                 s = int(obj.get("present", obj.get("state")))
-                if 1 <= z <= 9 and s in (0, 1):
+                if 1 <= z <= MAX_ZONE_ID and s in (0, 1):
                     return z, s
             if "message" in obj:
                 raw = str(obj["message"]).strip()
@@ -111,73 +236,303 @@ def parse_payload(raw: str) -> Tuple[Optional[int], Optional[int]]:
     if raw.isdigit():
         v = int(raw)
         z, s = v // 10, v % 10
-        if 1 <= z <= 9 and s in (0, 1):
+        if 1 <= z <= MAX_ZONE_ID and s in (0, 1):
             return z, s
 
     return None, None
 
-# ========= MQTT callback =========
-def on_message(topic, payload, **kwargs):
-    raw = payload.decode("utf-8", errors="ignore").strip()
-    ts = datetime.now(timezone.utc).isoformat()
-    now = time.time()
+def parse_occupancy_frame(raw: str) -> Optional[Dict[int, int]]:
+    """
+    Compact edge format (Edge_Pc --wire-format frame): "b<zone_count>:<hex mask>",
+    bit (z-1) = zone z ON. e.g. "b9:101" -> zones 1 and 9 ON, the rest OFF.
+    Returns {zone: state} for zones 1..zone_count, or None if raw is not a frame.
+    """
+    raw = raw.strip().strip('"')
+    if not raw.startswith("b") or ":" not in raw:
+        return None
+    count, _, mask = raw[1:].partition(":")
+    try:
+        count, mask = int(count), int(mask, 16)
+    except ValueError:
+        return None
+    return {z: (mask >> (z - 1)) & 1 for z in range(1, min(count, MAX_ZONE_ID) + 1)}
 
-    zone, state = parse_payload(raw)
+def parse_journal_message(raw: str) -> Optional[Tuple[str, list]]:
+    """
+    Store-and-forward events from Edge_Pc --journal, carrying the original capture time:
+      - live:   {"zone":1,"state":1,"ts":1767076299.3,"seq":42,"jid":"9f.."}
+      - replay: {"jid":"9f..","batch":[[seq, ts, zone, state], ...]}
+    Returns (jid, [(seq, ts, zone, state), ...]) or None for any other payload.
+    """
+    if not raw.startswith("{"):
+        return None
+    try:
+        obj = json.loads(raw)
+        if "jid" not in obj:
+            return None
+        if "batch" in obj:
+            recs = [(int(q), float(t), int(z), int(s)) for q, t, z, s in obj["batch"]]
+        elif "seq" in obj and "ts" in obj:
+            recs = [(int(obj["seq"]), float(obj["ts"]), int(obj["zone"]), int(obj["state"]))]
+        else:
+            return None
+    except Exception:
+        return None
+    return str(obj["jid"]), [r for r in recs if 1 <= r[2] <= MAX_ZONE_ID and r[3] in (0, 1)]
 
+# ========= MQTT callback =========
+def record_event(shard: ZoneShard, device: str, topic: str, raw: str,
+                 zone: Optional[int], state: Optional[int], event_t: float, replay: bool = False) -> None:
+    """
+    Log one event and update the (device, zone) row. Caller holds `shard.lock`.
+    event_t is the event time (arrival time, or the edge capture time for journal events),
+    so late events still produce correct ON periods.
+    replay=True (startup, rows read back from the CSV): state only, nothing is written to CSV / history.
+    """
     row = {
-        "ts_utc": ts,
-        "topic": str(topic),
+        "ts_utc": datetime.fromtimestamp(event_t, timezone.utc).isoformat(),
+        "topic": topic,
+        "device": device,
         "raw": raw,
         "zone": zone,
         "state": state,
     }
+    with events_lock:
+        events.append(row)
+    # 只放進佇列，不在 lock 內碰磁碟
+    if not replay:
+        csv_log.submit(row)
 
-    with lock:
-        events.appendleft(row)
-        append_csv(row)
-
-        # Update per-zone state (timer start/reset)
-        if zone is not None and state in (0, 1):
-            zs = zone_state[zone]
-            prev = zs["last_state"]
-
-            if state == 1:
-                # OFF/None -> ON: start new ON period
-                if prev != 1:
-                    zs["on_since"] = now
-                    zs["hot_counted"] = False
-                zs["last_state"] = 1
-            else:
-                # ON -> OFF: reset ON period
-                zs["last_state"] = 0
-                zs["on_since"] = None
-                zs["hot_counted"] = False
+    if zone is None or state not in (0, 1):
+        live.publish({"t": "ev", "row": row})
+        return
+
+    # Update per-zone state (timer start/reset)
+    r = shard.row(device, zone)
+    prev = shard.last_state[r]
+    key = (device, zone)
+    live.publish({"t": "ev", "row": row, "prev": opt_state(prev)})
+    if not replay:
+        history.add_event(event_t, device, zone, state, raw)
+
+    if state == 1:
+        shard.on[r] += 1
+        # OFF/None -> ON: start new ON period, hot deadline = on_since + threshold
+        if prev != 1:
+            shard.on_since[r] = event_t
+            shard.analytics.arrive(r, event_t)
+            shard.hot_counted[r] = False
+            hot_scheduler.schedule(key, event_t + hot_seconds(zone, device))
+        shard.last_state[r] = 1
+    else:
+        shard.off[r] += 1
+        hot_scheduler.cancel(key)
+        # ON -> OFF: an ON period that reached the threshold before its deadline fired
+        # (e.g. both ends replayed after an outage) still counts once
+        hs = hot_seconds(zone, device)
+        if prev == 1 and not shard.hot_counted[r] and (event_t - shard.on_since[r]) >= hs:
+            shard.hot_count[r] += 1
+            shard.last_hot_at[r] = shard.on_since[r] + hs
+            live.publish({"t": "hot", "device": device, "zone": zone, "at": float(shard.last_hot_at[r])})
+            if not replay:
+                history.add_hot(float(shard.last_hot_at[r]), device, zone)
+                print(f"[HOT] {device} zone {zone} hot event recorded at OFF (>= {hs}s)")
+        if prev == 1:
+            shard.analytics.close(r, float(shard.on_since[r]), event_t)
+            if not replay:
+                history.add_on_period(device, zone, float(shard.on_since[r]), event_t)
+        # ON -> OFF: reset ON period
+        shard.last_state[r] = 0
+        shard.on_since[r] = np.nan
+        shard.hot_counted[r] = False
+    bump_state_version()
+
+def on_message(topic, payload, **kwargs):
+    raw = payload.decode("utf-8", errors="ignore").strip()
+    now = time.time()
+    topic = str(topic)
+    device = device_of(topic)
+
+    if topic.endswith(HEATMAP_TOPIC_SUFFIX):
+        # 熱度圖是整張快照，不是區域事件：不進 CSV / 事件列表 / 統計
+        hm = parse_heatmap_message(raw)
+        if hm is None:
+            print(f"[MQTT] {topic} invalid heatmap ({len(raw)} bytes)")
+            return
+        heatmaps.put(device, hm, now)
+        print(f"[MQTT] {topic} heatmap {hm['w']}x{hm['h']} points={hm['points']} ({len(raw)} bytes)")
+        return
+
+    shard = registry.shard(device)
+
+    journal_msg = parse_journal_message(raw)
+    if journal_msg is not None:
+        # Highest journal seq applied per (topic, jid); replays and QoS1 redeliveries at or below it are dropped
+        jid, recs = journal_msg
+        key = (topic, jid)
+        with shard.lock:
+            last = shard.journal_seq.get(key, -1)
+            fresh = [r for r in recs if r[0] > last]
+            for seq, ts, z, s in fresh:
+                record_event(shard, device, topic, str(z * 10 + s), z, s, ts)
+            if fresh:
+                shard.journal_seq[key] = fresh[-1][0]
+        print(f"[MQTT] {topic} journal {jid}: {len(fresh)} new / {len(recs) - len(fresh)} duplicate")
+        return
+
+    frame = parse_occupancy_frame(raw)
+    if frame is not None:
+        # 一則 frame = 所有區域的快照；只把真正改變的區域記成事件，
+        # 讓 CSV / 統計 / 熱區計時與逐則代碼格式完全一致（未知 -> OFF 不記，與邊緣端只在 ON 後才送 OFF 相同）
+        with shard.lock:
+            changes = []
+            for z, s in frame.items():
+                r = shard.find(device, z)
+                prev = shard.last_state[r] if r is not None else NO_STATE
+                if s != prev and not (prev == NO_STATE and s == 0):
+                    changes.append((z, s))
+            for z, s in changes:
+                record_event(shard, device, topic, raw, z, s, now)
+        print(f"[MQTT] {topic} {raw} -> changes={changes}")
+        return
+
+    zone, state = parse_payload(raw)
+
+    with shard.lock:
+        record_event(shard, device, topic, raw, zone, state, now)
 
     print(f"[MQTT] {topic} {raw} -> zone={zone} state={state}")
 
-# ========= Background checker =========
-def hot_checker():
+# ========= Hot deadlines =========
+def on_hot_deadline(key: Tuple[str, int], deadline: float) -> None:
     """
-    Every 0.2s check if any zone has been continuously ON for >= HOT_SECONDS.
-    When threshold is reached, record hot_count += 1 immediately (only once per ON period).
+    Scheduler callback at on_since + threshold: record hot_count += 1 (only once per ON period).
+    Re-checked under the shard lock, since the zone may have gone OFF / ON again since the deadline popped.
     """
-    while True:
-        time.sleep(0.2)
-        now = time.time()
-        with lock:
-            for z in range(1, 10):
-                zs = zone_state[z]
-                if (
-                    zs["last_state"] == 1
-                    and not zs["hot_counted"]
-                    and zs["on_since"] is not None
-                    and (now - zs["on_since"]) >= HOT_SECONDS
-                ):
-                    zs["hot_count"] += 1
-                    zs["hot_counted"] = True
-                    print(f"[HOT] Zone {z} hot event recorded (>= {HOT_SECONDS}s)")
+    device, zone = key
+    shard = registry.shard(device)
+    with shard.lock:
+        r = shard.find(device, zone)
+        if (
+            r is not None
+            and shard.last_state[r] == 1
+            and not shard.hot_counted[r]
+            and shard.on_since[r] + hot_seconds(zone, device) <= deadline
+        ):
+            shard.hot_count[r] += 1
+            shard.hot_counted[r] = True
+            shard.last_hot_at[r] = deadline
+            live.publish({"t": "hot", "device": device, "zone": zone, "at": deadline})
+            history.add_hot(deadline, device, zone)
+            bump_state_version()
+            print(f"[HOT] {device} zone {zone} hot event recorded (>= {hot_seconds(zone, device)}s, "
+                  f"+{(time.time() - deadline) * 1000:.1f}ms)")
+
+hot_scheduler = DeadlineScheduler(on_hot_deadline)
+
+# ========= State snapshot / restore =========
+def save_state() -> None:
+    """Snapshot of zones, recent events and journal seqs, tagged with the CSV position it covers."""
+    t0 = time.perf_counter()
+    with registry.locked():
+        columns = registry.export_rows()
+        with events_lock:
+            ring, ring_seq = list(events), events.seq
+        journal = [[topic, jid, seq] for sh in registry.shards for (topic, jid), seq in sh.journal_seq.items()]
+        # 在同一把鎖內放 marker：marker 之前的 CSV 列 = 這份快照已包含的事件
+        mark = csv_log.mark()
+    position = mark.wait(STATE_MARK_TIMEOUT)
+    if position is None:
+        print("[STATE] CSV writer did not reach the snapshot mark, snapshot skipped")
+        return
+    size = save_snapshot(STATE_SNAPSHOT, columns, {"events": ring, "events_seq": ring_seq, "journal_seq": journal, "csv": position})
+    print(f"[STATE] Snapshot: {len(columns['zone'])} zones, {len(ring)} events, {size / 1024:.0f} KB "
+          f"in {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+def replay_csv_row(row: dict) -> None:
+    device = row.get("device") or device_of(row["topic"])
+    zone = int(row["zone"]) if row.get("zone") else None
+    state = int(row["state"]) if row.get("state") in ("0", "1") else None
+    event_t = datetime.fromisoformat(row["ts_utc"]).timestamp()
+    shard = registry.shard(device)
+    with shard.lock:
+        record_event(shard, device, row["topic"], row["raw"], zone, state, event_t, replay=True)
+
+def restore_state() -> int:
+    """Loads the snapshot and replays the CSV tail after it; returns the number of replayed rows."""
+    t0 = time.perf_counter()
+    position = None
+    snap = load_snapshot(STATE_SNAPSHOT)
+    if snap is not None:
+        columns, meta = snap
+        zones = registry.load_rows(columns)
+        with events_lock:
+            events.restore(meta["events"], meta.get("events_seq", len(meta["events"])))
+        for topic, jid, seq in meta["journal_seq"]:
+            registry.shard(device_of(topic)).journal_seq[(topic, jid)] = seq
+        position = meta["csv"]
+        print(f"[STATE] Loaded {STATE_SNAPSHOT}: {zones} zones, {len(meta['events'])} events, "
+              f"{time.time() - meta['saved_at']:.0f}s old")
+
+    # 跨越重啟的 ON：照原本的 on_since 重新排熱區期限（已過期的會在 scheduler 啟動後立刻觸發）
+    for sh in registry.shards:
+        with sh.lock:
+            for r in np.flatnonzero((sh.last_state[:sh.size] == 1) & ~sh.hot_counted[:sh.size]).tolist():
+                device, zone = sh.devices[sh.device[r]], int(sh.zone[r])
+                hot_scheduler.schedule((device, zone), float(sh.on_since[r]) + hot_seconds(zone, device))
+
+    replayed = 0
+    for row in csv_rows_after(CSV_PATH, position):
+        replay_csv_row(row)
+        replayed += 1
+    print(f"[STATE] Replayed {replayed} CSV rows {'after the snapshot' if snap else '(no snapshot: full log)'}; "
+          f"restore took {time.perf_counter() - t0:.2f}s")
+    return replayed
+
+def state_snapshot_loop(stop: threading.Event):
+    while not stop.wait(STATE_SNAPSHOT_SEC):
+        try:
+            save_state()
+        except Exception as e:
+            print("[STATE] Snapshot error:", repr(e))
+
+# ========= Startup =========
+_ingest_ready = threading.Event()      # restore_state() 完成後才處理 MQTT 訊息
+_held_lock = threading.Lock()
+_held_messages = []                    # (topic, payload) 在還原完成前收到的訊息
+_startup_marks: Dict[str, float] = {}
+
+def startup_mark(name: str) -> None:
+    """Prints the time since STARTUP_T0 the first time `name` happens."""
+    if name in _startup_marks:
+        return
+    _startup_marks[name] = time.monotonic() - STARTUP_T0
+    print(f"[STARTUP] {name} at +{_startup_marks[name]:.3f}s")
+
+def gated_on_message(topic, payload, **kwargs):
+    """on_message once the state is restored; until then the message is held (see open_ingest)."""
+    startup_mark("first_message")
+    if not _ingest_ready.is_set():
+        with _held_lock:
+            if not _ingest_ready.is_set():
+                _held_messages.append((topic, payload))
+                return
+    on_message(topic, payload, **kwargs)
+
+def open_ingest() -> int:
+    """Applies the held messages in arrival order, then lets new ones through; returns how many were held."""
+    with _held_lock:
+        # 持有鎖重送：期間新進的訊息會等在鎖上，排在這些之後
+        held = len(_held_messages)
+        for topic, payload in _held_messages:
+            on_message(topic, payload)
+        _held_messages.clear()
+        _ingest_ready.set()
+    return held
+
+def connect_aws():
+    from awsiot import mqtt_connection_builder
 
-def start_mqtt():
     # Check cert files exist
     for p in [ROOT_CA, CERT, PRIVATE_KEY]:
         if not Path(p).exists():
@@ -197,58 +552,277 @@ def start_mqtt():
         clean_session=False,
         keep_alive_secs=30,
     )
+    # clean_session=False：broker 在連上時就會送出離線期間排隊的訊息（早於 subscribe 完成），也要收
+    conn.on_message(gated_on_message)
 
     print("Connecting to AWS IoT Core...")
     conn.connect().result()
-    print("Connected. Subscribing...")
+    startup_mark("mqtt_connected")
+    return conn
 
+def subscribe_topics(conn, callback=on_message) -> None:
+    """Subscribes callback to TOPICS on an AWS connection (or Edge_Pc's LocalBroker stand-in)."""
+    print("Connected. Subscribing...")
     for t in TOPICS:
-        conn.subscribe(t, mqtt.QoS.AT_LEAST_ONCE, on_message)[0].result()
+        conn.subscribe(t, mqtt.QoS.AT_LEAST_ONCE, callback)[0].result()
         print("Subscribed:", t)
 
+def start_mqtt():
+    subscribe_topics(connect_aws(), gated_on_message)
+    startup_mark("mqtt_subscribed")
+
     while True:
         time.sleep(1)
 
+# ========= Shared state publisher =========
+_event_json: Dict[int, bytes] = {}     # seq -> encoded event row (each row is serialized once)
+
+def publish_shared_state() -> int:
+    """Publishes the columns read_api.py needs plus the events ring; returns the payload size."""
+    global _event_json
+    with registry.locked():
+        version = state_version
+        names, device_cols = [], []
+        for sh in registry.shards:
+            # 每個 shard 的裝置編號是局部的，轉成全域 names 的索引
+            device_cols.append(sh.device[:sh.size] + len(names))
+            names.extend(sh.devices)
+        arrays = {name: np.concatenate([getattr(sh, name)[:sh.size] for sh in registry.shards])
+                  for name in SHARED_COLUMNS if name != "device"}
+        arrays["device"] = np.concatenate(device_cols)
+        with events_lock:
+            ring, events_seq = list(events), events.seq
+    encoded = {}
+    for row in ring:
+        b = _event_json.get(row["seq"])
+        encoded[row["seq"]] = b if b is not None else json.dumps(row, separators=(",", ":")).encode("utf-8")
+    _event_json = encoded
+    # 每列的位移：讀取端只解碼它要回傳的那幾列
+    parts = list(encoded.values())
+    arrays["event_offsets"] = np.concatenate([[0], np.cumsum([len(b) for b in parts], dtype=np.int64)])
+    meta = {"state_version": version, "events_seq": events_seq, "devices": names}
+    return shared.publish(meta, arrays, {"events": b"".join(parts)})
+
+def shared_publish_loop(stop: threading.Event):
+    published = None
+    while not stop.wait(SHARED_PUBLISH_SEC):
+        current = (state_version, events.seq)
+        try:
+            if current != published:
+                publish_shared_state()
+            else:
+                shared.heartbeat()
+        except SharedStateFull as e:
+            print(f"[SHARED] {e}; raise SHARED_STATE_BYTES")
+        except Exception as e:
+            print("[SHARED] Publish error:", repr(e))
+        published = current
+
 # ========= Stats =========
-def compute_counts():
-    """
-    Cumulative ON/OFF counts and last_state derived from events.
-    """
-    by_zone = defaultdict(lambda: {"on": 0, "off": 0, "last_state": None})
-    for z in range(1, 10):
-        _ = by_zone[z]
-
-    # events newest-first; iterate reversed so last_state ends up as newest
-    for e in reversed(list(events)):
-        z, s = e.get("zone"), e.get("state")
-        if z is None or s is None:
-            continue
-        if s == 1:
-            by_zone[z]["on"] += 1
-        elif s == 0:
-            by_zone[z]["off"] += 1
-        by_zone[z]["last_state"] = s
-
-    return by_zone
-
-def compute_hot_counts():
+# Running counters kept by record_event: every call is O(zones of the selected device(s)) in
+# vectorised NumPy, exact for the whole process lifetime (not limited to what fits in `events`).
+# device=None aggregates all devices per zone id: counts are summed, a zone is ON if any device
+# has it ON, durations / timestamps take the maximum.
+
+def _zone_ids(seen) -> list:
+    return sorted(set(ZONE_IDS) | {int(z) for z in seen})
+
+def compute_counts(device: Optional[str] = None, reg=None):
+    """{zone: {"on", "off", "last_state"}} for one device or all devices (of `reg`, default the live registry)."""
+    reg = reg or registry
+    on = np.zeros(MAX_ZONE_ID + 1, dtype=np.int64)
+    off = np.zeros(MAX_ZONE_ID + 1, dtype=np.int64)
+    last = np.full(MAX_ZONE_ID + 1, NO_STATE, dtype=np.int8)
+    seen = set()
+    for sh in ([reg.shard(device)] if device is not None else reg.shards):
+        with sh.lock:
+            rows = sh.select(device)
+            zones = sh.zone[rows]
+            np.add.at(on, zones, sh.on[rows])
+            np.add.at(off, zones, sh.off[rows])
+            np.maximum.at(last, zones, sh.last_state[rows])
+        seen.update(zones.tolist())
+    return {
+        z: {"on": int(on[z]), "off": int(off[z]), "last_state": opt_state(last[z])}
+        for z in _zone_ids(seen)
+    }
+
+def compute_hot_counts(device: Optional[str] = None, reg=None):
     """
     Returns hot_count per zone and current ON duration.
     """
+    reg = reg or registry
     now = time.time()
+    hot = np.zeros(MAX_ZONE_ID + 1, dtype=np.int64)
+    dur = np.zeros(MAX_ZONE_ID + 1, dtype=np.float64)
+    last_hot = np.full(MAX_ZONE_ID + 1, np.nan)
+    seen = set()
+    for sh in ([reg.shard(device)] if device is not None else reg.shards):
+        with sh.lock:
+            rows = sh.select(device)
+            zones = sh.zone[rows]
+            np.add.at(hot, zones, sh.hot_count[rows])
+            on_dur = np.where(sh.last_state[rows] == 1, np.maximum(0.0, now - sh.on_since[rows]), 0.0)
+            np.maximum.at(dur, zones, on_dur)
+            np.fmax.at(last_hot, zones, sh.last_hot_at[rows])
+        seen.update(zones.tolist())
     out = {}
-    for z in range(1, 10):
-        zs = zone_state[z]
-        dur = 0.0
-        if zs["last_state"] == 1 and zs["on_since"] is not None:
-            dur = max(0.0, now - zs["on_since"])
+    for z in _zone_ids(seen):
         out[z] = {
-            "hot_count": int(zs["hot_count"]),
-            "on_duration_sec": dur,
-            "is_hot_now": dur >= HOT_SECONDS,
+            "hot_count": int(hot[z]),
+            "on_duration_sec": float(dur[z]),
+            "is_hot_now": bool(dur[z] >= hot_seconds(z, device)),
+            "last_hot_at": opt_float(last_hot[z]),
         }
     return out
 
+def compute_devices(reg=None):
+    """Per-device totals: zones seen, zones ON now, ON/OFF events, hot events."""
+    reg = reg or registry
+    out = []
+    for sh in reg.shards:
+        with sh.lock:
+            n, k = sh.size, len(sh.devices)
+            if k == 0:
+                continue
+            dev = sh.device[:n]
+            totals = {
+                "zones": np.bincount(dev, minlength=k),
+                "on_now": np.bincount(dev, weights=sh.last_state[:n] == 1, minlength=k),
+                "on": np.bincount(dev, weights=sh.on[:n], minlength=k),
+                "off": np.bincount(dev, weights=sh.off[:n], minlength=k),
+                "hot_count": np.bincount(dev, weights=sh.hot_count[:n], minlength=k),
+            }
+            names = list(sh.devices)
+        for i, name in enumerate(names):
+            out.append({"device": name, **{key: int(v[i]) for key, v in totals.items()}})
+    return sorted(out, key=lambda d: d["device"])
+
+def compute_occupancy(device: Optional[str] = None):
+    """
+    {zone: {"1m", "15m", "60m"}}: share of each window the zone was ON, up to now.
+    device=None: averaged over the devices that have the zone.
+    """
+    now = time.time()
+    occ = np.zeros((MAX_ZONE_ID + 1, len(WINDOWS)))
+    rows_per_zone = np.zeros(MAX_ZONE_ID + 1, dtype=np.int64)
+    seen = set()
+    for sh in ([registry.shard(device)] if device is not None else registry.shards):
+        with sh.lock:
+            rows = sh.select(device)
+            zones = sh.zone[rows]
+            is_on, on_since = sh.last_state[rows] == 1, sh.on_since[rows]
+            for i, window in enumerate(WINDOWS.values()):
+                np.add.at(occ[:, i], zones, sh.analytics.occupied_seconds(rows, window, now, on_since, is_on) / window)
+            np.add.at(rows_per_zone, zones, 1)
+        seen.update(zones.tolist())
+    return {
+        z: {label: round(float(occ[z, i] / max(1, rows_per_zone[z])), 4) for i, label in enumerate(WINDOWS)}
+        for z in _zone_ids(seen)
+    }
+
+def compute_dwell(device: Optional[str] = None):
+    """{zone: {"counts": [per DWELL_EDGES_SEC bin], "periods", "mean_sec"}} of completed ON periods."""
+    counts = np.zeros((MAX_ZONE_ID + 1, len(DWELL_EDGES_SEC) + 1), dtype=np.int64)
+    total = np.zeros(MAX_ZONE_ID + 1)
+    seen = set()
+    for sh in ([registry.shard(device)] if device is not None else registry.shards):
+        with sh.lock:
+            rows = sh.select(device)
+            zones = sh.zone[rows]
+            np.add.at(counts, zones, sh.analytics.dwell[rows])
+            np.add.at(total, zones, sh.analytics.dwell_sum[rows])
+        seen.update(zones.tolist())
+    out = {}
+    for z in _zone_ids(seen):
+        n = int(counts[z].sum())
+        out[z] = {"counts": counts[z].tolist(), "periods": n, "mean_sec": round(total[z] / n, 2) if n else None}
+    return out
+
+def compute_hour_profile(device: Optional[str] = None, utc_offset: int = 0):
+    """
+    {zone: {"on_seconds": [24], "arrivals": [24]}} per hour of day (index 0 = 00:00 at UTC+utc_offset),
+    cumulative since the counters started, summed over devices.
+    """
+    now = time.time()
+    on_sec = np.zeros((MAX_ZONE_ID + 1, HOURS))
+    arrivals = np.zeros((MAX_ZONE_ID + 1, HOURS), dtype=np.int64)
+    seen = set()
+    for sh in ([registry.shard(device)] if device is not None else registry.shards):
+        with sh.lock:
+            rows = sh.select(device)
+            zones = sh.zone[rows]
+            hour_on, hour_arr = sh.analytics.hour_profile(rows, now, sh.on_since[rows], sh.last_state[rows] == 1)
+            np.add.at(on_sec, zones, hour_on)
+            np.add.at(arrivals, zones, hour_arr)
+        seen.update(zones.tolist())
+    # UTC 小時 h 在當地是 h + utc_offset
+    on_sec = np.roll(on_sec, utc_offset, axis=1)
+    arrivals = np.roll(arrivals, utc_offset, axis=1)
+    return {
+        z: {"on_seconds": np.round(on_sec[z], 1).tolist(), "arrivals": arrivals[z].tolist()}
+        for z in _zone_ids(seen)
+    }
+
+def current_on_periods(device: Optional[str] = None):
+    """[(device, zone, on_since)] of every zone that is ON right now (not in the history rollups yet)."""
+    out = []
+    for sh in ([registry.shard(device)] if device is not None else registry.shards):
+        with sh.lock:
+            rows = sh.select(device)
+            rows = rows[sh.last_state[rows] == 1]
+            out.extend(zip((sh.devices[d] for d in sh.device[rows].tolist()),
+                           sh.zone[rows].tolist(), sh.on_since[rows].tolist()))
+    return out
+
+def live_snapshot(device: Optional[str] = None):
+    """
+    Full state for a new live client, taken with every shard lock held. Deltas are published
+    under the same locks, so `seq` is exactly the last delta already contained in the snapshot.
+    """
+    with registry.locked():
+        seq = live.seq
+        by_zone = compute_counts(device)
+        hot = compute_hot_counts(device)
+        # 合計模式下 client 要知道每個 zone 有幾台裝置是 ON，才能套用之後的 delta
+        on_devices = dict.fromkeys(by_zone, 0)
+        for sh in ([registry.shard(device)] if device is not None else registry.shards):
+            rows = sh.select(device)
+            rows = rows[sh.last_state[rows] == 1]
+            for z in sh.zone[rows].tolist():
+                on_devices[z] = on_devices.get(z, 0) + 1
+        with events_lock:
+            recent = events.page(LIVE_EVENTS, where=None if device is None else lambda e: e["device"] == device)
+        devices = registry.devices()
+    return {
+        "seq": seq,
+        "device": device,
+        "devices": devices,
+        "hot_seconds": HOT_SECONDS,
+        "by_zone": {
+            str(z): {**v, "on_devices": on_devices[z], "hot_count": hot[z]["hot_count"]}
+            for z, v in by_zone.items()
+        },
+        "events": recent,
+    }
+
+async def live_stream(q: asyncio.Queue, snapshot: dict):
+    try:
+        yield f"retry: {LIVE_RETRY_MS}\n\n".encode("utf-8")
+        yield sse_message("snapshot", snapshot, snapshot["seq"])
+        while True:
+            try:
+                msg = await asyncio.wait_for(q.get(), LIVE_KEEPALIVE_SEC)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if msg is None:
+                # 太慢被踢掉 / 伺服器關閉：結束串流，EventSource 會重連並拿新的 snapshot
+                return
+            yield msg
+    finally:
+        live.unsubscribe(q)
+
 # ========= Web UI =========
 HTML_PAGE = f"""
 <!doctype html>
@@ -267,7 +841,7 @@ HTML_PAGE = f"""
     .muted{{color:#666}}
     .mono{{font-family:ui-monospace,SFMono-Regular,Menlo,Monaco,Consolas,"Liberation Mono","Courier New",monospace}}
 
-    .led-grid{{display:grid;grid-template-columns:repeat(3,1fr);gap:12px;margin-bottom:8px}}
+    .led-grid{{display:grid;grid-template-columns:repeat({GRID_COLS},1fr);gap:12px;margin-bottom:8px}}
     .led{{border:1px solid #ddd;border-radius:12px;padding:12px;text-align:center;user-select:none}}
     .led-circle{{width:28px;height:28px;border-radius:50%;margin:6px auto 8px;border:2px solid #bbb;background:#f5f5f5}}
     .led.on .led-circle{{background:#22c55e;border-color:#16a34a;box-shadow:0 0 10px rgba(34,197,94,.7)}}
@@ -283,7 +857,11 @@ HTML_PAGE = f"""
 
   <div class="row" style="margin-top:14px">
     <div class="card" style="flex:1;min-width:320px">
-      <h3 style="margin:0 0 8px 0">9 宮格 LED（最後狀態）</h3>
+      <div style="margin:0 0 8px 0">
+        裝置：<select id="device"><option value="">全部裝置（依 zone 合計）</option></select>
+        <span id="deviceInfo" class="muted"></span>
+      </div>
+      <h3 style="margin:0 0 8px 0">區域 LED（最後狀態）</h3>
       <div id="leds" class="led-grid"></div>
 
       <h3 style="margin:14px 0 8px 0">累積統計（ON / OFF 次數）</h3>
@@ -291,13 +869,25 @@ HTML_PAGE = f"""
 
       <h3 style="margin:14px 0 8px 0">熱區事件次數（≥ {HOT_SECONDS} 秒算一次）</h3>
       <canvas id="hotChart" height="120"></canvas>
+
+      <h3 style="margin:14px 0 8px 0">佔用率（最近 1 / 15 / 60 分鐘）</h3>
+      <canvas id="occChart" height="120"></canvas>
+
+      <h3 style="margin:14px 0 8px 0">停留時間分布（每段 ON 的長度，所有區域）</h3>
+      <canvas id="dwellChart" height="120"></canvas>
+
+      <h3 style="margin:14px 0 8px 0">尖峰時段（各小時累積有人分鐘數）<span id="peakInfo" class="muted"></span></h3>
+      <canvas id="peakChart" height="120"></canvas>
+
+      <h3 style="margin:14px 0 8px 0">空間熱度圖（邊緣端所有偵測點的密度）<span id="heatmapInfo" class="muted"></span></h3>
+      <canvas id="heatmapCanvas" width="640" height="360" style="width:100%;background:#111;border-radius:8px"></canvas>
     </div>
 
     <div class="card" style="flex:2;min-width:720px">
       <h3 style="margin:0 0 8px 0">最新事件（最近 50 筆）</h3>
       <table>
         <thead>
-          <tr><th>時間(UTC)</th><th>topic</th><th>raw</th><th>zone</th><th>state</th></tr>
+          <tr><th>時間(UTC)</th><th>device</th><th>raw</th><th>zone</th><th>state</th></tr>
         </thead>
         <tbody id="events"></tbody>
       </table>
@@ -308,41 +898,119 @@ HTML_PAGE = f"""
 <script>
 const fmtState = (s)=> s===1 ? "ON(有人)" : s===0 ? "OFF(無人)" : "-";
 const esc = (s)=> String(s ?? "").replaceAll("&","&amp;").replaceAll("<","&lt;").replaceAll(">","&gt;");
+const EVENT_ROWS = 50;
+
+const deviceSel = document.getElementById("device");
+const deviceInfo = document.getElementById("deviceInfo");
+const ledsEl = document.getElementById("leds");
+const tbody = document.getElementById("events");
 
 let countChart=null;
 let hotChart=null;
 
-async function refresh(){{
-  const st = await fetch("/api/stats").then(r=>r.json());
-  const ht = await fetch("/api/heat").then(r=>r.json());
-
-  // ===== LED grid =====
-  const leds = document.getElementById("leds");
-  leds.innerHTML = "";
-  for(let z=1; z<=9; z++) {{
-    const v = st.by_zone[String(z)] || {{}};
-    const cls = v.last_state===1 ? "on" : v.last_state===0 ? "off" : "unknown";
-    leds.innerHTML += `
-      <div class="led ${{cls}}">
-        <div><b>Zone ${{z}}</b></div>
-        <div class="led-circle"></div>
-        <div class="muted">ON:${{v.on||0}} / OFF:${{v.off||0}}</div>
-      </div>`;
+// 目前畫面的狀態：snapshot 之後只套用 delta（沒有輪詢）
+// zones[z] = {{on, off, last_state, on_devices, hot_count}}
+let view = null;
+let ledEls = {{}};           // zone -> {{root, counts}}，只在 zone 集合改變時重建
+let dirty = {{grid:false, charts:false, events:false}};
+let source = null;
+
+function ensureZone(z){{
+  if(!(z in view.zones)) {{
+    view.zones[z] = {{on:0, off:0, last_state:null, on_devices:0, hot_count:0}};
+    dirty.grid = "rebuild";
+  }}
+  return view.zones[z];
+}}
+
+function addDevice(name){{
+  if(view.devices.has(name)) return;
+  view.devices.add(name);
+  if(!Array.from(deviceSel.options).some(o=>o.value===name)) deviceSel.add(new Option(name, name));
+  deviceInfo.textContent = `${{view.devices.size}} 台裝置`;
+}}
+
+function onSnapshot(snap){{
+  view = {{seq:snap.seq, device:snap.device, devices:new Set(), zones:{{}}, events:snap.events}};
+  for(const [z, v] of Object.entries(snap.by_zone)) view.zones[Number(z)] = v;
+  for(const d of snap.devices) addDevice(d);
+  dirty = {{grid:"rebuild", charts:true, events:true}};
+  schedule();
+}}
+
+function onDelta(items){{
+  if(!view) return;
+  for(const it of items) {{
+    if(it.seq <= view.seq) continue;      // 已包含在 snapshot 裡
+    view.seq = it.seq;
+    const dev = it.t==="ev" ? it.row.device : it.device;
+    addDevice(dev);
+    if(view.device && dev !== view.device) continue;
+
+    if(it.t==="ev") {{
+      view.events.unshift(it.row);
+      if(view.events.length > EVENT_ROWS) view.events.length = EVENT_ROWS;
+      dirty.events = true;
+      const z = it.row.zone, s = it.row.state;
+      if(z==null || (s!==0 && s!==1)) continue;
+      const v = ensureZone(z);
+      if(s===1) v.on++; else v.off++;
+      // 合計模式：任一台裝置 ON 即為 ON
+      v.on_devices += (s===1) - (it.prev===1);
+      v.last_state = v.on_devices > 0 ? 1 : 0;
+      if(!dirty.grid) dirty.grid = true;
+      dirty.charts = true;
+    }} else if(it.t==="hot") {{
+      ensureZone(it.zone).hot_count++;
+      dirty.charts = true;
+    }}
   }}
+  schedule();
+}}
 
-  const labels = Array.from({{length:9}}, (_,i)=>`Zone ${{i+1}}`);
+// 一個 frame 內的多個 delta 合併成一次重繪
+let rafPending = false;
+function schedule(){{
+  if(rafPending) return;
+  rafPending = true;
+  requestAnimationFrame(()=>{{ rafPending = false; render(); }});
+}}
 
-  // ===== Count chart (ON/OFF) =====
-  const onData=[], offData=[];
-  for(let z=1; z<=9; z++) {{
-    const v = st.by_zone[String(z)] || {{}};
-    onData.push(v.on || 0);
-    offData.push(v.off || 0);
+function sortedZones(){{
+  return Object.keys(view.zones).map(Number).sort((a,b)=>a-b);
+}}
+
+function render(){{
+  const zones = sortedZones();
+
+  // ===== LED grid：只改 class / 文字，不重建 innerHTML =====
+  if(dirty.grid === "rebuild") {{
+    ledsEl.innerHTML = "";
+    ledEls = {{}};
+    for(const z of zones) {{
+      const root = document.createElement("div");
+      root.innerHTML = `<div><b>Zone ${{z}}</b></div><div class="led-circle"></div><div class="muted"></div>`;
+      ledsEl.appendChild(root);
+      ledEls[z] = {{root, counts: root.lastElementChild}};
+    }}
+  }}
+  if(dirty.grid) {{
+    for(const z of zones) {{
+      const v = view.zones[z], el = ledEls[z];
+      el.root.className = "led " + (v.last_state===1 ? "on" : v.last_state===0 ? "off" : "unknown");
+      el.counts.textContent = `ON:${{v.on}} / OFF:${{v.off}}`;
+    }}
   }}
-  {{
-    const ctx = document.getElementById("countChart").getContext("2d");
+
+  if(dirty.charts) {{
+    const labels = zones.map(z=>`Zone ${{z}}`);
+    const onData = zones.map(z=>view.zones[z].on);
+    const offData = zones.map(z=>view.zones[z].off);
+    const hotCounts = zones.map(z=>view.zones[z].hot_count);
+
+    // ===== Count chart (ON/OFF) =====
     if(!countChart){{
-      countChart = new Chart(ctx, {{
+      countChart = new Chart(document.getElementById("countChart").getContext("2d"), {{
         type:"bar",
         data:{{labels,datasets:[
           {{label:"ON 次數", data:onData}},
@@ -351,22 +1019,15 @@ async function refresh(){{
         options:{{responsive:true, animation:false, scales:{{y:{{beginAtZero:true, ticks:{{precision:0}}}}}}}}
       }});
     }} else {{
+      countChart.data.labels = labels;
       countChart.data.datasets[0].data = onData;
       countChart.data.datasets[1].data = offData;
       countChart.update();
     }}
-  }}
 
-  // ===== Hot chart (hot events) =====
-  const hotCounts=[];
-  for(let z=1; z<=9; z++) {{
-    const v = ht.by_zone[String(z)] || {{}};
-    hotCounts.push(v.hot_count || 0);
-  }}
-  {{
-    const ctx = document.getElementById("hotChart").getContext("2d");
+    // ===== Hot chart (hot events) =====
     if(!hotChart){{
-      hotChart = new Chart(ctx, {{
+      hotChart = new Chart(document.getElementById("hotChart").getContext("2d"), {{
         type:"bar",
         data:{{labels,datasets:[
           {{label:"熱區事件次數", data:hotCounts}}
@@ -374,38 +1035,192 @@ async function refresh(){{
         options:{{responsive:true, animation:false, scales:{{y:{{beginAtZero:true, ticks:{{precision:0}}}}}}}}
       }});
     }} else {{
+      hotChart.data.labels = labels;
       hotChart.data.datasets[0].data = hotCounts;
       hotChart.update();
     }}
   }}
 
   // ===== Events table =====
-  const ev = await fetch("/api/events?limit=50").then(r=>r.json());
-  const tbody = document.getElementById("events");
-  tbody.innerHTML = ev.events.map(e => `
-    <tr>
-      <td>${{esc(e.ts_utc)}}</td>
-      <td class="mono">${{esc(e.topic)}}</td>
-      <td class="mono">${{esc(e.raw)}}</td>
-      <td>${{e.zone ?? "-"}}</td>
-      <td>${{fmtState(e.state)}}</td>
-    </tr>
-  `).join("");
+  if(dirty.events) {{
+    tbody.innerHTML = view.events.map(e => `
+      <tr>
+        <td>${{esc(e.ts_utc)}}</td>
+        <td class="mono">${{esc(e.device)}}</td>
+        <td class="mono">${{esc(e.raw)}}</td>
+        <td>${{e.zone ?? "-"}}</td>
+        <td>${{fmtState(e.state)}}</td>
+      </tr>
+    `).join("");
+  }}
+  dirty = {{grid:false, charts:false, events:false}};
+}}
+
+function connect(){{
+  if(source) source.close();
+  view = null;
+  // 沒選裝置 = 全部裝置依 zone id 合計
+  const q = deviceSel.value ? `?device=${{encodeURIComponent(deviceSel.value)}}` : "";
+  source = new EventSource("/api/live" + q);
+  source.addEventListener("snapshot", (e)=> onSnapshot(JSON.parse(e.data)));
+  source.addEventListener("delta", (e)=> onDelta(JSON.parse(e.data)));
+  // 斷線時 EventSource 會自動重連，重連後會先收到新的 snapshot
+}}
+
+// ===== Analytics / 熱度圖（與時間有關：定時重抓，分頁在背景時略過）=====
+const UTC_OFFSET = Math.round(-new Date().getTimezoneOffset() / 60);
+const fmtSec = (s)=> s < 60 ? `${{s}}s` : s < 3600 ? `${{s/60}}m` : `${{s/3600}}h`;
+let occChart=null, dwellChart=null, peakChart=null;
+
+function upsertBar(chart, id, labels, datasets, yOptions){{
+  if(chart) {{
+    chart.data.labels = labels;
+    datasets.forEach((d, i)=> chart.data.datasets[i].data = d.data);
+    chart.update();
+    return chart;
+  }}
+  return new Chart(document.getElementById(id).getContext("2d"), {{
+    type:"bar",
+    data:{{labels, datasets}},
+    options:{{responsive:true, animation:false, scales:{{y:{{beginAtZero:true, ...yOptions}}}}}}
+  }});
 }}
 
-refresh();
-setInterval(refresh, 2000);
+async function refreshAnalytics(){{
+  if(document.hidden) return;
+  const dev = deviceSel.value;
+  const q = dev ? `device=${{encodeURIComponent(dev)}}&` : "";
+  let occ, dwell, peak, heat;
+  try {{
+    [occ, dwell, peak, heat] = await Promise.all([
+      fetch(`/api/occupancy?${{q}}`).then(r=>r.json()),
+      fetch(`/api/dwell?${{q}}`).then(r=>r.json()),
+      fetch(`/api/peak_hours?${{q}}utc_offset=${{UTC_OFFSET}}`).then(r=>r.json()),
+      fetch(`/api/heatmap?${{q}}`).then(r=>r.json()),
+    ]);
+  }} catch(e) {{
+    return;    // 下一輪再試
+  }}
+  if(deviceSel.value !== dev) return;
+
+  const zones = Object.keys(occ.by_zone).map(Number).sort((a,b)=>a-b);
+  const pct = (label)=> zones.map(z=> Math.round(occ.by_zone[z][label] * 1000) / 10);
+  occChart = upsertBar(occChart, "occChart", zones.map(z=>`Zone ${{z}}`),
+    Object.keys(occ.windows).map(label=>({{label:`最近 ${{label}}（%）`, data:pct(label)}})),
+    {{max:100}});
+
+  const edges = dwell.edges_sec;
+  const dwellLabels = edges.map((e, i)=> i===0 ? `<${{fmtSec(e)}}` : `${{fmtSec(edges[i-1])}}–${{fmtSec(e)}}`)
+    .concat([`≥${{fmtSec(edges[edges.length-1])}}`]);
+  const dwellCounts = dwellLabels.map((_, i)=> Object.values(dwell.by_zone).reduce((n, v)=> n + v.counts[i], 0));
+  dwellChart = upsertBar(dwellChart, "dwellChart", dwellLabels, [{{label:"ON 段數", data:dwellCounts}}],
+    {{ticks:{{precision:0}}}});
+
+  const hours = Array.from({{length:24}}, (_, h)=> `${{h}}時`);
+  peakChart = upsertBar(peakChart, "peakChart", hours,
+    [{{label:"有人分鐘數", data:peak.total.on_seconds.map(s=> Math.round(s / 6) / 10)}},
+     {{label:"進入次數", data:peak.total.arrivals}}],
+    {{ticks:{{precision:0}}}});
+  document.getElementById("peakInfo").textContent =
+    peak.peak_hour == null ? "" : ` 尖峰：${{peak.peak_hour}}:00（UTC${{UTC_OFFSET >= 0 ? "+" : ""}}${{UTC_OFFSET}}）`;
+  drawHeatmap(heat.heatmap, heat.device);
+}}
+
+// ===== 空間熱度圖：cells 是 0..255 的量化密度，開根號後上色（低密度也看得到），再疊上區域格線 =====
+const heatRGB = (v)=> v < 0.5 ? [510*v, 510*v, 255*(1-2*v)] : [255, 255*(2-2*v), 0];   // 藍 -> 黃 -> 紅
+
+function drawHeatmap(hm, dev){{
+  const cv = document.getElementById("heatmapCanvas"), ctx = cv.getContext("2d");
+  const info = document.getElementById("heatmapInfo");
+  ctx.clearRect(0, 0, cv.width, cv.height);
+  if(!hm) {{ info.textContent = " 尚無資料（Edge_Pc 加 --heatmap）"; return; }}
+
+  const off = document.createElement("canvas");
+  off.width = hm.w; off.height = hm.h;
+  const img = off.getContext("2d").createImageData(hm.w, hm.h);
+  hm.cells.forEach((q, i)=> {{
+    const v = Math.sqrt(q / 255), [r, g, b] = heatRGB(v);
+    img.data.set([r, g, b, q ? 80 + 175*v : 0], i*4);
+  }});
+  off.getContext("2d").putImageData(img, 0, 0);
+  ctx.imageSmoothingEnabled = true;
+  ctx.drawImage(off, 0, 0, cv.width, cv.height);
+
+  const rows = Math.ceil({ZONE_COUNT} / {GRID_COLS});
+  ctx.strokeStyle = "rgba(255,255,255,.35)";
+  ctx.beginPath();
+  for(let c = 1; c < {GRID_COLS}; c++) {{ const x = c * cv.width / {GRID_COLS}; ctx.moveTo(x, 0); ctx.lineTo(x, cv.height); }}
+  for(let r = 1; r < rows; r++) {{ const y = r * cv.height / rows; ctx.moveTo(0, y); ctx.lineTo(cv.width, y); }}
+  ctx.stroke();
+
+  const age = Math.max(0, Math.round(Date.now() / 1000 - hm.received_at));
+  info.textContent = ` ${{dev}}：最高 ${{hm.scale.toFixed(1)}} 次/格，半衰期 ${{Math.round(hm.half_life_sec / 60)}} 分，${{age}} 秒前更新`;
+}}
+
+deviceSel.onchange = ()=>{{ connect(); refreshAnalytics(); }};
+document.addEventListener("visibilitychange", refreshAnalytics);
+setInterval(refreshAnalytics, {ANALYTICS_REFRESH_SEC * 1000});
+connect();
+refreshAnalytics();
 </script>
 </body>
 </html>
 """
 
+def events_page(ring: EventRing, limit: int, device: Optional[str],
+                before: Optional[int], since: Optional[int]) -> dict:
+    """/api/events body from a ring (caller holds its lock if it is still being written)."""
+    rows = ring.page(limit, before, since, None if device is None else (lambda e: e["device"] == device))
+    out = {"events": rows, "seq": ring.seq, "oldest_seq": ring.oldest_seq}
+    if since is not None:
+        # 不滿一頁 = 已掃到最新一筆（含被 device 過濾掉的），游標可以直接跳到 seq
+        out["next_since"] = rows[-1]["seq"] if len(rows) == limit else max(since, out["seq"])
+        out["missed"] = max(0, out["oldest_seq"] - since - 1)
+    else:
+        out["next_before"] = rows[-1]["seq"] if len(rows) == limit else None
+    return out
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    ensure_csv()
+    if not ingest_lock.acquire():
+        raise RuntimeError(
+            f"Another dashboard process holds {INGEST_LOCK} (MQTT / CSV owner). Run a single app:app process "
+            "and scale reads with: uvicorn read_api:app --workers N"
+        )
+    startup_mark("imports")
+    # 連線和還原狀態同時進行；還原完成前收到的訊息先暫存，open_ingest() 再依序套用
     threading.Thread(target=start_mqtt, daemon=True).start()
-    threading.Thread(target=hot_checker, daemon=True).start()
+    replayed = restore_state()
+    startup_mark("state_restored")
+    csv_log.start()
+    history.start()
+    if replayed:
+        save_state()
+    snapshot_stop = threading.Event()
+    threading.Thread(target=state_snapshot_loop, args=(snapshot_stop,), daemon=True).start()
+    if shared is not None:
+        shared.open()
+        publish_shared_state()
+        publisher = threading.Thread(target=shared_publish_loop, args=(snapshot_stop,), daemon=True)
+        publisher.start()
+    live.start(asyncio.get_running_loop())
+    hot_scheduler.start()
+    held = open_ingest()
+    startup_mark("ingest_open")
+    if held:
+        print(f"[STARTUP] Applied {held} messages received during the restore")
     yield
+    snapshot_stop.set()
+    live.close()
+    hot_scheduler.close()
+    save_state()
+    # shutdown: write out every queued row before the process exits
+    csv_log.close()
+    history.close()
+    if shared is not None:
+        publisher.join(5)
+        shared.close()
+    ingest_lock.release()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -413,23 +1228,166 @@ app = FastAPI(lifespan=lifespan)
 def home():
     return HTML_PAGE
 
+def cached_json(request: Request, key: str, version: int, build, cache: Optional[ResponseCache] = None) -> Response:
+    """JSON body serialized once per (key, version); If-None-Match on the current ETag -> 304."""
+    cache = cache or responses
+    etag = cache.etag(key, version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    etag, body = cache.get(key, version, build)
+    headers["ETag"] = etag
+    return Response(body, media_type="application/json", headers=headers)
+
 @app.get("/api/events")
-def api_events(limit: int = 50):
-    limit = max(1, min(200, limit))
-    with lock:
-        return {"events": list(events)[:limit]}
+def api_events(request: Request, limit: int = 50, device: Optional[str] = None,
+               before: Optional[int] = None, since: Optional[int] = None):
+    """
+    Events from the ring (every row has a "seq"):
+      default        newest `limit` events, newest first
+      before=<seq>   the page older than a cursor, newest first (next page: before=next_before)
+      since=<seq>    events after a cursor, oldest first (poll with since=next_since);
+                     "missed" > 0 means the cursor fell out of the ring
+    """
+    if before is not None and since is not None:
+        raise HTTPException(400, "use either before or since")
+    limit = max(1, min(EVENTS_PAGE_MAX, limit))
+
+    def build():
+        with events_lock:
+            return events_page(events, limit, device, before, since)
+
+    key = f"events?limit={limit}&device={device}&before={before}&since={since}"
+    return cached_json(request, key, events.seq, build)
+
+@app.get("/api/live")
+async def api_live(device: Optional[str] = None):
+    """
+    Server-Sent Events: one "snapshot" event, then "delta" events (lists of items with seq > snapshot seq):
+      {"t": "ev", "row": <event row>, "prev": <previous state of row's (device, zone) or null>}
+      {"t": "hot", "device", "zone", "at"}
+    Deltas of every device are sent to every client (serialized once); the page filters by device.
+    """
+    q = live.subscribe()
+    try:
+        snapshot = await run_in_threadpool(live_snapshot, device)
+    except BaseException:
+        live.unsubscribe(q)
+        raise
+    return StreamingResponse(
+        live_stream(q, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/history")
+def api_history(start: Optional[str] = None, end: Optional[str] = None, bucket: str = "hour",
+                device: Optional[str] = None, zone: Optional[int] = None):
+    """
+    Per-zone ON/OFF counts, occupied seconds and hot events over [start, end) in minute / hour / day
+    buckets (UTC). start / end: epoch seconds or ISO-8601; default = the last 24 h.
+    occupancy = on_seconds / bucket length (summed over devices when no device is given).
+    """
+    if bucket not in BUCKETS:
+        raise HTTPException(400, f"bucket must be one of {list(BUCKETS)}")
+    try:
+        t1 = parse_time(end) if end is not None else time.time()
+        t0 = parse_time(start) if start is not None else t1 - HISTORY_DEFAULT_RANGE_SEC
+        res = history.query(t0, t1, BUCKETS[bucket], device, zone, open_periods=current_on_periods(device))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    size = res["bucket_sec"]
+    for s in res["by_zone"].values():
+        s["occupancy"] = [round(sec / size, 4) for sec in s["on_seconds"]]
+    res["by_zone"] = {str(z): s for z, s in res["by_zone"].items()}
+    return JSONResponse({"bucket": bucket, "device": device, **res})
+
+@app.get("/api/history/events")
+def api_history_events(start: str, end: Optional[str] = None, device: Optional[str] = None,
+                       zone: Optional[int] = None, limit: int = 1000):
+    try:
+        t0, t1 = parse_time(start), parse_time(end) if end is not None else time.time()
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    rows = history.events_between(t0, t1, device, zone, max(1, min(10000, limit)))
+    return JSONResponse({"events": rows})
+
+# Response bodies shared with read_api.py (reg = a registry look-alike over the published state)
+def devices_body(reg=None) -> dict:
+    reg = reg or registry
+    return {"devices": compute_devices(reg), "zones": reg.zone_count()}
+
+def stats_body(device: Optional[str], reg=None) -> dict:
+    by_zone = compute_counts(device, reg)
+    return {"device": device, "by_zone": {str(k): v for k, v in by_zone.items()}}
+
+def heat_body(device: Optional[str], reg=None) -> dict:
+    hz = compute_hot_counts(device, reg)
+    return {
+        "device": device,
+        "hot_seconds": HOT_SECONDS,
+        "by_zone": {
+            str(z): {
+                "hot_count": v["hot_count"],
+                "hot_seconds": hot_seconds(z, device),
+                "last_hot_at": v["last_hot_at"],
+            }
+            for z, v in hz.items()
+        }
+    }
+
+@app.get("/api/devices")
+def api_devices(request: Request):
+    return cached_json(request, "devices", state_version, devices_body)
 
 @app.get("/api/stats")
-def api_stats():
-    with lock:
-        by_zone = compute_counts()
-    return JSONResponse({"by_zone": {str(k): v for k, v in by_zone.items()}})
+def api_stats(request: Request, device: Optional[str] = None):
+    return cached_json(request, f"stats?device={device}", state_version, lambda: stats_body(device))
 
 @app.get("/api/heat")
-def api_heat():
-    with lock:
-        hz = compute_hot_counts()
+def api_heat(request: Request, device: Optional[str] = None):
+    return cached_json(request, f"heat?device={device}", state_version, lambda: heat_body(device))
+
+@app.get("/api/heatmap")
+def api_heatmap(request: Request, device: Optional[str] = None):
+    """
+    Latest edge heatmap of a device (default: the most recently received one), "heatmap": null if none:
+    cells = h*w row-major quantized densities 0..255, value ~= cell / 255 * scale detections.
+    """
+    return cached_json(request, f"heatmap?device={device}", heatmaps.version, lambda: heatmaps.body(device))
+
+@app.get("/api/occupancy")
+def api_occupancy(device: Optional[str] = None):
+    """Share of the last 1 / 15 / 60 minutes each zone was ON (changes with time, so not cached)."""
     return JSONResponse({
-        "hot_seconds": HOT_SECONDS,
-        "by_zone": {str(z): {"hot_count": hz[z]["hot_count"]} for z in range(1, 10)}
+        "device": device,
+        "windows": WINDOWS,
+        "by_zone": {str(z): v for z, v in compute_occupancy(device).items()},
+    })
+
+@app.get("/api/dwell")
+def api_dwell(request: Request, device: Optional[str] = None):
+    """Histogram of completed ON-period lengths: counts[i] = periods in [edges[i-1], edges[i]) seconds."""
+    def build():
+        return {
+            "device": device,
+            "edges_sec": DWELL_EDGES_SEC,
+            "by_zone": {str(z): v for z, v in compute_dwell(device).items()},
+        }
+    return cached_json(request, f"dwell?device={device}", state_version, build)
+
+@app.get("/api/peak_hours")
+def api_peak_hours(device: Optional[str] = None, utc_offset: int = 0):
+    """ON seconds and arrivals per hour of day (local hours at UTC+utc_offset), per zone and over all zones."""
+    if not -12 <= utc_offset <= 14:
+        raise HTTPException(400, "utc_offset must be between -12 and 14")
+    by_zone = compute_hour_profile(device, utc_offset)
+    total_on = np.sum([v["on_seconds"] for v in by_zone.values()], axis=0)
+    total_arr = np.sum([v["arrivals"] for v in by_zone.values()], axis=0)
+    return JSONResponse({
+        "device": device,
+        "utc_offset": utc_offset,
+        "peak_hour": int(np.argmax(total_on)) if total_on.any() else None,
+        "total": {"on_seconds": np.round(total_on, 1).tolist(), "arrivals": total_arr.tolist()},
+        "by_zone": {str(z): v for z, v in by_zone.items()},
     })
@@ -0,0 +1,542 @@
+"""
+Dashboard load test: runs the real app (uvicorn + lifespan: CSV writer, history store,
+hot scheduler, live push) in-process without AWS, injects MQTT traffic and hits the HTTP
+API from concurrent clients, then reports as JSON:
+
+    ingest    msgs/s, end-to-end ingest latency (send -> on_message done), writer backlog drain
+    hot       timing error of hot events vs. their exact deadline (on_since + hot seconds)
+    api       per-endpoint p50 / p95 / p99 latency and status counts, idle and under load
+
+Traffic is synthetic (codes / JSON / occupancy frames / journal batches over several devices)
+or replayed from a dashboard CSV log. It goes either straight into app.on_message or through
+Edge_Pc's LocalBroker on one delivery thread (like the awscrt network thread).
+With --read-workers N the API clients hit `uvicorn read_api:app --workers N` (state shared by
+the in-process ingest app through its memory-mapped file) instead of the ingest process, and
+the report checks that both serve identical bodies and ETags once ingest is done.
+All files (CSV, history DB, snapshot) are written to a temp directory.
+
+Run:
+    python bench_dashboard.py                               # max rate, 30000 synthetic messages
+    python bench_dashboard.py --rate 2000 --seconds 20      # paced load
+    python bench_dashboard.py --replay peopleflow.csv --ingest broker
+    python bench_dashboard.py --compare bench_dashboard.json
+    python bench_dashboard.py --read-workers 4 --api-clients 16
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+BENCH_OUTPUT_PATH = "./bench_dashboard.json"
+EDGE_DIR = Path(__file__).resolve().parent.parent / "Edge_Pc"
+DEFAULT_MESSAGES = 30000
+HOT_PROBE_DEVICE = "bench-hot"
+# 與 Edge_Pc/bench.py 相同的固定直方圖邊界（毫秒），不同次的結果才能直接比較
+HIST_EDGES_MS = [0.0, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf")]
+API_ENDPOINTS = [
+    "/api/stats",
+    "/api/heat",
+    "/api/events?limit=50",
+    "/api/devices",
+    "/api/stats?device=cam-001",
+    "/api/history?bucket=minute",
+    "/api/occupancy",
+    "/api/dwell",
+    "/api/peak_hours?utc_offset=8",
+]
+# read_api.py serves only these
+READ_API_ENDPOINTS = [
+    "/api/stats",
+    "/api/heat",
+    "/api/events?limit=50",
+    "/api/devices",
+    "/api/stats?device=cam-001",
+]
+
+
+def summarize(samples) -> dict:
+    """Latency summary (ms) and histogram."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    counts, _ = np.histogram(ms, bins=HIST_EDGES_MS)
+    return {
+        "count": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "max_ms": round(float(ms.max()), 4),
+        "histogram": counts.tolist(),
+    }
+
+
+# ========= Traffic =========
+def synthetic_traffic(n: int, devices: int, zones: int, seed: int):
+    """(topic, payload) pairs: 60% codes, 10% JSON, 20% occupancy frames, 10% journal batches."""
+    rng = random.Random(seed)
+    topics = [f"project/esp8266_led/cam-{d:03d}" for d in range(1, devices + 1)]
+    seq = {t: 0 for t in topics}
+    for _ in range(n):
+        topic = rng.choice(topics)
+        kind = rng.random()
+        if kind < 0.6:
+            raw = str(rng.randint(1, zones) * 10 + rng.randint(0, 1))
+        elif kind < 0.7:
+            raw = json.dumps({"zone": rng.randint(1, zones), "state": rng.randint(0, 1)})
+        elif kind < 0.9:
+            raw = f"b{zones}:{rng.getrandbits(zones):x}"
+        else:
+            q = seq[topic]
+            batch = [[q + i, time.time(), rng.randint(1, zones), rng.randint(0, 1)] for i in range(5)]
+            seq[topic] = q + 5
+            raw = json.dumps({"jid": "bench", "batch": batch})
+        yield topic, raw
+
+
+def replay_traffic(csv_path: str, limit: int):
+    from csv_writer import csv_files, read_csv_rows
+    n = 0
+    for f in csv_files(Path(csv_path)):
+        for row in read_csv_rows(f):
+            yield row["topic"], row["raw"]
+            n += 1
+            if limit and n >= limit:
+                return
+
+
+class Injector:
+    """Sends (topic, payload) into the app and records send -> on_message-done latency."""
+
+    def __init__(self, app, mode: str):
+        self.app = app
+        self.mode = mode
+        self.latencies = []
+        self.last_done = 0.0           # perf_counter when the last recorded message was processed
+        self._q: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self.broker = None
+        if mode == "broker":
+            sys.path.insert(0, str(EDGE_DIR))
+            from local_broker import LocalBroker
+            self.broker = LocalBroker()
+            app.subscribe_topics(self.broker)
+            self._thread = threading.Thread(target=self._deliver, name="bench-network", daemon=True)
+            self._thread.start()
+
+    def send(self, topic: str, raw: str, record: bool = True):
+        t = time.perf_counter()
+        if self.broker is None:
+            self.app.on_message(topic, raw.encode("utf-8"))
+            if record:
+                self._done(t)
+        else:
+            self._q.put((t, topic, raw, record))
+
+    def _deliver(self):
+        while True:
+            item = self._q.get()
+            if item is None:
+                return
+            t, topic, raw, record = item
+            # LocalBroker 在這個執行緒上同步呼叫 app.on_message
+            self.broker.publish(topic, raw)
+            if record:
+                self._done(t)
+
+    def _done(self, t_sent: float):
+        now = time.perf_counter()
+        with self._lock:
+            self.latencies.append(now - t_sent)
+            self.last_done = now
+
+    def drain(self):
+        """Waits until the delivery thread has processed everything sent so far (then stops it)."""
+        if self.broker is not None:
+            self._q.put(None)
+            self._thread.join()
+
+
+# ========= HTTP clients =========
+def api_client(port: int, stop: threading.Event, results: dict, lock: threading.Lock, seed: int, endpoints: list):
+    """Polls the endpoints round-robin like a dashboard page would (If-None-Match with the last ETag)."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    etags = {}
+    i = seed
+    while not stop.is_set():
+        path = endpoints[i % len(endpoints)]
+        i += 1
+        headers = {"If-None-Match": etags[path]} if path in etags else {}
+        t = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            status = "error"
+        else:
+            status = str(resp.status)
+            if resp.getheader("ETag"):
+                etags[path] = resp.getheader("ETag")
+        dt = time.perf_counter() - t
+        with lock:
+            r = results.setdefault(path, {"latency": [], "status": {}})
+            r["latency"].append(dt)
+            r["status"][status] = r["status"].get(status, 0) + 1
+    conn.close()
+
+
+def run_api_phase(port: int, clients: int, seconds: float, during=None, endpoints=API_ENDPOINTS) -> dict:
+    """API clients for `seconds` (or while `during` runs); returns per-endpoint summaries."""
+    stop = threading.Event()
+    results, lock = {}, threading.Lock()
+    threads = [threading.Thread(target=api_client, args=(port, stop, results, lock, i, endpoints), daemon=True)
+               for i in range(clients)]
+    for t in threads:
+        t.start()
+    t0 = time.perf_counter()
+    if during is not None:
+        during()
+    else:
+        time.sleep(seconds)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    for t in threads:
+        t.join()
+    out = {}
+    for path, r in sorted(results.items()):
+        out[path] = {**summarize(r["latency"]), "status": r["status"]}
+    total = sum(v["count"] for v in out.values())
+    return {"seconds": round(elapsed, 3), "requests": total, "requests_per_sec": round(total / elapsed, 1),
+            "endpoints": out}
+
+
+# ========= Hot-event timing probes =========
+class HotProbe:
+    """
+    Turns zones of a dedicated device ON for hot_seconds + margin, then OFF, and compares
+    the hot scheduler's firing time with the exact deadline.
+    """
+
+    def __init__(self, app, injector: Injector, hot_seconds: float, every: float):
+        self.app = app
+        self.injector = injector
+        self.hot_seconds = hot_seconds
+        self.every = every
+        self.fired = []               # (deadline, fired at)
+        self.expected = 0
+        self._stop = threading.Event()
+        for z in range(1, 10):
+            app.HOT_SECONDS_BY_ZONE[(HOT_PROBE_DEVICE, z)] = hot_seconds
+        original = app.hot_scheduler.on_due
+
+        def on_due(key, deadline):
+            if key[0] == HOT_PROBE_DEVICE:
+                self.fired.append((deadline, time.time()))
+            original(key, deadline)
+
+        app.hot_scheduler.on_due = on_due
+        self._thread = threading.Thread(target=self._run, name="bench-hot-probe", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        topic = f"{self.app.DEVICE_TOPIC_PREFIX}{HOT_PROBE_DEVICE}"
+        pending = []                   # (off at, zone)
+        z = 0
+        next_on = time.monotonic()
+        while not self._stop.is_set() or pending:
+            now = time.monotonic()
+            if not self._stop.is_set() and now >= next_on:
+                z = z % 9 + 1
+                self.injector.send(topic, str(z * 10 + 1), record=False)
+                pending.append((now + self.hot_seconds + 0.2, z))
+                self.expected += 1
+                next_on = now + self.every
+            for item in [p for p in pending if p[0] <= now]:
+                self.injector.send(topic, str(item[1] * 10), record=False)
+                pending.remove(item)
+            time.sleep(0.005)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self) -> dict:
+        errors = [fired - deadline for deadline, fired in self.fired]
+        return {"hot_seconds": self.hot_seconds, "expected": self.expected, "fired": len(self.fired),
+                "error": summarize(errors)}
+
+
+# ========= Server =========
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app.app, host="127.0.0.1", port=port, log_level="warning",
+                                           timeout_graceful_shutdown=2))
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def start_read_workers(workers: int, port: int) -> subprocess.Popen:
+    """uvicorn read_api:app --workers N in the current (temp) directory, next to the ingest app's shared file."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "read_api:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--app-dir", str(Path(__file__).resolve().parent)],
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("read_api workers exited")
+        try:
+            if http_get(port, "/api/devices")[0] == 200:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("read_api workers did not start")
+
+
+def http_get(port: int, path: str):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        return resp.status, resp.getheader("ETag"), resp.read()
+    finally:
+        conn.close()
+
+
+def compare_read_api(app_port: int, read_port: int, publish_sec: float) -> dict:
+    """After ingest stopped: every read endpoint must return the same body and ETag on both servers."""
+    time.sleep(publish_sec * 3)
+    mismatched = []
+    paths = READ_API_ENDPOINTS + ["/api/heat?device=cam-002", "/api/events?limit=20&before=200",
+                                  "/api/events?limit=30&since=100&device=cam-002"]
+    for path in paths:
+        ingest, reader = http_get(app_port, path), http_get(read_port, path)
+        if ingest != reader:
+            mismatched.append(path)
+    return {"endpoints": len(paths), "mismatched": mismatched}
+
+
+def wait_drained(app, timeout: float = 60.0) -> float:
+    """Seconds until the CSV / history writer queues are empty after ingest stopped."""
+    t0 = time.perf_counter()
+    while (app.csv_log.pending() or app.history.pending()) and time.perf_counter() - t0 < timeout:
+        time.sleep(0.01)
+    return round(time.perf_counter() - t0, 3)
+
+
+# ========= Report =========
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5, check=True, cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def run_metadata(args) -> dict:
+    import fastapi
+    import uvicorn
+    return {
+        "label": args.label,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "fastapi": fastapi.__version__,
+        "uvicorn": uvicorn.__version__,
+        "options": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "label")},
+        "hist_edges_ms": [e if e != float("inf") else "inf" for e in HIST_EDGES_MS],
+    }
+
+
+def format_report(report: dict) -> str:
+    ing, hot = report["ingest"], report["hot"]
+    lat = ing["latency"]
+    lines = [
+        f"[BENCH] ingest: {ing['messages']} msgs in {ing['seconds']:.2f}s = {ing['msgs_per_sec']:.0f} msg/s "
+        f"({ing['mode']}), latency p50 {lat.get('p50_ms', 0):.3f} / p99 {lat.get('p99_ms', 0):.3f} ms, "
+        f"writer drain {ing['drain_sec']:.2f}s",
+        f"[BENCH] hot: {hot['fired']}/{hot['expected']} fired, error p50 {hot['error'].get('p50_ms', 0):.2f} / "
+        f"p99 {hot['error'].get('p99_ms', 0):.2f} / max {hot['error'].get('max_ms', 0):.2f} ms",
+    ]
+    for phase in ("idle", "load"):
+        api = report["api"][phase]
+        lines.append(f"[BENCH] api {phase}: {api['requests_per_sec']:.0f} req/s")
+        for path, st in api["endpoints"].items():
+            lines.append(f"        {path:<28} p50 {st['p50_ms']:8.3f}  p99 {st['p99_ms']:8.3f} ms  {st['status']}")
+    ra = report.get("read_api")
+    if ra:
+        lines.append(f"[BENCH] read_api ({ra['workers']} workers): {ra['endpoints'] - len(ra['mismatched'])}/"
+                     f"{ra['endpoints']} endpoints identical to the ingest app"
+                     + (f", mismatched: {ra['mismatched']}" if ra["mismatched"] else ""))
+    return "\n".join(lines)
+
+
+def format_comparison(old: dict, new: dict) -> str:
+    o, n = old["ingest"], new["ingest"]
+    lines = [f"[COMPARE] {old['meta'].get('git')} ({old['meta'].get('label') or '-'}) -> "
+             f"{new['meta'].get('git')} ({new['meta'].get('label') or '-'})",
+             f"  ingest msg/s {o['msgs_per_sec']:.0f} -> {n['msgs_per_sec']:.0f}, "
+             f"p99 {o['latency'].get('p99_ms', 0):.3f} -> {n['latency'].get('p99_ms', 0):.3f} ms",
+             f"  hot error p99 {old['hot']['error'].get('p99_ms', 0):.2f} -> "
+             f"{new['hot']['error'].get('p99_ms', 0):.2f} ms"]
+    for path, st in new["api"]["load"]["endpoints"].items():
+        b = old["api"]["load"]["endpoints"].get(path)
+        if b:
+            lines.append(f"  load {path:<28} p50 {b['p50_ms']:8.3f} -> {st['p50_ms']:8.3f}  "
+                         f"p99 {b['p99_ms']:8.3f} -> {st['p99_ms']:8.3f} ms")
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dashboard ingest / API load test (no AWS)")
+    parser.add_argument("--messages", type=int, default=DEFAULT_MESSAGES,
+                        help="messages to inject (replay: max rows, 0 = whole log)")
+    parser.add_argument("--seconds", type=float, default=0.0,
+                        help="with --rate: run this long instead of a fixed message count")
+    parser.add_argument("--rate", type=float, default=0.0, help="messages/s, 0 = as fast as possible")
+    parser.add_argument("--ingest", choices=["direct", "broker"], default="direct",
+                        help="direct: call on_message; broker: LocalBroker on one delivery thread")
+    parser.add_argument("--replay", metavar="CSV", help="replay a dashboard CSV log instead of synthetic traffic")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--zones", type=int, default=9)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-clients", type=int, default=4)
+    parser.add_argument("--read-workers", type=int, default=0,
+                        help="serve the API clients from N read_api.py workers instead of the ingest app")
+    parser.add_argument("--idle-seconds", type=float, default=3.0, help="API-only phase before the load")
+    parser.add_argument("--hot-seconds", type=float, default=1.0, help="threshold of the hot-event probes")
+    parser.add_argument("--hot-every", type=float, default=0.25, help="seconds between hot probes")
+    parser.add_argument("--app-logs", action="store_true", help="keep the app's per-message prints")
+    parser.add_argument("--label", default="", help="free text stored in the report")
+    parser.add_argument("--out", default=BENCH_OUTPUT_PATH)
+    parser.add_argument("--compare", metavar="JSON", help="earlier report to compare against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    out_path = Path(args.out).resolve()
+    replay_path = Path(args.replay).resolve() if args.replay else None
+    # 先讀進來：--compare 與 --out 常是同一個檔案
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+
+    workdir = tempfile.mkdtemp(prefix="bench_dashboard_")
+    os.chdir(workdir)
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import app
+    if not args.app_logs:
+        app.print = lambda *a, **k: None
+    app.start_mqtt = lambda: None       # 不連 AWS；broker 模式由 Injector 訂閱
+
+    port = free_port()
+    server, server_thread = start_server(app, port)
+    injector = Injector(app, args.ingest)
+    print(f"[BENCH] app on 127.0.0.1:{port}, files in {workdir}, ingest={args.ingest}")
+    api_port, endpoints, readers = port, API_ENDPOINTS, None
+    if args.read_workers:
+        api_port, endpoints = free_port(), READ_API_ENDPOINTS
+        readers = start_read_workers(args.read_workers, api_port)
+        print(f"[BENCH] API clients -> read_api on 127.0.0.1:{api_port} ({args.read_workers} workers)")
+
+    if replay_path:
+        traffic = replay_traffic(str(replay_path), args.messages)
+    else:
+        count = int(args.rate * args.seconds) if args.rate and args.seconds else args.messages
+        traffic = synthetic_traffic(count, args.devices, args.zones, args.seed)
+
+    idle = run_api_phase(api_port, args.api_clients, args.idle_seconds, endpoints=endpoints)
+
+    ingest = {}
+
+    def inject():
+        probe = HotProbe(app, injector, args.hot_seconds, args.hot_every).start()
+        n = 0
+        t0 = time.perf_counter()
+        for topic, raw in traffic:
+            if args.rate:
+                delay = t0 + n / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            injector.send(topic, raw)
+            n += 1
+        probe.close()
+        injector.drain()
+        elapsed = injector.last_done - t0
+        ingest.update(messages=n, seconds=round(elapsed, 3), msgs_per_sec=round(n / elapsed, 1),
+                      mode=args.ingest, latency=summarize(injector.latencies))
+        # 等最後一個 probe 的熱區期限過去
+        time.sleep(args.hot_seconds + 0.3)
+        ingest["drain_sec"] = wait_drained(app)
+        ingest["probe"] = probe
+
+    load = run_api_phase(api_port, args.api_clients, 0, during=inject, endpoints=endpoints)
+    probe = ingest.pop("probe")
+    read_api = None
+    if readers is not None:
+        read_api = {"workers": args.read_workers, **compare_read_api(port, api_port, app.SHARED_PUBLISH_SEC)}
+        readers.terminate()
+        readers.wait(10)
+
+    report = {
+        "meta": run_metadata(args),
+        "ingest": ingest,
+        "hot": probe.report(),
+        "api": {"idle": idle, "load": load},
+        "read_api": read_api,
+        "app": {
+            "zones": app.registry.zone_count(),
+            "csv": dict(app.csv_log.stats),
+            "history": dict(app.history.stats),
+            "hot_scheduler": dict(app.hot_scheduler.stats),
+            "response_cache": dict(app.responses.stats),
+        },
+    }
+    server.should_exit = True
+    server_thread.join(10)
+
+    print(format_report(report))
+    out_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"[BENCH] Report -> {out_path}")
+    if baseline is not None:
+        print(format_comparison(baseline, report))
+
+
+if __name__ == "__main__":
+    main()
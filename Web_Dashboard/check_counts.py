@@ -0,0 +1,127 @@
+# check_counts.py — verifies the running ON/OFF counters against a full recount from the CSV log
+#
+# Feeds a deterministic mixed stream (legacy codes, JSON, occupancy frames, journal events
+# with duplicates, junk) through app.on_message, drains the CSV writer into a temp dir,
+# recounts every CSV row (including rotated .gz files) and compares with compute_counts(),
+# for all devices together and for each device (messages are spread over several device topics).
+# The stream is longer than the `events` deque, so the old deque-based counts would fail.
+#
+# Run (no AWS needed):
+#   python check_counts.py
+#   python check_counts.py --messages 100000 --seed 7
+#   python check_counts.py --csv peopleflow.csv --url http://127.0.0.1:8000
+#       (compare a running dashboard with its CSV; counters survive restarts through the
+#        state snapshot + CSV replay, so the whole log must match)
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import urllib.request
+from pathlib import Path
+
+import app
+from csv_writer import CsvWriter, csv_files, read_csv_rows
+
+
+TOPICS = ["project/esp8266_led"] + [f"{app.DEVICE_TOPIC_PREFIX}cam-{i:03d}" for i in range(1, 4)]
+
+
+def recount_from_csv(csv_path: Path, device=None):
+    """
+    {zone: {"on", "off", "last_state"}} recomputed from every CSV row, oldest file first.
+    device=None sums all devices per zone (last_state: ON if any device's last state is ON).
+    """
+    counts = {z: {"on": 0, "off": 0, "last_state": None} for z in app.ZONE_IDS}
+    last = {}
+    for path in csv_files(csv_path):
+        for row in read_csv_rows(path):
+            if not row["zone"] or row["state"] not in ("0", "1"):
+                continue
+            if device is not None and row.get("device") != device:
+                continue
+            z, s = int(row["zone"]), int(row["state"])
+            c = counts.setdefault(z, {"on": 0, "off": 0, "last_state": None})
+            c["on" if s == 1 else "off"] += 1
+            last[(row.get("device"), z)] = s
+    for (_, z), s in last.items():
+        prev = counts[z]["last_state"]
+        counts[z]["last_state"] = s if prev is None else max(prev, s)
+    return counts
+
+
+def message_stream(n: int, seed: int):
+    """Deterministic mix of every payload kind the dashboard accepts (and some it rejects)."""
+    rng = random.Random(seed)
+    zones = list(app.ZONE_IDS)
+    seq = 0
+    t0 = 1_700_000_000.0
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.45:
+            yield str(rng.choice(zones) * 10 + rng.randint(0, 1))
+        elif kind < 0.55:
+            yield json.dumps({"zone": rng.choice(zones), "state": rng.randint(0, 1)})
+        elif kind < 0.70:
+            mask = rng.getrandbits(len(zones))
+            yield f"b{len(zones)}:{mask:x}"
+        elif kind < 0.90:
+            # journal batch; sometimes resent (QoS1 redelivery / replay) -> duplicates must not count
+            start = seq if rng.random() < 0.8 else max(0, seq - 5)
+            batch = [[q, t0 + q * 0.5, rng.choice(zones), rng.randint(0, 1)] for q in range(start, start + 5)]
+            seq = max(seq, start + 5)
+            yield json.dumps({"jid": "check", "batch": batch})
+        else:
+            yield rng.choice(["abc", "99", "{}", "", "b9:zz", str(rng.randint(100, 999))])
+
+
+def check_offline(messages: int, seed: int) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "peopleflow.csv"
+        app.csv_log = CsvWriter(csv_path, app.CSV_HEADER, rotate_bytes=256 * 1024, compress=True).start()
+        app.print = lambda *a, **k: None   # on_message 每則都會 print，這裡不需要
+        for i, raw in enumerate(message_stream(messages, seed)):
+            app.on_message(TOPICS[i % len(TOPICS)], raw.encode("utf-8"))
+        app.csv_log.close()
+        del app.print
+
+        files = len(csv_files(csv_path))
+        ok = report(app.compute_counts(), recount_from_csv(csv_path),
+                    f"{messages} messages, {files} CSV file(s), events deque={len(app.events)}")
+        for device in app.registry.devices():
+            ok &= report(app.compute_counts(device), recount_from_csv(csv_path, device), f"device {device}")
+    return ok
+
+
+def check_live(url: str, csv_path: Path) -> bool:
+    with urllib.request.urlopen(url.rstrip("/") + "/api/stats", timeout=10) as resp:
+        by_zone = json.load(resp)["by_zone"]
+    live = {int(z): v for z, v in by_zone.items()}
+    return report(live, recount_from_csv(csv_path), f"{url} vs {csv_path}")
+
+
+def report(live, expected, what: str) -> bool:
+    bad = [z for z in expected if live.get(z) != expected[z]]
+    total = sum(v["on"] + v["off"] for v in expected.values())
+    print(f"[CHECK] {what}: {total} ON/OFF events recounted from CSV")
+    for z in bad:
+        print(f"[CHECK] zone {z}: counters={live.get(z)} csv={expected[z]}")
+    print("[CHECK] PASS" if not bad else f"[CHECK] FAIL ({len(bad)} zone(s) differ)")
+    return not bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Running ON/OFF counters vs. full recount from the CSV log")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="check a running dashboard instead of an in-process run")
+    parser.add_argument("--csv", default=str(app.CSV_PATH), help="CSV log of the running dashboard (--url)")
+    args = parser.parse_args()
+
+    ok = check_live(args.url, Path(args.csv)) if args.url else check_offline(args.messages, args.seed)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
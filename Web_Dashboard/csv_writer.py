@@ -0,0 +1,271 @@
+# csv_writer.py — buffered background CSV writer for the dashboard ingest path
+#
+# on_message only enqueues a row (queue.SimpleQueue: no Python-level lock, never blocks);
+# one writer thread appends rows in batches, flushes every flush_sec, fsyncs per policy
+# and rotates the file by size and/or UTC day, optionally gzip-compressing rotated files.
+#
+# fsync_sec:
+#   None -> never fsync (the OS writes back on its own; fastest)
+#   0    -> fsync after every flushed batch
+#   N    -> fsync at most every N seconds
+#
+# An existing live file whose first line is not `header` (a header-less log from the first app.py
+# versions, or one written before a column was added) is rotated out on open, so one file never
+# mixes rows of different widths.
+#
+# mark() returns the exact log position after every row submitted before it (state snapshots
+# record it, so a restart only replays the rows written after the snapshot).
+
+import csv
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Sequence
+
+_STOP = object()
+
+
+def csv_files(path: Path):
+    """Rotated files of `path` (oldest first, .gz or plain) followed by the live file."""
+    path = Path(path)
+    rotated = sorted(p for p in path.parent.glob(f"{path.stem}-*{path.suffix}*")
+                     if p.name.endswith(path.suffix) or p.name.endswith(path.suffix + ".gz"))
+    return rotated + ([path] if path.exists() else [])
+
+
+# Logs written by the first app.py versions have no header row; their rows use these columns
+LEGACY_HEADER = ["ts_utc", "topic", "raw", "zone", "state"]
+
+
+def read_csv_rows(path: Path, offset: int = 0):
+    """
+    Yields each data row of one (possibly gzip-compressed) log file as a dict,
+    optionally starting at a position returned by CsvWriter.mark() instead of the first row.
+    """
+    path = Path(path)
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", newline="", encoding="utf-8") as f:
+        first = next(csv.reader([f.readline()]), [])
+        if not first:
+            return
+        has_header = first[0] == LEGACY_HEADER[0]
+        if offset:
+            f.seek(offset)
+        elif not has_header:
+            f.seek(0)
+        yield from csv.DictReader(f, first if has_header else LEGACY_HEADER)
+
+
+def csv_rows_after(path: Path, position: Optional[dict]):
+    """
+    Rows written after a CsvWriter.mark() position, across any rotations since then
+    (every row of every file when position is None).
+    """
+    path = Path(path)
+    files = csv_files(path)
+    if position is None:
+        for f in files:
+            yield from read_csv_rows(f)
+        return
+    # 標記之後輪替出去的檔案：第一個就是標記當時的 live 檔，從 offset 接著讀
+    rotated = [f for f in files if f != path and (position["rotated"] is None or f.name > position["rotated"])]
+    tail = rotated + ([path] if path.exists() else [])
+    for i, f in enumerate(tail):
+        yield from read_csv_rows(f, position["offset"] if i == 0 else 0)
+
+
+class CsvMark:
+    """Log position after every row queued before CsvWriter.mark(); wait() for the writer to reach it."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.position: Optional[dict] = None
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """{"file", "offset", "rotated"} or None on timeout; "rotated" = newest rotated file at that time."""
+        self._done.wait(timeout)
+        return self.position
+
+    def _resolve(self, position: dict):
+        self.position = position
+        self._done.set()
+
+
+class CsvWriter:
+    def __init__(
+        self,
+        path: Path,
+        header: Sequence[str],
+        flush_sec: float = 1.0,
+        batch_max: int = 5000,
+        fsync_sec: Optional[float] = None,
+        rotate_bytes: int = 0,
+        rotate_daily: bool = False,
+        compress: bool = False,
+    ):
+        self.path = Path(path)
+        self.header = list(header)
+        self.flush_sec = flush_sec
+        self.batch_max = batch_max
+        self.fsync_sec = fsync_sec
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "fsyncs": 0, "rotations": 0, "errors": 0}
+
+        self._q: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._file = None
+        self._writer = None
+        self._day = None
+        self._last_rotated: Optional[str] = None
+        self._last_fsync_t = 0.0
+        self._thread = threading.Thread(target=self._run, name="csv-writer", daemon=True)
+
+    # ===== Producer side (any thread) =====
+    def submit(self, row: dict) -> None:
+        """Queue one row (dict keyed by header). Safe before start(); rows wait in the queue."""
+        self._q.put([row.get(h, "") for h in self.header])
+        self.stats["queued"] += 1
+
+    def pending(self) -> int:
+        return self._q.qsize()
+
+    def mark(self) -> CsvMark:
+        """Queue a position marker behind every row submitted so far (resolved by the writer thread)."""
+        m = CsvMark()
+        self._q.put(m)
+        return m
+
+    def start(self) -> "CsvWriter":
+        self._thread.start()
+        return self
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Drain every queued row, flush / fsync, close the file."""
+        if not self._thread.is_alive():
+            return
+        self._q.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"[CSV] Writer did not finish in {timeout}s, {self.pending()} rows pending")
+
+    # ===== Writer thread =====
+    def _run(self):
+        self._open()
+        stopping = False
+        while not stopping:
+            batch = []
+            mark = None
+            try:
+                item = self._q.get(timeout=self.flush_sec)
+                deadline = time.monotonic() + self.flush_sec
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    if isinstance(item, CsvMark):
+                        # 先寫完 marker 之前的資料，位置才會對
+                        mark = item
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_max or time.monotonic() >= deadline:
+                        break
+                    try:
+                        item = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    # 寫入失敗（磁碟滿等）：這批丟掉並記錄，之後的資料繼續寫
+                    self.stats["errors"] += 1
+                    print("[CSV] Write error:", repr(e))
+            if mark is not None:
+                mark._resolve({"file": str(self.path), "offset": self._file.tell(), "rotated": self._last_rotated})
+        self._close_file(fsync=True)
+        print(f"[CSV] Writer stopped: written={self.stats['written']} batches={self.stats['batches']} "
+              f"rotations={self.stats['rotations']} errors={self.stats['errors']}")
+
+    def _write_batch(self, rows):
+        if self._should_rotate():
+            self._rotate()
+        self._writer.writerows(rows)
+        self._file.flush()
+        self.stats["written"] += len(rows)
+        self.stats["batches"] += 1
+
+        if self.fsync_sec is not None and time.monotonic() - self._last_fsync_t >= self.fsync_sec:
+            os.fsync(self._file.fileno())
+            self._last_fsync_t = time.monotonic()
+            self.stats["fsyncs"] += 1
+
+    # ===== File handling / rotation =====
+    @staticmethod
+    def _utc_day(t: float) -> str:
+        return datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d")
+
+    def _open(self):
+        new = not self.path.exists() or self.path.stat().st_size == 0
+        if not new and self._first_row() != list(self.header):
+            # 舊版的檔案（沒有表頭或欄位不同）：先輪替出去，新檔從新表頭開始，不混寫不同欄數的列
+            print(f"[CSV] {self.path} has a different header, rotating it out")
+            self._rotate()
+            return
+        self._file = self.path.open("a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        if new:
+            self._writer.writerow(self.header)
+            self._file.flush()
+        # 既有檔案以最後修改時間判斷是哪一天的資料
+        self._day = self._utc_day(time.time() if new else self.path.stat().st_mtime)
+        if self._last_rotated is None:
+            rotated = [p for p in csv_files(self.path) if p != self.path]
+            self._last_rotated = rotated[-1].name if rotated else None
+
+    def _first_row(self) -> list:
+        with self.path.open("r", newline="", encoding="utf-8") as f:
+            return next(csv.reader([f.readline()]), [])
+
+    def _close_file(self, fsync: bool = False):
+        if self._file is None:
+            return
+        self._file.flush()
+        if fsync and self.fsync_sec is not None:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def _should_rotate(self) -> bool:
+        if self.rotate_daily and self._utc_day(time.time()) != self._day:
+            return True
+        return bool(self.rotate_bytes) and self._file.tell() >= self.rotate_bytes
+
+    def _rotate(self):
+        self._close_file(fsync=True)
+        # <stem>-YYYYmmdd-HHMMSS-NN<suffix>：檔名排序即時間順序（同一秒內多次輪替靠 NN 區分）
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        n = 0
+        while True:
+            rotated = self.path.with_name(f"{self.path.stem}-{stamp}-{n:02d}{self.path.suffix}")
+            if not rotated.exists() and not rotated.with_name(rotated.name + ".gz").exists():
+                break
+            n += 1
+        os.replace(self.path, rotated)
+        if self.compress:
+            with rotated.open("rb") as src, gzip.open(str(rotated) + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            rotated.unlink()
+            rotated = rotated.with_name(rotated.name + ".gz")
+        self.stats["rotations"] += 1
+        self._last_rotated = rotated.name
+        print(f"[CSV] Rotated -> {rotated}")
+        self._open()
@@ -0,0 +1,68 @@
+# event_ring.py — fixed-size ring of recent events with monotonically increasing seq numbers
+#
+# Replaces deque(maxlen=5000): every appended row gets row["seq"] (1, 2, 3 ...), and the slot of
+# a seq is (seq - 1) % capacity, so cursor reads (before=<seq> / since=<seq>) jump straight to the
+# cursor and walk only the rows they return; nothing copies the whole buffer.
+# Not thread-safe by itself: callers hold their own lock (app.events_lock).
+
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional
+
+
+class EventRing:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.seq = 0                  # seq of the newest row (0 = empty)
+        self._size = 0
+        self._slots: List[Optional[dict]] = [None] * capacity
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def oldest_seq(self) -> int:
+        """Seq of the oldest row still held (seq + 1 when empty)."""
+        return self.seq - len(self) + 1
+
+    def append(self, row: dict) -> int:
+        self.seq += 1
+        row["seq"] = self.seq
+        self._slots[(self.seq - 1) % self.capacity] = row
+        self._size = min(self._size + 1, self.capacity)
+        return self.seq
+
+    def restore(self, rows_newest_first: Iterable[dict], seq: int) -> None:
+        """Refills the ring from a snapshot (list(ring) order); the next append continues after `seq`."""
+        rows = list(islice(rows_newest_first, self.capacity))
+        self.seq = seq - len(rows)
+        self._size = 0
+        for row in reversed(rows):
+            self.append(row)
+
+    def _row(self, s: int) -> dict:
+        return self._slots[(s - 1) % self.capacity]
+
+    def iter_desc(self, before: Optional[int] = None) -> Iterator[dict]:
+        """Rows with seq < before (default: all), newest first."""
+        top = self.seq if before is None else min(self.seq, before - 1)
+        for s in range(top, self.oldest_seq - 1, -1):
+            yield self._row(s)
+
+    def iter_asc(self, since: int = 0) -> Iterator[dict]:
+        """Rows with seq > since, oldest first."""
+        for s in range(max(since + 1, self.oldest_seq), self.seq + 1):
+            yield self._row(s)
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.iter_desc()
+
+    def page(self, limit: int, before: Optional[int] = None, since: Optional[int] = None,
+             where: Optional[Callable[[dict], bool]] = None) -> List[dict]:
+        """
+        Up to `limit` rows: since=<seq> -> the next rows after the cursor, oldest first;
+        otherwise the newest rows (before=<seq> -> older than the cursor), newest first.
+        """
+        rows = self.iter_asc(since) if since is not None else self.iter_desc(before)
+        if where is not None:
+            rows = filter(where, rows)
+        return list(islice(rows, limit))
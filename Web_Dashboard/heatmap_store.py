@@ -0,0 +1,75 @@
+# heatmap_store.py — latest spatial heatmap per device (Edge_Pc --heatmap, topic <zone topic>/heatmap)
+#
+# The edge box exports a decayed density grid of all its detection points every few seconds:
+#   {"type":"heatmap","w":64,"h":36,"t":<epoch>,"half_life_sec":600,"scale":12.5,
+#    "frames":4500,"points":3812,"data":"<base64 zlib uint8[h*w]>"}
+# cell value ~= data[y*w+x] / 255 * scale (decayed detections). Each export replaces the previous
+# one of its device, so only the newest grid per device is kept (a few KB); nothing goes to CSV.
+
+import base64
+import binascii
+import json
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+
+import numpy as np
+
+HEATMAP_MAX_CELLS = 256 * 256
+
+
+def parse_heatmap_message(raw: str) -> Optional[dict]:
+    """The export as a dict with "cells" = (h, w) uint8 array, or None if raw is not a valid heatmap."""
+    if not raw.startswith("{"):
+        return None
+    try:
+        obj = json.loads(raw)
+        if obj.get("type") != "heatmap":
+            return None
+        w, h = int(obj["w"]), int(obj["h"])
+        if not (0 < w and 0 < h and w * h <= HEATMAP_MAX_CELLS):
+            return None
+        # 最多解出 w*h+1 bytes：多出來就是格式不對，不會被過大的 payload 撐爆記憶體
+        data = zlib.decompressobj().decompress(base64.b64decode(obj["data"]), w * h + 1)
+        cells = np.frombuffer(data, dtype=np.uint8)
+        if cells.size != w * h:
+            return None
+        return {
+            "w": w,
+            "h": h,
+            "t": float(obj["t"]),
+            "half_life_sec": float(obj.get("half_life_sec", 0.0)),
+            "scale": float(obj["scale"]),
+            "frames": int(obj.get("frames", 0)),
+            "points": int(obj.get("points", 0)),
+            "cells": cells.reshape(h, w),
+        }
+    except (ValueError, KeyError, TypeError, binascii.Error, zlib.error):
+        return None
+
+
+class HeatmapStore:
+    def __init__(self):
+        self.version = 0              # bumped on every export (ETag / response cache of /api/heatmap)
+        self._lock = threading.Lock()
+        self._latest: Dict[str, dict] = {}
+
+    def put(self, device: str, heatmap: dict, received_at: Optional[float] = None) -> None:
+        heatmap = dict(heatmap, received_at=time.time() if received_at is None else received_at)
+        with self._lock:
+            self._latest[device] = heatmap
+            self.version += 1
+
+    def body(self, device: Optional[str] = None) -> dict:
+        """/api/heatmap body: the device's latest grid (no device: the most recently received one)."""
+        with self._lock:
+            devices = sorted(self._latest)
+            if device is None and self._latest:
+                device = max(self._latest, key=lambda d: self._latest[d]["received_at"])
+            hm = self._latest.get(device)
+        if hm is None:
+            return {"device": device, "devices": devices, "heatmap": None}
+        out = {k: v for k, v in hm.items() if k != "cells"}
+        out["cells"] = hm["cells"].ravel().tolist()
+        return {"device": device, "devices": devices, "heatmap": out}
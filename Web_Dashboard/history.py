@@ -0,0 +1,341 @@
+# history.py — SQLite history store with precomputed time-bucket rollups
+#
+# The ingest path only queues records; one writer thread appends them in batched
+# transactions (WAL mode, readers never block the writer):
+#   events    one row per zone event           index (zone, ts), (device, zone, ts)
+#   hot       one row per hot event            index (ts)
+#   rollup    per (bucket size, device, bucket start, zone) — the primary key is the query order:
+#             on_count, off_count, on_seconds (occupied time inside the bucket), hot_count
+#
+# Rollups are kept for minute / hour / day buckets (UTC, aligned to the epoch), per device and
+# summed over all devices (device "*"), and updated incrementally as events arrive
+# (UPSERT ... count = count + excluded.count), so a range query reads at most (range / bucket)
+# rows per zone instead of scanning events: a month at hour resolution is ~720 rows per zone.
+#
+# ON periods are added to on_seconds when they end (OFF); the still-open part of a current ON
+# period is added at query time from the live zone state (open_periods).
+
+import math
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+ALL_DEVICES = "*"             # rollup rows summed over every device (aggregate queries read only these)
+MAX_BUCKETS = 5000            # per query (dense series); ask for a coarser bucket beyond that
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    ts REAL NOT NULL, device TEXT NOT NULL, zone INTEGER NOT NULL, state INTEGER NOT NULL, raw TEXT
+);
+CREATE INDEX IF NOT EXISTS events_zone_ts ON events (zone, ts);
+CREATE INDEX IF NOT EXISTS events_device_zone_ts ON events (device, zone, ts);
+CREATE TABLE IF NOT EXISTS hot (
+    ts REAL NOT NULL, device TEXT NOT NULL, zone INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hot_ts ON hot (ts);
+CREATE TABLE IF NOT EXISTS rollup (
+    bucket_sec INTEGER NOT NULL, bucket INTEGER NOT NULL, device TEXT NOT NULL, zone INTEGER NOT NULL,
+    on_count INTEGER NOT NULL DEFAULT 0, off_count INTEGER NOT NULL DEFAULT 0,
+    on_seconds REAL NOT NULL DEFAULT 0, hot_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_sec, device, bucket, zone)
+) WITHOUT ROWID;
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO rollup (bucket_sec, device, bucket, zone, on_count, off_count, on_seconds, hot_count)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (bucket_sec, device, bucket, zone) DO UPDATE SET
+    on_count = on_count + excluded.on_count,
+    off_count = off_count + excluded.off_count,
+    on_seconds = on_seconds + excluded.on_seconds,
+    hot_count = hot_count + excluded.hot_count
+"""
+
+_STOP = object()
+
+
+def parse_time(v) -> float:
+    """Epoch seconds from a number or an ISO-8601 string (naive = UTC)."""
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        dt = datetime.fromisoformat(str(v).replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+
+
+def split_period(start: float, end: float, bucket_sec: int) -> Iterable[Tuple[int, float]]:
+    """(bucket start, seconds of [start, end) inside that bucket) for each bucket the period touches."""
+    b = int(start // bucket_sec) * bucket_sec
+    while b < end:
+        overlap = min(end, b + bucket_sec) - max(start, b)
+        if overlap > 0:
+            yield b, overlap
+        b += bucket_sec
+
+
+class HistoryStore:
+    def __init__(self, path: Path, flush_sec: float = 1.0, batch_max: int = 5000):
+        self.path = Path(path)
+        self.flush_sec = flush_sec
+        self.batch_max = batch_max
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "errors": 0}
+
+        self._q: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # ===== Producer side (any thread) =====
+    def add_event(self, ts: float, device: str, zone: int, state: int, raw: str = "") -> None:
+        self._q.put(("event", ts, device, zone, state, raw))
+        self.stats["queued"] += 1
+
+    def add_on_period(self, device: str, zone: int, start: float, end: float) -> None:
+        """A finished ON period; its duration is spread over the buckets it covers."""
+        if end > start:
+            self._q.put(("period", device, zone, start, end))
+            self.stats["queued"] += 1
+
+    def add_hot(self, ts: float, device: str, zone: int) -> None:
+        self._q.put(("hot", ts, device, zone))
+        self.stats["queued"] += 1
+
+    def pending(self) -> int:
+        return self._q.qsize()
+
+    def start(self) -> "HistoryStore":
+        """Creates the database / schema if needed and starts the writer thread."""
+        db = self._connect()
+        db.executescript(SCHEMA)
+        db.close()
+        self._thread.start()
+        return self
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write every queued record, then stop the writer thread."""
+        if not self._thread.is_alive():
+            return
+        self._q.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"[HISTORY] Writer did not finish in {timeout}s, {self.pending()} records pending")
+
+    # ===== Writer thread =====
+    def _run(self):
+        db = self._connect()
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._q.get(timeout=self.flush_sec)
+                deadline = time.monotonic() + self.flush_sec
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_max or time.monotonic() >= deadline:
+                        break
+                    try:
+                        item = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    self.write_batch(db, batch)
+                except Exception as e:
+                    # 寫入失敗：這批丟掉並記錄，之後的資料繼續寫
+                    self.stats["errors"] += 1
+                    print("[HISTORY] Write error:", repr(e))
+        db.close()
+        print(f"[HISTORY] Writer stopped: written={self.stats['written']} batches={self.stats['batches']} "
+              f"errors={self.stats['errors']}")
+
+    def write_batch(self, db: sqlite3.Connection, batch: Sequence[tuple]) -> None:
+        events, hots = [], []
+        # 先在記憶體裡把整批的 rollup 增量合併，每個 (bucket, device, zone) 只 UPSERT 一次
+        acc: Dict[tuple, List[float]] = {}
+
+        def bump(ts, device, zone, col, amount, bucket_sizes=BUCKETS.values()):
+            for size in bucket_sizes:
+                b = int(ts // size) * size
+                for d in (device, ALL_DEVICES):
+                    key = (size, d, b, zone)
+                    row = acc.get(key)
+                    if row is None:
+                        row = acc[key] = [0, 0, 0.0, 0]
+                    row[col] += amount
+
+        for item in batch:
+            kind = item[0]
+            if kind == "event":
+                _, ts, device, zone, state, raw = item
+                events.append((ts, device, zone, state, raw))
+                bump(ts, device, zone, 0 if state == 1 else 1, 1)
+            elif kind == "period":
+                _, device, zone, start, end = item
+                for size in BUCKETS.values():
+                    for b, sec in split_period(start, end, size):
+                        bump(b, device, zone, 2, sec, (size,))
+            elif kind == "hot":
+                _, ts, device, zone = item
+                hots.append((ts, device, zone))
+                bump(ts, device, zone, 3, 1)
+
+        with db:
+            db.executemany("INSERT INTO events (ts, device, zone, state, raw) VALUES (?, ?, ?, ?, ?)", events)
+            db.executemany("INSERT INTO hot (ts, device, zone) VALUES (?, ?, ?)", hots)
+            db.executemany(UPSERT_ROLLUP, [k + tuple(v) for k, v in acc.items()])
+        self.stats["written"] += len(batch)
+        self.stats["batches"] += 1
+
+    # ===== Queries (any thread, own connection) =====
+    def query(
+        self,
+        start: float,
+        end: float,
+        bucket_sec: int,
+        device: Optional[str] = None,
+        zone: Optional[int] = None,
+        open_periods: Iterable[Tuple[str, int, float]] = (),
+        now: Optional[float] = None,
+    ):
+        """
+        Dense per-zone series over [start, end) widened to whole buckets:
+        {"start", "end", "bucket_sec", "t": [...], "by_zone": {zone: {"on", "off", "on_seconds", "hot"}}}
+        open_periods: (device, zone, on_since) of zones that are ON right now.
+        """
+        b0 = int(start // bucket_sec) * bucket_sec
+        b1 = int(math.ceil(end / bucket_sec)) * bucket_sec
+        n = (b1 - b0) // bucket_sec
+        if n <= 0 or n > MAX_BUCKETS:
+            raise ValueError(f"{n} buckets of {bucket_sec}s requested (1..{MAX_BUCKETS})")
+
+        sql = ("SELECT zone, bucket, on_count, off_count, on_seconds, hot_count "
+               "FROM rollup WHERE bucket_sec = ? AND device = ? AND bucket >= ? AND bucket < ?")
+        args: list = [bucket_sec, ALL_DEVICES if device is None else device, b0, b1]
+        if zone is not None:
+            sql += " AND zone = ?"
+            args.append(zone)
+
+        by_zone: Dict[int, Dict[str, list]] = {}
+
+        def series(z):
+            s = by_zone.get(z)
+            if s is None:
+                s = by_zone[z] = {"on": [0] * n, "off": [0] * n, "on_seconds": [0.0] * n, "hot": [0] * n}
+            return s
+
+        db = self._connect()
+        try:
+            for z, b, on, off, sec, hot in db.execute(sql, args):
+                s, i = series(z), (b - b0) // bucket_sec
+                s["on"][i], s["off"][i], s["on_seconds"][i], s["hot"][i] = on, off, sec, hot
+        finally:
+            db.close()
+
+        # 進行中的 ON 還沒寫進 rollup：查詢時補上 on_since..now 這段
+        now = time.time() if now is None else now
+        for d, z, since in open_periods:
+            if (device is not None and d != device) or (zone is not None and z != zone):
+                continue
+            for b, sec in split_period(max(since, b0), min(now, b1), bucket_sec):
+                series(z)["on_seconds"][(b - b0) // bucket_sec] += sec
+
+        return {
+            "start": b0,
+            "end": b1,
+            "bucket_sec": bucket_sec,
+            "t": list(range(b0, b1, bucket_sec)),
+            "by_zone": {z: by_zone[z] for z in sorted(by_zone)},
+        }
+
+    def latest_event_ts(self) -> Optional[float]:
+        """MAX(ts) of the events table (None when it is empty)."""
+        db = self._connect()
+        try:
+            return db.execute("SELECT MAX(ts) FROM events").fetchone()[0]
+        finally:
+            db.close()
+
+    def events_between(self, start: float, end: float, device: Optional[str] = None,
+                       zone: Optional[int] = None, limit: int = 1000) -> List[dict]:
+        """Raw zone events in [start, end), oldest first (uses the (zone, ts) / (device, zone, ts) indexes)."""
+        sql = "SELECT ts, device, zone, state, raw FROM events WHERE ts >= ? AND ts < ?"
+        args: list = [start, end]
+        if device is not None:
+            sql += " AND device = ?"
+            args.append(device)
+        if zone is not None:
+            sql += " AND zone = ?"
+            args.append(zone)
+        sql += " ORDER BY ts LIMIT ?"
+        args.append(limit)
+        db = self._connect()
+        try:
+            return [dict(zip(("ts", "device", "zone", "state", "raw"), r)) for r in db.execute(sql, args)]
+        finally:
+            db.close()
+
+
+def import_rows(store: HistoryStore, rows: Iterable[dict], device_of: Callable[[str], str],
+                hot_seconds: Callable[[int, str], float], after: Optional[float] = None) -> Dict[str, int]:
+    """
+    Replays dashboard CSV rows through the same ON/OFF / hot rules as app.record_event and writes
+    events, ON periods and hot events straight into the store (no writer thread needed).
+    after: rows at or before this time are already in the store (latest_event_ts()); they still
+    drive the ON/OFF state, so a period that spans it is written once, when its OFF is imported.
+    """
+    on_since: Dict[Tuple[str, int], float] = {}
+    counts = {"rows": 0, "skipped": 0, "events": 0, "periods": 0, "hot": 0}
+    db = store._connect()
+    batch: List[tuple] = []
+    for row in rows:
+        counts["rows"] += 1
+        if not row.get("zone") or row.get("state") not in ("0", "1"):
+            continue
+        ts = datetime.fromisoformat(row["ts_utc"]).timestamp()
+        device = row.get("device") or device_of(row["topic"])
+        zone, state = int(row["zone"]), int(row["state"])
+        key = (device, zone)
+        if after is not None and ts <= after:
+            counts["skipped"] += 1
+            if state == 1:
+                on_since.setdefault(key, ts)
+            else:
+                on_since.pop(key, None)
+            continue
+        batch.append(("event", ts, device, zone, state, row.get("raw", "")))
+        counts["events"] += 1
+        if state == 1:
+            on_since.setdefault(key, ts)
+        elif key in on_since:
+            since = on_since.pop(key)
+            if ts > since:
+                batch.append(("period", device, zone, since, ts))
+                counts["periods"] += 1
+            hs = hot_seconds(zone, device)
+            if ts - since >= hs:
+                batch.append(("hot", since + hs, device, zone))
+                counts["hot"] += 1
+        if len(batch) >= store.batch_max:
+            store.write_batch(db, batch)
+            batch = []
+    if batch:
+        store.write_batch(db, batch)
+    db.close()
+    return counts
@@ -0,0 +1,94 @@
+# hot_scheduler.py — deadline scheduler for hot-zone detection
+#
+# Instead of polling every zone, each ON period schedules one deadline (on_since + hot seconds)
+# in a min-heap; OFF cancels it. A single thread sleeps until the earliest deadline, so idle
+# CPU is ~0 and the callback runs within a few ms of the exact threshold time, independent of
+# the number of zones.
+#
+# Cancel / reschedule are O(log n) amortized: the heap keeps stale entries and skips them when
+# they surface (an entry is live only if its token is still the key's current token).
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Tuple
+
+
+class DeadlineScheduler:
+    def __init__(self, on_due: Callable[[Hashable, float], None], clock: Callable[[], float] = time.time):
+        # on_due(key, deadline) runs on the scheduler thread, without any scheduler lock held
+        self.on_due = on_due
+        self.clock = clock
+        self.stats = {"scheduled": 0, "cancelled": 0, "fired": 0}
+
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._live: Dict[Hashable, int] = {}   # key -> token of its current entry
+        self._tokens = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="hot-scheduler", daemon=True)
+
+    def start(self) -> "DeadlineScheduler":
+        self._thread.start()
+        return self
+
+    def close(self, timeout: float = 2.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """(Re)schedules key; a previous deadline of the same key is dropped."""
+        with self._cond:
+            token = next(self._tokens)
+            self._live[key] = token
+            heapq.heappush(self._heap, (deadline, token, key))
+            self.stats["scheduled"] += 1
+            # 只有新的 deadline 成為最早的一個時才需要叫醒執行緒
+            if self._heap[0][1] == token:
+                self._cond.notify()
+            self._compact()
+
+    def cancel(self, key: Hashable) -> None:
+        with self._cond:
+            if self._live.pop(key, None) is not None:
+                self.stats["cancelled"] += 1
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._live)
+
+    def _compact(self):
+        # 大量 cancel 後 heap 裡多半是過期項目：重建一次，記憶體維持 O(live)
+        if len(self._heap) > 2 * len(self._live) + 1024:
+            self._heap = [e for e in self._heap if self._live.get(e[2]) == e[1]]
+            heapq.heapify(self._heap)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    # 丟掉已取消 / 已被重排的項目
+                    while self._heap and self._live.get(self._heap[0][2]) != self._heap[0][1]:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline = self._heap[0][0]
+                    delay = deadline - self.clock()
+                    if delay <= 0:
+                        _, _, key = heapq.heappop(self._heap)
+                        del self._live[key]
+                        break
+                    self._cond.wait(delay)
+
+            self.stats["fired"] += 1
+            try:
+                self.on_due(key, deadline)
+            except Exception as e:
+                print("[HOT] Scheduler callback error:", repr(e))
@@ -0,0 +1,57 @@
+# import_history.py — one-shot import of existing dashboard CSV logs into the history store
+#
+# Reads peopleflow.csv and its rotated files (oldest first, .gz included) and rebuilds events,
+# ON periods and hot events with the same rules as app.record_event (device from the topic for
+# rows written before the device column existed, HOT_SECONDS / HOT_SECONDS_BY_ZONE thresholds).
+# It refuses to run when the database already has events (a second import would double every
+# rollup). With --force it imports only the rows after the newest stored event, so re-running it,
+# or running it after the dashboard has started writing, never counts a row twice.
+#
+# Run:
+#   python import_history.py
+#   python import_history.py --csv /data/peopleflow.csv --db /data/peopleflow.db
+#   python import_history.py --force    # database not empty: add only the rows newer than it
+
+import argparse
+import sys
+import time
+from itertools import chain
+from pathlib import Path
+
+import app
+from csv_writer import csv_files, read_csv_rows
+from history import HistoryStore, import_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import dashboard CSV logs into the SQLite history store")
+    parser.add_argument("--csv", default=str(app.CSV_PATH), help="live CSV file; rotated files next to it are included")
+    parser.add_argument("--db", default=str(app.HISTORY_DB))
+    parser.add_argument("--force", action="store_true",
+                        help="import into a non-empty database: only rows after its newest event")
+    args = parser.parse_args()
+
+    files = csv_files(Path(args.csv))
+    if not files:
+        print(f"[IMPORT] No CSV files for {args.csv}")
+        return
+    for f in files:
+        print(f"[IMPORT] {f}")
+
+    t0 = time.perf_counter()
+    store = HistoryStore(Path(args.db)).start()
+    latest = store.latest_event_ts()
+    if latest is not None and not args.force:
+        store.close()
+        print(f"[IMPORT] {args.db} already has events (newest {latest:.3f}); importing again would double "
+              "the rollups. Use --force to import only the rows after it.")
+        sys.exit(1)
+    counts = import_rows(store, chain.from_iterable(read_csv_rows(f) for f in files),
+                         app.device_of, app.hot_seconds, after=latest)
+    store.close()
+    print(f"[IMPORT] {counts['rows']} rows ({counts['skipped']} already stored) -> {counts['events']} events, "
+          f"{counts['periods']} ON periods, {counts['hot']} hot events in {time.perf_counter() - t0:.1f}s -> {args.db}")
+
+
+if __name__ == "__main__":
+    main()
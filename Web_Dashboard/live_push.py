@@ -0,0 +1,106 @@
+# live_push.py — fan-out of dashboard deltas to Server-Sent Events clients
+#
+# Producers (MQTT callback thread, hot scheduler thread) call publish() with one small dict per
+# change; nothing is serialized there. Items are collected and flushed on the event loop at
+# most once per loop wake-up: the batch is JSON-encoded ONCE into an SSE message and the same
+# bytes are queued for every client. Server cost is O(events), not O(clients x poll rate).
+#
+# Every item gets a seq; a client snapshot records the seq it covers, so the client drops the
+# (few) deltas it already contains. A client whose queue fills up (stalled connection) is cut
+# off; EventSource reconnects and starts again from a fresh snapshot.
+
+import asyncio
+import itertools
+import json
+import threading
+from typing import List, Optional, Set
+
+CLIENT_QUEUE_MAX = 256        # pending SSE messages per client before it is dropped
+
+
+def sse_message(event: str, data, event_id: Optional[int] = None) -> bytes:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class LiveBroadcaster:
+    def __init__(self, client_queue_max: int = CLIENT_QUEUE_MAX):
+        self.client_queue_max = client_queue_max
+        self.stats = {"published": 0, "messages": 0, "dropped_clients": 0}
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: Set[asyncio.Queue] = set()
+        self._seq = itertools.count(1)
+        self.seq = 0                  # seq of the latest published item
+        self._pending: List[dict] = []
+        self._pending_lock = threading.Lock()
+        self._flush_scheduled = False
+
+    # ===== Event loop side =====
+    def start(self, loop: asyncio.AbstractEventLoop) -> "LiveBroadcaster":
+        self._loop = loop
+        return self
+
+    def close(self) -> None:
+        """Ends every client stream (call on the event loop)."""
+        for q in list(self._clients):
+            self._disconnect(q)
+        self._loop = None
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(self.client_queue_max)
+        self._clients.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        self._clients.discard(q)
+
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def _disconnect(self, q: asyncio.Queue):
+        self._clients.discard(q)
+        # 佇列已滿：丟掉最舊的一則，騰出位置放結束標記
+        if q.full():
+            q.get_nowait()
+        q.put_nowait(None)
+
+    def _flush(self):
+        with self._pending_lock:
+            items, self._pending = self._pending, []
+            self._flush_scheduled = False
+        if not items or not self._clients:
+            return
+        # 整批只序列化一次，所有 client 共用同一份 bytes
+        msg = sse_message("delta", items, items[-1]["seq"])
+        self.stats["messages"] += 1
+        for q in list(self._clients):
+            try:
+                q.put_nowait(msg)
+            except asyncio.QueueFull:
+                self.stats["dropped_clients"] += 1
+                self._disconnect(q)
+
+    # ===== Producer side (any thread) =====
+    def active(self) -> bool:
+        return bool(self._clients) and self._loop is not None
+
+    def publish(self, item: dict) -> None:
+        """
+        Queue one delta item for every client. Call it while holding the lock that guards the
+        state the item describes, so that seq order matches the order of state changes.
+        """
+        if not self.active():
+            return
+        with self._pending_lock:
+            item["seq"] = self.seq = next(self._seq)
+            self.stats["published"] += 1
+            self._pending.append(item)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._flush)
+        except RuntimeError:
+            # event loop already closed (shutdown)
+            pass
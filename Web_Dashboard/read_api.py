@@ -0,0 +1,142 @@
+# read_api.py — read-only API workers: /api/stats, /api/heat, /api/events, /api/devices
+#
+# Serves the state the ingest process (app.py) publishes to app.SHARED_STATE_PATH (shared_state.py):
+# no MQTT, no CSV, no locks shared with the ingest process, so it scales over cores with --workers.
+# Same JSON and the same ETags as app.py for the same data, so clients and proxies can mix both.
+# Data lags the ingest process by at most app.SHARED_PUBLISH_SEC; every response carries
+# X-State-Age (seconds since the ingest process last published or confirmed the state).
+#
+# Run from the same directory as the ingest process:
+#   uvicorn app:app --host 0.0.0.0 --port 8000 --timeout-graceful-shutdown 3     # one process
+#   uvicorn read_api:app --host 0.0.0.0 --port 8001 --workers 4
+
+import json
+import time
+from contextlib import nullcontext
+from typing import Optional
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+
+import app as dashboard
+from event_ring import EventRing
+from response_cache import ResponseCache
+from shared_state import SharedState, SharedStateReader
+
+reader = SharedStateReader(dashboard.SHARED_STATE_PATH)
+_caches = {}                  # ingest boot token -> ResponseCache (a restarted ingest starts a new one)
+
+
+class StateShard:
+    """Read-only ZoneShard look-alike over one publication (a single shard holding every row)."""
+    lock = nullcontext()
+
+    def __init__(self, state: SharedState):
+        for name in dashboard.SHARED_COLUMNS:
+            setattr(self, name, state.arrays[name])
+        self.size = len(self.zone)
+        self.devices = state.meta["devices"]
+        self.device_index = {d: i for i, d in enumerate(self.devices)}
+
+    def select(self, device: Optional[str] = None) -> np.ndarray:
+        if device is None:
+            return np.arange(self.size)
+        i = self.device_index.get(device)
+        return np.flatnonzero(self.device == i) if i is not None else np.empty(0, dtype=np.intp)
+
+
+class StateRegistry:
+    """What app.compute_* need from a ZoneRegistry."""
+
+    def __init__(self, state: SharedState):
+        self.shards = [StateShard(state)]
+
+    def shard(self, device: str) -> StateShard:
+        return self.shards[0]
+
+    def zone_count(self) -> int:
+        return self.shards[0].size
+
+
+def current_state() -> SharedState:
+    state = reader.read()
+    if state is None:
+        raise HTTPException(503, f"No published state in {dashboard.SHARED_STATE_PATH}; is app:app running here?")
+    return state
+
+
+def state_response(request: Request, state: SharedState, key: str, version: int, build) -> Response:
+    cache = _caches.get(state.boot)
+    if cache is None:
+        _caches.clear()
+        cache = _caches[state.boot] = ResponseCache(boot=state.boot)
+    resp = dashboard.cached_json(request, key, version, build, cache=cache)
+    heartbeat = reader.heartbeat() or state.published_at
+    resp.headers["X-State-Age"] = f"{max(0.0, time.time() - heartbeat):.3f}"
+    return resp
+
+
+def state_registry(state: SharedState) -> StateRegistry:
+    return state.derived("registry", lambda: StateRegistry(state))
+
+
+class PublishedEvents(EventRing):
+    """
+    Read-only EventRing over the published rows (newest first, one JSON object per row at
+    event_offsets); a row is decoded the first time a page needs it.
+    """
+
+    def __init__(self, state: SharedState):
+        self._blob = state.blobs["events"]
+        self._offsets = state.arrays["event_offsets"].tolist()
+        self._decoded = {}
+        self.capacity = self._size = len(self._offsets) - 1
+        self.seq = state.meta["events_seq"]
+
+    def _row(self, s: int) -> dict:
+        row = self._decoded.get(s)
+        if row is None:
+            i = self.seq - s
+            row = self._decoded[s] = json.loads(self._blob[self._offsets[i]:self._offsets[i + 1]])
+        return row
+
+    def append(self, row: dict) -> int:
+        raise TypeError("published events are read-only")
+
+
+def state_events(state: SharedState) -> PublishedEvents:
+    return state.derived("events", lambda: PublishedEvents(state))
+
+
+app = FastAPI()
+
+@app.get("/api/events")
+def api_events(request: Request, limit: int = 50, device: Optional[str] = None,
+               before: Optional[int] = None, since: Optional[int] = None):
+    """Same parameters and paging as app.py's /api/events."""
+    if before is not None and since is not None:
+        raise HTTPException(400, "use either before or since")
+    limit = max(1, min(dashboard.EVENTS_PAGE_MAX, limit))
+    state = current_state()
+    key = f"events?limit={limit}&device={device}&before={before}&since={since}"
+    return state_response(request, state, key, state.meta["events_seq"],
+                          lambda: dashboard.events_page(state_events(state), limit, device, before, since))
+
+@app.get("/api/devices")
+def api_devices(request: Request):
+    state = current_state()
+    return state_response(request, state, "devices", state.meta["state_version"],
+                          lambda: dashboard.devices_body(state_registry(state)))
+
+@app.get("/api/stats")
+def api_stats(request: Request, device: Optional[str] = None):
+    state = current_state()
+    return state_response(request, state, f"stats?device={device}", state.meta["state_version"],
+                          lambda: dashboard.stats_body(device, state_registry(state)))
+
+@app.get("/api/heat")
+def api_heat(request: Request, device: Optional[str] = None):
+    state = current_state()
+    return state_response(request, state, f"heat?device={device}", state.meta["state_version"],
+                          lambda: dashboard.heat_body(device, state_registry(state)))
@@ -0,0 +1,58 @@
+# response_cache.py — serialize-once JSON responses keyed by state version, with ETags
+#
+# Each cacheable endpoint has a version number that changes whenever its data can change
+# (event ring seq, zone state version). The body for (endpoint + query, version) is built and
+# JSON-encoded once and reused for every client until the version moves; its ETag is
+# "<key hash>-<boot token>-<version>" (versions restart at 0 with the process), so an unchanged
+# poll with If-None-Match gets 304 without any body. Caches built with the same boot token (the
+# ingest process and its read_api.py workers) produce identical ETags for the same version.
+
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, boot: Optional[str] = None):
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "builds": 0}
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[int, str, bytes]]" = OrderedDict()
+        self.boot = boot or os.urandom(4).hex()
+
+    def etag(self, key: str, version: int) -> str:
+        return f'"{zlib.crc32(key.encode("utf-8")):08x}-{self.boot}-{version}"'
+
+    def get(self, key: str, version: int, build: Callable[[], object]) -> Tuple[str, bytes]:
+        """
+        (etag, JSON body) for `key` at `version`. Read `version` BEFORE calling, so a body is
+        never older than the version it is stored under.
+        """
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and hit[0] == version:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return hit[1], hit[2]
+        # 在鎖外建立：同一版本被多個 client 同時要時可能重複建一次，但不會擋住其他 key
+        body = json.dumps(build(), separators=(",", ":")).encode("utf-8")
+        etag = self.etag(key, version)
+        with self._lock:
+            self._entries[key] = (version, etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.stats["builds"] += 1
+        return etag, body
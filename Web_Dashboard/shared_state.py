@@ -0,0 +1,219 @@
+# shared_state.py — dashboard state published to a memory-mapped file for read-only API workers
+#
+# One ingest process (app.py: MQTT, hot-zone logic, CSV) owns the state. It republishes it at most
+# every SHARED_PUBLISH_SEC into a fixed-size memory-mapped file; any number of read workers
+# (read_api.py, e.g. uvicorn --workers N) map the same file and serve the JSON endpoints from it,
+# with no IPC round-trip per request.
+#
+# Layout: a 128-byte header, then one payload = u32 index length + JSON index + raw sections
+# (NumPy column bytes, pre-encoded blobs). Writes use a seqlock: `seq` is made odd, the payload and
+# header fields are written, then `seq` is made even again. A reader copies the payload, and keeps
+# the copy only if `seq` was even and unchanged around the copy and the payload CRC matches (the CRC
+# also guards against store reordering on weakly ordered CPUs, where Python has no fences).
+# Readers decode once per seq and reuse the decoded state until the writer publishes again.
+#
+# IngestLock is an exclusive lock file, so a second ingest process (e.g. uvicorn app:app
+# --workers N) fails at startup instead of opening another MQTT subscription.
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:           # Windows
+    fcntl = None
+    import msvcrt
+
+MAGIC = b"PFSS"
+LAYOUT_VERSION = 1
+HEADER_SIZE = 128
+# magic, layout version, seq, payload length, payload crc32, published_at, heartbeat, boot token
+HEADER = struct.Struct("<4sIQQIdd8s")
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+HEARTBEAT = struct.Struct("<d")
+HEARTBEAT_OFFSET = struct.calcsize("<4sIQQId")
+INDEX_LEN = struct.Struct("<I")
+READ_RETRIES = 100
+
+
+class SharedStateFull(Exception):
+    pass
+
+
+class SharedStateWriter:
+    def __init__(self, path: Path, size: int, boot: Optional[str] = None):
+        # boot: 8 hex chars shared with the ingest ResponseCache, so readers produce the same ETags
+        self.path = Path(path)
+        self.size = size
+        self.boot = (boot or os.urandom(4).hex()).encode("ascii")
+        # 從時間開始數（偶數）：重啟後的 seq 不會和讀取端快取的舊 seq 撞在一起
+        self.seq = time.time_ns() // 1000 * 2
+        self._mm: Optional[mmap.mmap] = None
+
+    def open(self) -> "SharedStateWriter":
+        with open(self.path, "a+b") as f:
+            f.truncate(self.size)
+            self._mm = mmap.mmap(f.fileno(), self.size)
+        # seq 0 = nothing published yet (readers answer "not ready" until the first publish)
+        self._mm[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        self._mm[:HEADER.size] = HEADER.pack(MAGIC, LAYOUT_VERSION, 0, 0, 0, 0.0, time.time(), self.boot)
+        return self
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def publish(self, meta: dict, arrays: Dict[str, np.ndarray], blobs: Dict[str, bytes]) -> int:
+        """Writes one consistent state; returns the payload size. Raises SharedStateFull if it does not fit."""
+        index = {"meta": meta, "arrays": {}, "blobs": {}}
+        parts, offset = [], 0
+        for name, a in arrays.items():
+            a = np.ascontiguousarray(a)
+            index["arrays"][name] = [a.dtype.str, list(a.shape), offset, a.nbytes]
+            parts.append(a.tobytes())
+            offset += a.nbytes
+        for name, b in blobs.items():
+            index["blobs"][name] = [offset, len(b)]
+            parts.append(b)
+            offset += len(b)
+        head = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        payload = b"".join([INDEX_LEN.pack(len(head)), head, *parts])
+        if HEADER_SIZE + len(payload) > self.size:
+            raise SharedStateFull(f"state is {len(payload)} bytes, segment holds {self.size - HEADER_SIZE}")
+
+        now = time.time()
+        mm = self._mm
+        self.seq += 1                                   # odd: write in progress
+        mm[SEQ_OFFSET:SEQ_OFFSET + SEQ.size] = SEQ.pack(self.seq)
+        mm[HEADER_SIZE:HEADER_SIZE + len(payload)] = payload
+        mm[:HEADER.size] = HEADER.pack(MAGIC, LAYOUT_VERSION, self.seq, len(payload),
+                                       zlib.crc32(payload), now, now, self.boot)
+        self.seq += 1                                   # even: consistent
+        mm[SEQ_OFFSET:SEQ_OFFSET + SEQ.size] = SEQ.pack(self.seq)
+        return len(payload)
+
+    def heartbeat(self) -> None:
+        """Marks the state as still current when nothing changed (readers report its age)."""
+        self._mm[HEARTBEAT_OFFSET:HEARTBEAT_OFFSET + HEARTBEAT.size] = HEARTBEAT.pack(time.time())
+
+
+class SharedState:
+    """One decoded publication: meta dict, NumPy arrays (read-only views) and raw blobs."""
+
+    def __init__(self, seq: int, boot: str, published_at: float, payload: bytes):
+        self.seq = seq
+        self.boot = boot
+        self.published_at = published_at
+        (n,) = INDEX_LEN.unpack_from(payload)
+        index = json.loads(payload[INDEX_LEN.size:INDEX_LEN.size + n])
+        base = INDEX_LEN.size + n
+        self.meta = index["meta"]
+        self.arrays = {
+            name: np.frombuffer(payload, dtype=np.dtype(dt), count=nbytes // np.dtype(dt).itemsize,
+                                offset=base + off).reshape(shape)
+            for name, (dt, shape, off, nbytes) in index["arrays"].items()
+        }
+        self.blobs = {name: payload[base + off:base + off + n] for name, (off, n) in index["blobs"].items()}
+        self._derived: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def derived(self, name: str, build: Callable[[], object]):
+        """build() once per publication (e.g. decoding the events JSON, only when an endpoint needs it)."""
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = build()
+            return self._derived[name]
+
+
+class SharedStateReader:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.stats = {"reads": 0, "retries": 0}
+        self._mm: Optional[mmap.mmap] = None
+        self._state: Optional[SharedState] = None
+        self._lock = threading.Lock()
+
+    def _map(self) -> Optional[mmap.mmap]:
+        if self._mm is None:
+            try:
+                with open(self.path, "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):    # not created yet / still empty
+                return None
+        return self._mm
+
+    def heartbeat(self) -> Optional[float]:
+        mm = self._map()
+        return None if mm is None else HEARTBEAT.unpack_from(mm, HEARTBEAT_OFFSET)[0]
+
+    def read(self) -> Optional[SharedState]:
+        """Latest consistent state (cached while the writer's seq does not move); None before the first publish."""
+        mm = self._map()
+        if mm is None:
+            return None
+        seq = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+        state = self._state
+        if state is not None and state.seq == seq:
+            return state
+        with self._lock:
+            for _ in range(READ_RETRIES):
+                magic, layout, seq, length, crc, published_at, _, boot = HEADER.unpack_from(mm)
+                if magic != MAGIC or layout != LAYOUT_VERSION or seq == 0:
+                    return None
+                if self._state is not None and self._state.seq == seq:
+                    return self._state
+                if HEADER_SIZE + length > len(mm):
+                    # 寫入端用更大的 size 重建了檔案：重新 map
+                    self._mm.close()
+                    self._mm = None
+                    mm = self._map()
+                    if mm is None:
+                        return None
+                    continue
+                if seq % 2 == 0:
+                    payload = mm[HEADER_SIZE:HEADER_SIZE + length]
+                    if SEQ.unpack_from(mm, SEQ_OFFSET)[0] == seq and zlib.crc32(payload) == crc:
+                        self._state = SharedState(seq, boot.decode("ascii"), published_at, payload)
+                        self.stats["reads"] += 1
+                        return self._state
+                self.stats["retries"] += 1
+                time.sleep(0.0005)
+        raise RuntimeError(f"no consistent read of {self.path} after {READ_RETRIES} tries")
+
+
+class IngestLock:
+    """Exclusive, non-blocking lock file held for the life of the ingest process."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._f = None
+
+    def acquire(self) -> bool:
+        f = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._f = f
+        return True
+
+    def release(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
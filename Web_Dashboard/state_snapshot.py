@@ -0,0 +1,56 @@
+# state_snapshot.py — compact on-disk snapshot of the dashboard's in-memory state
+#
+# One .npz file: the zone registry columns as NumPy arrays plus a JSON "meta" blob (recent events
+# ring, journal seq per (topic, jid), CSV position of the snapshot, timestamps). Written to a temp
+# file and renamed, so a crash mid-write leaves the previous snapshot intact.
+#
+# Restart = load the snapshot (O(zones + ring), independent of the log size) and replay only the
+# CSV rows written after its position (csv_writer.csv_rows_after).
+
+import io
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path: Path, columns: Dict[str, np.ndarray], meta: dict) -> int:
+    """Atomically writes the snapshot; returns its size in bytes."""
+    path = Path(path)
+    meta = {**meta, "version": SNAPSHOT_VERSION, "saved_at": time.time()}
+    buf = io.BytesIO()
+    np.savez_compressed(
+        buf,
+        meta=np.frombuffer(json.dumps(meta, separators=(",", ":")).encode("utf-8"), dtype=np.uint8),
+        **{f"col_{k}": v for k, v in columns.items()},
+    )
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(buf.getbuffer())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return buf.tell()
+
+
+def load_snapshot(path: Path) -> Optional[Tuple[Dict[str, np.ndarray], dict]]:
+    """(columns, meta), or None if there is no usable snapshot."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(z["meta"].tobytes().decode("utf-8"))
+            if meta.get("version") != SNAPSHOT_VERSION:
+                print(f"[STATE] Ignoring snapshot {path}: version {meta.get('version')}")
+                return None
+            columns = {k[len("col_"):]: z[k] for k in z.files if k.startswith("col_")}
+    except Exception as e:
+        print(f"[STATE] Ignoring unreadable snapshot {path}: {e!r}")
+        return None
+    return columns, meta
@@ -0,0 +1,145 @@
+# zone_analytics.py — rolling occupancy, dwell-time histograms and hour-of-day profiles per zone
+#
+# Maintained from ON/OFF transitions only (app.record_event), never by scanning events:
+# - occupancy: ON seconds per time bucket in circular counters at two resolutions
+#   (5 s x 13 slots for the last minute, 30 s x 121 slots for the last hour). A slot is reused when
+#   its ring comes around; `head` (newest bucket written, per row) tells valid slots from stale ones,
+#   so nothing is cleared on a timer. A window query reads at most one ring; the oldest bucket is
+#   weighted by the part of it inside the window (error <= one bucket).
+# - dwell: completed ON periods counted into fixed duration bins (DWELL_EDGES_SEC), plus their total.
+# - hour profile: ON seconds and arrivals (OFF -> ON) per UTC hour of day, cumulative.
+# A closed ON period is spread over the buckets it overlaps when it ends; the period still open is
+# added at query time from on_since, so answers are exact up to "now" without a ticking timer.
+#
+# Rows are ZoneShard rows (~0.6 KB each); every call runs under the shard lock.
+
+from bisect import bisect_right
+from typing import Dict, Tuple
+
+import numpy as np
+
+# ring name -> (bucket seconds, slots); slots = span / bucket + 1 so a window of the full span
+# (which touches span / bucket + 1 buckets when not aligned) never reads a slot twice
+RINGS: Dict[str, Tuple[int, int]] = {
+    "fine": (5, 13),          # last 60 s
+    "coarse": (30, 121),      # last 3600 s
+}
+RING_SCALE = 100              # ring values are centiseconds (uint16: a 30 s bucket is 3000)
+
+# label -> window seconds, as reported by the API
+WINDOWS: Dict[str, int] = {"1m": 60, "15m": 900, "60m": 3600}
+
+# dwell bin i = [edge[i-1], edge[i]) seconds; the last bin is >= the last edge
+DWELL_EDGES_SEC = [1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600]
+DWELL_BINS = len(DWELL_EDGES_SEC) + 1
+
+HOURS = 24
+
+# name -> (dtype, shape after the row axis)
+ARRAYS = {
+    **{f"ring_{name}": (np.uint16, (slots,)) for name, (_, slots) in RINGS.items()},
+    **{f"head_{name}": (np.int64, ()) for name in RINGS},
+    "dwell": (np.int32, (DWELL_BINS,)),
+    "dwell_sum": (np.float64, ()),
+    "hour_on": (np.float64, (HOURS,)),
+    "hour_arrivals": (np.int32, (HOURS,)),
+}
+
+
+def ring_for(window: float) -> str:
+    """Finest ring that covers `window` seconds."""
+    for name, (bucket, slots) in RINGS.items():
+        if window <= bucket * (slots - 1):
+            return name
+    raise ValueError(f"window {window}s is longer than the longest ring")
+
+
+def add_hours(hour_on: np.ndarray, start: float, end: float) -> None:
+    """Adds the seconds of [start, end) to the UTC hour-of-day slots they fall in."""
+    if end <= start:
+        return
+    days = int((end - start) // 86400)
+    if days:
+        hour_on += 3600.0 * days
+        start += 86400.0 * days
+    t = start
+    while t < end:
+        h = t // 3600
+        nxt = (h + 1) * 3600
+        hour_on[int(h) % HOURS] += min(end, nxt) - t
+        t = nxt
+
+
+class ZoneAnalytics:
+    """Analytics columns of one ZoneShard (same row numbers, grown together)."""
+
+    def __init__(self, capacity: int):
+        for name, (dtype, shape) in ARRAYS.items():
+            setattr(self, name, np.full((capacity, *shape), -1 if name.startswith("head_") else 0, dtype=dtype))
+
+    def grow(self, capacity: int) -> None:
+        for name in ARRAYS:
+            old = getattr(self, name)
+            new = np.full((capacity, *old.shape[1:]), -1 if name.startswith("head_") else 0, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    # ---- updates (record_event) ----
+    def arrive(self, r: int, t: float) -> None:
+        """OFF/unknown -> ON at t."""
+        self.hour_arrivals[r, int(t // 3600) % HOURS] += 1
+
+    def close(self, r: int, start: float, end: float) -> None:
+        """An ON period [start, end) ended."""
+        end = max(start, end)       # 晚到的 journal 事件可能讓 OFF 早於 on_since
+        d = end - start
+        self.dwell[r, bisect_right(DWELL_EDGES_SEC, d)] += 1
+        self.dwell_sum[r] += d
+        for name in RINGS:
+            self._spread(name, r, start, end)
+        add_hours(self.hour_on[r], start, end)
+
+    def _spread(self, name: str, r: int, start: float, end: float) -> None:
+        bucket, slots = RINGS[name]
+        ring, head = getattr(self, f"ring_{name}")[r], getattr(self, f"head_{name}")
+        last = int(end // bucket)
+        h = int(head[r])
+        if last > h:
+            # 環往前轉：清掉被跳過的 slot（它們還是上一圈的資料）
+            if last - h >= slots:
+                ring[:] = 0
+            else:
+                for b in range(h + 1, last + 1):
+                    ring[b % slots] = 0
+            head[r] = h = last
+        cap = bucket * RING_SCALE
+        for b in range(max(int(start // bucket), h - slots + 1), last + 1):
+            sec = min(end, (b + 1) * bucket) - max(start, b * bucket)
+            if sec > 0:
+                s = b % slots
+                ring[s] = min(cap, int(ring[s]) + round(sec * RING_SCALE))
+
+    # ---- queries (vectorised over rows) ----
+    def occupied_seconds(self, rows: np.ndarray, window: float, now: float,
+                         on_since: np.ndarray, is_on: np.ndarray) -> np.ndarray:
+        """ON seconds of each row in [now - window, now], the open ON period included."""
+        name = ring_for(window)
+        bucket, slots = RINGS[name]
+        ring, head = getattr(self, f"ring_{name}")[rows], getattr(self, f"head_{name}")[rows]
+        start = now - window
+        b0 = int(start // bucket)
+        bs = np.arange(b0, int(now // bucket) + 1)
+        weight = np.ones(len(bs))
+        weight[0] = ((b0 + 1) * bucket - start) / bucket
+        valid = (bs[None, :] <= head[:, None]) & (bs[None, :] > head[:, None] - slots)
+        closed = (ring[:, bs % slots] * valid * weight).sum(axis=1) / RING_SCALE
+        open_part = np.where(is_on, np.clip(now - np.fmax(on_since, start), 0.0, window), 0.0)
+        return np.minimum(closed + open_part, window)
+
+    def hour_profile(self, rows: np.ndarray, now: float,
+                     on_since: np.ndarray, is_on: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(ON seconds, arrivals) per UTC hour of day for each row, the open ON period included."""
+        hour_on = self.hour_on[rows].copy()
+        for i in np.flatnonzero(is_on).tolist():
+            add_hours(hour_on[i], float(on_since[i]), now)
+        return hour_on, self.hour_arrivals[rows]
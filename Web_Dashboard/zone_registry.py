@@ -0,0 +1,159 @@
+# zone_registry.py — per-(device, zone) runtime state in compact NumPy columns
+#
+# Every camera / edge device publishes its own zones (Edge_Pc multicam: one topic per camera),
+# so zone state is keyed by (device, zone). Rows live in column arrays (last_state, counters,
+# ON-period timestamps ...) instead of one dict per zone: ~60 bytes per zone plus the index entry,
+# and stats over 10k+ zones are a handful of vectorised NumPy calls.
+#
+# Devices are spread over N shards (crc32 of the device name); every shard has its own lock and
+# its own columns, so MQTT callbacks for different devices do not contend. Readers lock one shard
+# at a time; ZoneRegistry.locked() holds them all for a consistent cut (live-update snapshots).
+# Each shard also carries the rolling occupancy / dwell / hour-profile counters of its rows
+# (zone_analytics.py), grown and snapshotted with the columns.
+
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from zone_analytics import ARRAYS as ANALYTICS_ARRAYS, ZoneAnalytics
+
+NO_STATE = -1            # last_state column value for "no event yet"
+DEFAULT_SHARDS = 16
+INITIAL_CAPACITY = 64
+
+# name -> (dtype, initial value); NaN stands for None in the float columns
+COLUMNS = {
+    "device": (np.int32, -1),        # index into ZoneShard.devices
+    "zone": (np.int32, 0),
+    "last_state": (np.int8, NO_STATE),
+    "on": (np.int64, 0),
+    "off": (np.int64, 0),
+    "on_since": (np.float64, np.nan),
+    "hot_counted": (np.bool_, False),
+    "hot_count": (np.int64, 0),
+    "last_hot_at": (np.float64, np.nan),
+}
+
+
+def opt_float(v) -> Optional[float]:
+    v = float(v)
+    return None if np.isnan(v) else v
+
+
+def opt_state(v) -> Optional[int]:
+    v = int(v)
+    return None if v == NO_STATE else v
+
+
+class ZoneShard:
+    """Rows of the devices hashed to this shard. Hold `lock` for every read or write."""
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        # reentrant: stats helpers lock their shards again inside ZoneRegistry.locked()
+        self.lock = threading.RLock()
+        self.size = 0
+        self.rows: Dict[Tuple[str, int], int] = {}      # (device, zone) -> row
+        self.devices: List[str] = []                    # device index -> name
+        self.device_index: Dict[str, int] = {}
+        self.device_rows: Dict[str, List[int]] = {}     # device -> rows, zone order of first event
+        # Highest journal seq applied per (topic, jid) of this shard's devices
+        self.journal_seq: Dict[Tuple[str, str], int] = {}
+        for name, (dtype, init) in COLUMNS.items():
+            setattr(self, name, np.full(capacity, init, dtype=dtype))
+        self.analytics = ZoneAnalytics(capacity)
+
+    def _grow(self):
+        capacity = len(self.zone) * 2
+        for name, (dtype, init) in COLUMNS.items():
+            old = getattr(self, name)
+            new = np.full(capacity, init, dtype=dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self.analytics.grow(capacity)
+
+    def find(self, device: str, zone: int) -> Optional[int]:
+        return self.rows.get((device, zone))
+
+    def row(self, device: str, zone: int) -> int:
+        """Row of (device, zone), created on first use."""
+        r = self.rows.get((device, zone))
+        if r is not None:
+            return r
+        if self.size == len(self.zone):
+            self._grow()
+        d = self.device_index.get(device)
+        if d is None:
+            d = self.device_index[device] = len(self.devices)
+            self.devices.append(device)
+            self.device_rows[device] = []
+        r = self.size
+        self.size += 1
+        self.device[r] = d
+        self.zone[r] = zone
+        self.rows[(device, zone)] = r
+        self.device_rows[device].append(r)
+        return r
+
+    def select(self, device: Optional[str] = None) -> np.ndarray:
+        """Row indexes of one device (or all rows)."""
+        if device is None:
+            return np.arange(self.size)
+        return np.asarray(self.device_rows.get(device, ()), dtype=np.intp)
+
+
+class ZoneRegistry:
+    def __init__(self, shards: int = DEFAULT_SHARDS):
+        self.shards = [ZoneShard() for _ in range(shards)]
+
+    def shard(self, device: str) -> ZoneShard:
+        return self.shards[zlib.crc32(device.encode("utf-8")) % len(self.shards)]
+
+    @contextmanager
+    def locked(self):
+        """Holds every shard lock (always in shard order)."""
+        with ExitStack() as stack:
+            for sh in self.shards:
+                stack.enter_context(sh.lock)
+            yield
+
+    def export_rows(self) -> Dict[str, np.ndarray]:
+        """Every row as flat columns ("device" = device names, analytics as "an_<name>"); call inside locked()."""
+        out = {name: np.concatenate([getattr(sh, name)[:sh.size] for sh in self.shards]) for name in COLUMNS}
+        for name in ANALYTICS_ARRAYS:
+            out[f"an_{name}"] = np.concatenate([getattr(sh.analytics, name)[:sh.size] for sh in self.shards])
+        out["device"] = np.array([sh.devices[d] for sh in self.shards for d in sh.device[:sh.size]], dtype=str)
+        return out
+
+    def load_rows(self, data: Dict[str, np.ndarray]) -> int:
+        """
+        Inverse of export_rows (rows are created or overwritten); returns the number of rows.
+        Analytics arrays missing from older snapshots start empty.
+        """
+        names = [name for name in COLUMNS if name not in ("device", "zone")]
+        analytics = [name for name in ANALYTICS_ARRAYS if f"an_{name}" in data]
+        for i, (device, zone) in enumerate(zip(data["device"].tolist(), data["zone"].tolist())):
+            sh = self.shard(device)
+            with sh.lock:
+                r = sh.row(device, zone)
+                for name in names:
+                    getattr(sh, name)[r] = data[name][i]
+                for name in analytics:
+                    getattr(sh.analytics, name)[r] = data[f"an_{name}"][i]
+        return len(data["zone"])
+
+    def devices(self) -> List[str]:
+        out = []
+        for sh in self.shards:
+            with sh.lock:
+                out.extend(sh.devices)
+        return sorted(out)
+
+    def zone_count(self) -> int:
+        return sum(sh.size for sh in self.shards)
+
+    def nbytes(self) -> int:
+        return sum(getattr(sh, name).nbytes for sh in self.shards for name in COLUMNS) + \
+            sum(getattr(sh.analytics, name).nbytes for sh in self.shards for name in ANALYTICS_ARRAYS)